@@ -0,0 +1,592 @@
+# aggregates.py - CAMADA DE AGREGADOS PRÉ-CALCULADOS
+#
+# Materializa, uma única vez por dataset (após filter_music), contadores
+# densos por mês. Os endpoints somam fatias destes arrays em vez de
+# voltar a percorrer as linhas do DataFrame.
+#
+# - Período = mês do calendário (ano*12 + mês - 1), indexado a partir do 1º mês
+# - Filtros year/month do dashboard = máscara booleana sobre os períodos
+
+import os
+import numpy as np
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+# CONSTANTES
+# ============================================================================
+
+HOURS_PER_DAY = 24
+DAYS_PER_WEEK = 7
+CLOCK_CELLS = DAYS_PER_WEEK * HOURS_PER_DAY  # 168 células (dia x hora)
+
+WEEKDAY_LABELS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+MS_PER_HOUR = 1000 * 60 * 60
+NS_PER_DAY = 24 * 60 * 60 * 10**9
+
+# Entidades agregadas: tipo -> (coluna de origem, aplicar strip)
+# Mesmas chaves que top_tracks/top_artists/top_albums em data_processing
+ENTITY_COLUMNS = {
+    'track': ('track_key', False),
+    'artist': ('master_metadata_album_artist_name', True),
+    'album': ('master_metadata_album_album_name', True),
+}
+
+# Número de movers (subidas/descidas) devolvidos por comparação
+COMPARISON_MOVERS = 5
+
+# "Forgotten favourites": sem plays há pelo menos X dias (vs último play do dataset)
+FORGOTTEN_AFTER_DAYS = 180
+
+# Rankings por taxa (skip rate / completion) só com entidades com plays suficientes
+MIN_PLAYS_FOR_RATES = 10
+
+# "Most skipped despite high plays": candidatos = top X por plays
+HIGH_PLAYS_POOL = 100
+
+# Modos de ordenação dos top lists
+SORT_MODES = ('plays', 'skip_rate', 'completion', 'most_skipped')
+
+# Métricas de volume dos top lists -> medida agregada por par (mês, entidade)
+METRICS = {
+    'plays': 'plays',
+    'hours': 'ms_played',
+    'days': 'days',                 # dias únicos com plays
+    'intentional': 'intentional',   # plays INTENTIONAL (really played)
+}
+
+
+# ============================================================================
+# AGREGADOS POR ENTIDADE (track / artist / album)
+# ============================================================================
+
+class EntityAggregates:
+    """
+    Contadores por (mês, entidade) em formato esparso
+
+    Só guarda os pares que existem (nunca mais pares que linhas).
+    Um vetor por entidade para qualquer filtro = um bincount sobre os pares.
+    """
+
+    def __init__(self, labels, pair_period, pair_entity, measures, first_seen, last_seen):
+        self.labels = labels                # np.array de nomes, indexado por id
+        self.n_entities = len(labels)
+        self.pair_period = pair_period      # mês de cada par
+        self.pair_entity = pair_entity      # id da entidade de cada par
+        self.measures = measures            # nome -> valor por par
+        self.first_seen = first_seen        # datetime64 do 1º play, por id
+        self.last_seen = last_seen          # datetime64 do último play, por id
+
+        # Mês do 1º / último play (derivado dos pares, muito menos que linhas)
+        self.first_period = np.full(self.n_entities, np.iinfo(np.int32).max, dtype=np.int32)
+        self.last_period = np.zeros(self.n_entities, dtype=np.int32)
+        np.minimum.at(self.first_period, pair_entity, pair_period)
+        np.maximum.at(self.last_period, pair_entity, pair_period)
+
+    @classmethod
+    def from_rows(cls, values, row_period, row_ts, row_measures):
+        """Agrupa linhas em pares (mês, entidade) - np.unique sobre chave combinada"""
+        codes, labels = pd.factorize(values)
+        valid = codes >= 0  # NaN fica de fora, como no groupby
+
+        codes = codes[valid].astype(np.int64)
+        period = row_period[valid].astype(np.int64)
+        n_entities = len(labels)
+
+        # Descoberta: 1º e último play por entidade na mesma passagem
+        ts = row_ts[valid]
+        first_seen = np.full(n_entities, np.iinfo(np.int64).max, dtype=np.int64)
+        last_seen = np.full(n_entities, np.iinfo(np.int64).min, dtype=np.int64)
+        np.minimum.at(first_seen, codes, ts)
+        np.maximum.at(last_seen, codes, ts)
+
+        pair_key, inverse = np.unique(period * n_entities + codes, return_inverse=True)
+        n_pairs = len(pair_key)
+
+        measures = {
+            name: np.bincount(inverse, weights=row_values[valid], minlength=n_pairs)
+            for name, row_values in row_measures.items()
+        }
+
+        # Dias únicos por par: um dia pertence a um só mês, por isso é somável entre meses
+        if len(ts):
+            day = ts // NS_PER_DAY
+            day -= day.min()
+            pair_day = np.unique(inverse.astype(np.int64) * (int(day.max()) + 1) + day)
+            measures['days'] = np.bincount(
+                pair_day // (int(day.max()) + 1), minlength=n_pairs
+            ).astype(np.float64)
+        else:
+            measures['days'] = np.zeros(n_pairs, dtype=np.float64)
+
+        return cls(
+            labels=np.asarray(labels, dtype=object),
+            pair_period=(pair_key // max(n_entities, 1)).astype(np.int32),
+            pair_entity=(pair_key % max(n_entities, 1)).astype(np.int32),
+            measures=measures,
+            first_seen=first_seen.view('datetime64[ns]'),
+            last_seen=last_seen.view('datetime64[ns]')
+        )
+
+    def totals(self, mask, measure='plays'):
+        """Vetor denso (1 valor por entidade) somado sobre os meses da máscara"""
+        selected = mask[self.pair_period]
+        return np.bincount(
+            self.pair_entity[selected],
+            weights=self.measures[measure][selected],
+            minlength=self.n_entities
+        )
+
+
+def rank_vector(values):
+    """
+    Posição (1 = mais tocado) de cada entidade; 0 = sem plays no período
+
+    Empates desempatados pela ordem do id (estável), como nlargest
+    """
+    order = np.argsort(-values, kind='stable')
+    ranks = np.empty(len(values), dtype=np.int64)
+    ranks[order] = np.arange(1, len(values) + 1)
+    ranks[values <= 0] = 0
+    return ranks
+
+
+# ============================================================================
+# AGREGADOS POR DATASET
+# ============================================================================
+
+class DatasetAggregates:
+    """
+    Agregados densos de um DataFrame já filtrado por filter_music
+
+    Construído uma vez por dataset e reutilizado por todos os pedidos.
+    Cada pedido com filtros year/month só soma os meses selecionados.
+    """
+
+    def __init__(self, df):
+        self.n_rows = len(df)
+        self.version = None  # Versão do dataset de origem (definida por quem constrói)
+
+        if df.empty:
+            self.first_period = 0
+            self.n_periods = 0
+            self.period_years = np.zeros(0, dtype=np.int32)
+            self.period_months = np.zeros(0, dtype=np.int32)
+            self.row_period = np.zeros(0, dtype=np.int32)
+            self.clock_plays = np.zeros((0, DAYS_PER_WEEK, HOURS_PER_DAY), dtype=np.int64)
+            self.clock_ms = np.zeros((0, DAYS_PER_WEEK, HOURS_PER_DAY), dtype=np.float64)
+            self.entities = {}
+            self.last_played = None
+            self.first_day = 0
+            self.daily_plays = np.zeros(0, dtype=np.int64)
+            self.entity_uris = {}
+            self._vector_cache = {}
+            return
+
+        # Índice de período (mês) por linha - colunas já derivadas em filter_music
+        years = df['year'].to_numpy(dtype=np.int32)
+        months = df['month'].to_numpy(dtype=np.int32)
+        absolute_period = years * 12 + (months - 1)
+
+        self.first_period = int(absolute_period.min())
+        self.row_period = (absolute_period - self.first_period).astype(np.int32)
+        self.n_periods = int(self.row_period.max()) + 1
+
+        period_ids = np.arange(self.n_periods, dtype=np.int32) + self.first_period
+        self.period_years = period_ids // 12
+        self.period_months = period_ids % 12 + 1
+
+        self.last_played = df['ts'].max()
+
+        self._build_listening_clock(df)
+        self._build_daily(df)
+        self._build_entities(df)
+        self._build_entity_uris(df)
+
+        # Vetores por (entidade, filtro) e comparações já calculadas
+        self._vector_cache = {}
+
+        # Ordens por métrica da vista sem filtros (a mais pedida) calculadas já
+        for kind in self.entities:
+            for metric in METRICS:
+                self.rank_order(kind, metric=metric)
+
+        logger.info(f"🧮 Agregados construídos: {self.n_rows:,} plays em {self.n_periods} meses")
+
+    # ------------------------------------------------------------------------
+    # Construção
+    # ------------------------------------------------------------------------
+
+    def _build_listening_clock(self, df):
+        """Matriz mês x dia da semana x hora com um único np.bincount"""
+        day_of_week = df['day_of_week'].to_numpy(dtype=np.int64)
+        hour = df['hour'].to_numpy(dtype=np.int64)
+
+        # Chave combinada: (período, dia, hora) -> índice plano
+        key = self.row_period.astype(np.int64) * CLOCK_CELLS + day_of_week * HOURS_PER_DAY + hour
+        size = self.n_periods * CLOCK_CELLS
+        shape = (self.n_periods, DAYS_PER_WEEK, HOURS_PER_DAY)
+
+        self.clock_plays = np.bincount(key, minlength=size).reshape(shape)
+        self.clock_ms = np.bincount(
+            key, weights=df['ms_played'].to_numpy(dtype=np.float64), minlength=size
+        ).reshape(shape)
+
+    def _build_daily(self, df):
+        """Plays por dia (dias desde 1970-01-01, a partir do 1º dia com plays)"""
+        days = df['ts'].to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64)
+        self.first_day = int(days.min())
+        self.daily_plays = np.bincount(days - self.first_day)
+
+    def _build_entities(self, df):
+        """Pares (mês, entidade) com plays, ms_played, skips, completion, intentional e dias"""
+        row_measures = {
+            'plays': np.ones(self.n_rows, dtype=np.float64),
+            'ms_played': df['ms_played'].to_numpy(dtype=np.float64),
+            # Skips e completion (soma de play_percentage) - colunas de filter_music
+            'skips': df['is_skip'].astype(bool).to_numpy(dtype=np.float64),
+            'completion': df['play_percentage'].clip(upper=1.0).to_numpy(dtype=np.float64),
+            'intentional': (df['play_type'] == 'INTENTIONAL').to_numpy(dtype=np.float64),
+        }
+
+        row_ts = df['ts'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+        self.entities = {}
+        for kind, (column, strip) in ENTITY_COLUMNS.items():
+            values = df[column].str.strip() if strip else df[column]
+            self.entities[kind] = EntityAggregates.from_rows(
+                values.to_numpy(), self.row_period, row_ts, row_measures
+            )
+
+    def _build_entity_uris(self, df):
+        """
+        URI da track mais tocada de cada entidade
+
+        Para tracks é o próprio URI (a mesma música pode ter várias edições);
+        para artistas/álbuns serve de ponto de partida para obter o ID deles.
+        """
+        uri_codes, uri_labels = pd.factorize(df['spotify_track_uri'])
+        uri_labels = np.asarray(uri_labels, dtype=object)
+        n_uris = len(uri_labels)
+
+        self.entity_uris = {}
+        for kind, (column, strip) in ENTITY_COLUMNS.items():
+            labels = self.entities[kind].labels
+            entity_uris = np.full(len(labels), '', dtype=object)
+            self.entity_uris[kind] = entity_uris
+
+            values = df[column].str.strip() if strip else df[column]
+            codes = pd.Index(labels).get_indexer(values)
+            valid = (codes >= 0) & (uri_codes >= 0)
+            if not valid.any():
+                continue
+
+            pairs, counts = np.unique(
+                codes[valid].astype(np.int64) * n_uris + uri_codes[valid], return_counts=True
+            )
+            entity_ids, uris = pairs // n_uris, pairs % n_uris
+
+            # Por entidade, o par com mais plays (lexsort: entidade asc, contagem desc)
+            order = np.lexsort((-counts, entity_ids))
+            first = order[np.r_[True, entity_ids[order][1:] != entity_ids[order][:-1]]]
+            entity_uris[entity_ids[first]] = uri_labels[uris[first]]
+
+    # ------------------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------------------
+
+    def uri_index(self, kind='track'):
+        """{nome: spotify_track_uri da track mais tocada} para lookups por ID em vez de pesquisa"""
+        cache_key = ('uri_index', kind)
+        if cache_key not in self._vector_cache:
+            labels = self.entities[kind].labels if kind in self.entities else []
+            uris = self.entity_uris.get(kind, [])
+            self._vector_cache[cache_key] = {key: uri for key, uri in zip(labels, uris) if uri}
+        return self._vector_cache[cache_key]
+
+    def period_mask(self, year_filter=None, month_filter=None):
+        """Máscara booleana sobre os períodos - mesma semântica que apply_filters"""
+        mask = np.ones(self.n_periods, dtype=bool)
+
+        if year_filter and year_filter != 'all':
+            mask &= self.period_years == int(year_filter)
+
+        if month_filter and month_filter != 'all':
+            mask &= self.period_months == int(month_filter)
+
+        return mask
+
+    def listening_clock(self, year_filter=None, month_filter=None):
+        """
+        Relógio de audição (dia da semana x hora) para os filtros dados
+
+        Returns:
+            (plays, ms_played) - dois arrays 7x24
+        """
+        mask = self.period_mask(year_filter, month_filter)
+        plays = self.clock_plays[mask].sum(axis=0)
+        ms_played = self.clock_ms[mask].sum(axis=0)
+        return plays, ms_played
+
+    def entity_vector(self, kind, year_filter=None, month_filter=None, measure='plays'):
+        """Vetor por entidade para um período (cache por tipo + filtro + medida)"""
+        cache_key = (kind, str(year_filter or 'all'), str(month_filter or 'all'), measure)
+        if cache_key not in self._vector_cache:
+            mask = self.period_mask(year_filter, month_filter)
+            self._vector_cache[cache_key] = self.entities[kind].totals(mask, measure)
+        return self._vector_cache[cache_key]
+
+    def rank_order(self, kind, year_filter=None, month_filter=None, metric='plays'):
+        """
+        Ids ordenados pela métrica (desc), desempate por plays; só entidades com valor > 0
+
+        Cache por tipo + filtro + métrica: trocar de métrica não recalcula nada.
+        """
+        cache_key = ('order', kind, str(year_filter or 'all'), str(month_filter or 'all'), metric)
+        if cache_key not in self._vector_cache:
+            values = self.entity_vector(kind, year_filter, month_filter, measure=METRICS[metric])
+            plays = self.entity_vector(kind, year_filter, month_filter)
+            ids = np.flatnonzero(values > 0)
+            # lexsort: última chave = primária; estável -> empates pela ordem do id
+            self._vector_cache[cache_key] = ids[np.lexsort((-plays[ids], -values[ids]))]
+        return self._vector_cache[cache_key]
+
+    def top_entities(self, kind, year_filter=None, month_filter=None, n=10, sort='plays', metric='plays'):
+        """
+        Top N de um tipo para os filtros dados
+
+        Args:
+            sort: 'plays' | 'skip_rate' | 'completion' | 'most_skipped'
+                  (most_skipped = maior skip rate entre os HIGH_PLAYS_POOL mais tocados)
+            metric: 'plays' | 'hours' | 'days' | 'intentional' - volume usado com sort='plays'
+
+        Returns:
+            [dict] com key, plays, ms_played, days, intentional, skips, skip_rate, avg_completion
+        """
+        if sort not in SORT_MODES:
+            raise ValueError(f"Invalid sort mode: {sort}")
+        if metric not in METRICS:
+            raise ValueError(f"Invalid metric: {metric}")
+
+        labels = self.entities[kind].labels if kind in self.entities else []
+        if len(labels) == 0:
+            return []
+
+        vector = lambda measure: self.entity_vector(kind, year_filter, month_filter, measure=measure)
+        plays = vector('plays')
+        skips = vector('skips')
+        completion = vector('completion')
+
+        # Taxas só onde há plays (evita 0/0)
+        safe_plays = np.maximum(plays, 1)
+        skip_rate = skips / safe_plays
+        avg_completion = completion / safe_plays
+
+        if sort == 'plays':
+            ids = self.rank_order(kind, year_filter, month_filter, metric)[:n]
+        else:
+            if sort == 'most_skipped':
+                pool = self.rank_order(kind, year_filter, month_filter, 'plays')[:HIGH_PLAYS_POOL]
+                candidates = pool[plays[pool] >= MIN_PLAYS_FOR_RATES]
+            else:
+                candidates = np.flatnonzero(plays >= MIN_PLAYS_FOR_RATES)
+            score = avg_completion if sort == 'completion' else skip_rate
+            # Taxa desc, desempate por plays desc (lexsort: última chave = primária)
+            ids = candidates[np.lexsort((-plays[candidates], -score[candidates]))][:n]
+
+        ms_played = vector('ms_played')
+        days = vector('days')
+        intentional = vector('intentional')
+
+        return [
+            {
+                'key': labels[i],
+                'plays': int(plays[i]),
+                'ms_played': float(ms_played[i]),
+                'days': int(days[i]),
+                'intentional': int(intentional[i]),
+                'skips': int(skips[i]),
+                'skip_rate': round(float(skip_rate[i]), 4),
+                'avg_completion': round(float(avg_completion[i]), 4)
+            }
+            for i in ids
+        ]
+
+    def daily_history(self, year_filter=None, month_filter=None):
+        """
+        Plays por dia para os filtros dados - mesmo resultado que daily_history()
+
+        Do primeiro ao último dia com plays; dias fora do filtro/sem plays = 0
+
+        Returns:
+            (datas datetime64[D], plays)
+        """
+        days = (np.arange(len(self.daily_plays)) + self.first_day).astype('datetime64[D]')
+        plays = self.daily_plays.copy()
+
+        if (year_filter and year_filter != 'all') or (month_filter and month_filter != 'all'):
+            months = days.astype('datetime64[M]').astype(np.int64)  # meses desde 1970-01
+            mask = np.ones(len(days), dtype=bool)
+            if year_filter and year_filter != 'all':
+                mask &= months // 12 + 1970 == int(year_filter)
+            if month_filter and month_filter != 'all':
+                mask &= months % 12 + 1 == int(month_filter)
+            plays[~mask] = 0
+
+        active = np.flatnonzero(plays)
+        if len(active) == 0:
+            return days[:0], plays[:0]
+
+        window = slice(active[0], active[-1] + 1)
+        return days[window], plays[window]
+
+    def available_years(self):
+        """Anos com pelo menos um play"""
+        has_plays = self.clock_plays.sum(axis=(1, 2)) > 0
+        return sorted(set(self.period_years[has_plays].tolist()))
+
+    def compare_periods(self, kind, period_a, period_b, n=10):
+        """
+        Compara dois períodos (ex: 2024 vs 2023) para track/artist/album
+
+        Os dois vetores estão alinhados por id de entidade, por isso as
+        diferenças de posição saem de uma única operação vectorizada.
+
+        Args:
+            kind: 'track', 'artist' ou 'album'
+            period_a: (year, month) do período atual
+            period_b: (year, month) do período de referência
+            n: tamanho do chart
+
+        Returns:
+            dict com chart, new_entries, drop_outs, climbers e fallers
+        """
+        cache_key = ('compare', kind, tuple(map(str, period_a)), tuple(map(str, period_b)), n)
+        if cache_key in self._vector_cache:
+            return self._vector_cache[cache_key]
+
+        labels = self.entities[kind].labels
+        plays_a = self.entity_vector(kind, *period_a)
+        plays_b = self.entity_vector(kind, *period_b)
+
+        rank_a = rank_vector(plays_a)
+        rank_b = rank_vector(plays_b)
+
+        # Positivo = subiu no chart (ex: 5º -> 2º = +3)
+        rank_change = rank_b - rank_a
+
+        in_chart_a = (rank_a > 0) & (rank_a <= n)
+        in_chart_b = (rank_b > 0) & (rank_b <= n)
+
+        chart_ids = np.flatnonzero(in_chart_a)
+        chart_ids = chart_ids[np.argsort(rank_a[chart_ids])]
+
+        dropped_ids = np.flatnonzero(in_chart_b & ~in_chart_a)
+        dropped_ids = dropped_ids[np.argsort(rank_b[dropped_ids])]
+
+        # Movers: só entidades com posição nos dois períodos
+        ranked_both = (rank_a > 0) & (rank_b > 0)
+        climber_ids = np.flatnonzero(in_chart_a & ranked_both & (rank_change > 0))
+        climber_ids = climber_ids[np.argsort(-rank_change[climber_ids], kind='stable')][:COMPARISON_MOVERS]
+        faller_ids = np.flatnonzero(in_chart_b & ranked_both & (rank_change < 0))
+        faller_ids = faller_ids[np.argsort(rank_change[faller_ids], kind='stable')][:COMPARISON_MOVERS]
+
+        def rows(ids):
+            return [
+                {
+                    'key': labels[i],
+                    'rank': int(rank_a[i]),
+                    'previous_rank': int(rank_b[i]),
+                    'rank_change': int(rank_change[i]) if rank_a[i] and rank_b[i] else None,
+                    'plays': int(plays_a[i]),
+                    'previous_plays': int(plays_b[i]),
+                    'is_new': bool(in_chart_a[i] and not in_chart_b[i])
+                }
+                for i in ids
+            ]
+
+        result = {
+            'chart': rows(chart_ids),
+            'new_entries': rows(chart_ids[~in_chart_b[chart_ids]]),
+            'drop_outs': rows(dropped_ids),
+            'climbers': rows(climber_ids),
+            'fallers': rows(faller_ids),
+        }
+
+        self._vector_cache[cache_key] = result
+        return result
+
+    def period_label(self, period):
+        """Índice de período -> 'YYYY-MM'"""
+        return f"{self.period_years[period]}-{self.period_months[period]:02d}"
+
+    def discoveries_per_month(self, kind):
+        """Número de entidades novas (1º play) em cada mês do dataset"""
+        counts = np.bincount(self.entities[kind].first_period, minlength=self.n_periods)
+        return [
+            {'month': self.period_label(p), 'new': int(counts[p])}
+            for p in range(self.n_periods)
+        ]
+
+    def discoveries(self, kind, year_filter=None, month_filter=None, n=10):
+        """Entidades descobertas no período, ordenadas por plays nesse período"""
+        entity = self.entities[kind]
+        mask = self.period_mask(year_filter, month_filter)
+        plays = self.entity_vector(kind, year_filter, month_filter)
+
+        ids = np.flatnonzero(mask[entity.first_period])
+        ids = ids[np.argsort(-plays[ids], kind='stable')][:n]
+
+        return [
+            {
+                'key': entity.labels[i],
+                'first_seen': str(entity.first_seen[i].astype('datetime64[D]')),
+                'plays': int(plays[i])
+            }
+            for i in ids
+        ]
+
+    def forgotten_favourites(self, kind, n=10, min_gap_days=FORGOTTEN_AFTER_DAYS):
+        """Mais tocados de sempre que não voltaram a tocar há min_gap_days"""
+        entity = self.entities[kind]
+        if self.last_played is None:
+            return []
+
+        total_plays = self.entity_vector(kind)
+        cutoff = np.datetime64(self.last_played - pd.Timedelta(days=min_gap_days), 'ns')
+
+        ids = np.flatnonzero(entity.last_seen < cutoff)
+        ids = ids[np.argsort(-total_plays[ids], kind='stable')][:n]
+
+        return [
+            {
+                'key': entity.labels[i],
+                'first_seen': str(entity.first_seen[i].astype('datetime64[D]')),
+                'last_seen': str(entity.last_seen[i].astype('datetime64[D]')),
+                'plays': int(total_plays[i])
+            }
+            for i in ids
+        ]
+
+
+def build_aggregates(df):
+    """Constrói os agregados de um DataFrame filtrado"""
+    return DatasetAggregates(df)
+
+
+def file_version(path):
+    """
+    Versão de um ficheiro de dados (mtime_ns + tamanho); None se não existir
+
+    Única função de versão do dataset: DatasetAggregates.version, segmentos
+    partilhados, ETags e source_version dos resumos globais usam esta.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
@@ -1,5 +1,7 @@
-from flask import Flask, render_template, jsonify, request, session, redirect, url_for
+from flask import Flask, render_template, jsonify, request, session, redirect, url_for, send_file, make_response, g, has_request_context
 import os
+import re
+import functools
 import spotipy
 from werkzeug.utils import secure_filename
 import uuid
@@ -12,9 +14,13 @@ from datetime import datetime, timedelta
 import pandas as pd
 import json
 import hashlib
-from spotify_api import SpotifyEnhancer
+import time
+from urllib.parse import urlparse
+from spotify_api import SpotifyEnhancer, BATCH_SIZES
+import data_processing
 from data_processing import (
     load_streaming_history, 
+    longest_daily_streaks,
     filter_music,
     top_tracks,
     top_artists, 
@@ -23,26 +29,91 @@ from data_processing import (
     repeat_spirals_optimized,
     viciado_tracks_top20,
     set_spotify_enhancer,
+    set_metadata_resolver,
     get_spotify_enhancer,
     enrich_with_spotify_metadata_fast
 )
+from aggregates import build_aggregates, file_version, WEEKDAY_LABELS, MS_PER_HOUR, SORT_MODES, METRICS
+from sketches import build_sketch_from_files, SKETCH_FILENAME
+from enrichment import enrich_unique, get_rate_limiter, get_single_flight
+from resilience import get_spotify_breaker, get_http_session, use_api_endpoints
+from user_clients import UserClientRegistry
+from image_cache import ImageCache, ImageUnavailable, SPOTIFY_IMAGE_HOSTS, proxied_url, valid_signature
+from responses import init_response_pipeline, column_records, series_pairs, top_counts
+from shared_store import SharedDatasetStore
+from metadata_cache import (
+    get_metadata_store,
+    track_cache_key,
+    uri_cache_key,
+    artist_cache_key,
+    album_cache_key,
+    MISS
+)
+from global_charts import (
+    build_user_summary,
+    update_user_contribution,
+    remove_user_contribution,
+    load_global_index,
+    global_index_exists,
+    global_top,
+    global_daily
+)
 from config import Config
 
 spotify_enhancer_instance = None
+spotify_enhancer_pid = None  # Processo que criou a instância
+spotify_probe_pid = None     # Processo onde o health probe já arrancou
 
-def init_spotify_enhancer():
-    """Inicializa SpotifyEnhancer com credenciais do Config"""
-    global spotify_enhancer_instance
-    if spotify_enhancer_instance is None:
+def init_spotify_enhancer(probe=True):
+    """
+    Inicializa SpotifyEnhancer com credenciais do Config (1 por processo)
+    
+    Com preload_app o módulo é importado no master: lá o enhancer é criado
+    sem probe (probe=False, nenhum socket aberto antes do fork). Cada worker
+    recria-o no post_fork (pid diferente), com sessões HTTP e probe próprios.
+    """
+    global spotify_enhancer_instance, spotify_enhancer_pid, spotify_probe_pid
+    if spotify_enhancer_instance is None or spotify_enhancer_pid != os.getpid():
         spotify_enhancer_instance = SpotifyEnhancer(
             client_id=Config.SPOTIFY_CLIENT_ID,
-            client_secret=Config.SPOTIFY_CLIENT_SECRET
+            client_secret=Config.SPOTIFY_CLIENT_SECRET,
+            token_cache_path=Config.SPOTIFY_APP_TOKEN_CACHE
         )
+        spotify_enhancer_pid = os.getpid()
         # Passar instância para data_processing
         set_spotify_enhancer(spotify_enhancer_instance)
-        print(f"✅ SpotifyEnhancer inicializado (api_available={spotify_enhancer_instance.api_available})")
+        print(f"✅ SpotifyEnhancer inicializado (health={spotify_enhancer_instance.health['status']})")
+    
+    if probe and spotify_probe_pid != os.getpid():
+        # Sem rede no boot: o token é validado em background
+        spotify_enhancer_instance.start_health_probe()
+        spotify_probe_pid = os.getpid()
     return spotify_enhancer_instance
 
+image_cache_instance = None
+
+def get_image_cache():
+    """Cache de capas do processo (hosts do Spotify + SPOTIFY_API_URL, se definido)"""
+    global image_cache_instance
+    if image_cache_instance is None:
+        hosts = set(SPOTIFY_IMAGE_HOSTS)
+        if Config.SPOTIFY_API_URL:
+            hosts.add(urlparse(Config.SPOTIFY_API_URL).netloc)
+        image_cache_instance = ImageCache(Config.IMAGE_CACHE_DIR, allowed_hosts=hosts,
+                                          max_bytes=Config.IMAGE_CACHE_MAX_BYTES)
+    return image_cache_instance
+
+def set_image_cache(cache):
+    """Substitui a cache de capas (p.ex. com um fetcher de teste)"""
+    global image_cache_instance
+    image_cache_instance = cache
+
+def thumbnail_url(url, size=None):
+    """image_url do Spotify -> /api/image (miniatura servida do disco); outros URLs passam"""
+    if not Config.IMAGE_PROXY_ENABLED or not url or not get_image_cache().allowed(url):
+        return url
+    return proxied_url(url, size or Config.IMAGE_THUMB_SIZE, app.secret_key)
+
 USERS_DB_FILE = os.path.join(Config.UPLOAD_FOLDER, 'users_db.json')
 
 def load_users_db():
@@ -91,8 +162,11 @@ app = Flask(__name__)
 app.config.from_object(Config)
 app.secret_key = Config.SECRET_KEY
 
+# orjson (se instalado) + gzip/brotli acima de COMPRESS_MIN_SIZE
+init_response_pipeline(app, Config.COMPRESS_MIN_SIZE)
+
 with app.app_context():
-    init_spotify_enhancer()
+    init_spotify_enhancer(probe=False)  # Probe: post_fork (gunicorn) ou __main__
 
 # Ã¢Å“â€¦ ADICIONAR configuraÃƒÂ§ÃƒÂ£o de sessÃƒÂ£o:
 from datetime import timedelta
@@ -192,10 +266,17 @@ def load_user_data_from_files(user_folder):
 
 
 
-def get_spotify_client():
-    """Spotify client with all required scopes"""
-    scope = 'user-top-read playlist-modify-public playlist-modify-private streaming user-read-private user-modify-playback-state user-read-playback-state'
-    
+SPOTIFY_USER_SCOPE = 'user-top-read playlist-modify-public playlist-modify-private streaming user-read-private user-modify-playback-state user-read-playback-state'
+
+# Clientes OAuth prontos por utilizador (token em memória + refresh proativo)
+user_client_registry = UserClientRegistry(
+    refresh_margin=Config.OAUTH_REFRESH_MARGIN,
+    idle_ttl=Config.OAUTH_CLIENT_IDLE_TTL
+)
+
+
+def get_spotify_cache_path():
+    """Ficheiro de token OAuth do utilizador atual"""
     # ✅ SEMPRE usa user_id se existir (remove validação files_uploaded)
     if 'user_id' in session:
         cache_path = os.path.join(
@@ -204,36 +285,67 @@ def get_spotify_client():
             '.spotify_cache'
         )
         os.makedirs(os.path.dirname(cache_path), exist_ok=True)
-    else:
-        cache_path = '.cache-default'
-    
-    try:
-        redirect_uri = Config.REDIRECT_URI
-        
-        auth_manager = SpotifyOAuth(
+        return cache_path
+    return '.cache-default'
+
+
+def get_spotify_client():
+    """Spotify client with all required scopes (reutilizado do registo por utilizador)"""
+    def make_oauth(cache_handler):
+        return use_api_endpoints(SpotifyOAuth(
             client_id=Config.SPOTIFY_CLIENT_ID,
             client_secret=Config.SPOTIFY_CLIENT_SECRET,
-            redirect_uri=redirect_uri,
-            scope=scope,
-            cache_path=cache_path
-        )
+            redirect_uri=Config.REDIRECT_URI,
+            scope=SPOTIFY_USER_SCOPE,
+            cache_handler=cache_handler,
+            requests_session=get_http_session()
+        ))
+    
+    try:
+        return user_client_registry.get(get_spotify_cache_path(), make_oauth)
+    except Exception as e:
+        print(f"Ã¢ÂÅ’ Authentication error: {e}")
+        return None
+    
+LAST_ACTIVE_FILENAME = '.last_active'
 
+# Um segmento por utilizador partilhado pelos workers deste host (None = desligado)
+shared_store = (
+    SharedDatasetStore(Config.SHARED_STORE_DIR, Config.SHARED_STORE_IDLE_TTL)
+    if Config.SHARED_STORE_ENABLED else None
+)
 
 
-        
-        token_info = auth_manager.get_cached_token()
-        if not token_info:
-            return None
-        
-        if auth_manager.is_token_expired(token_info):
-            token_info = auth_manager.refresh_access_token(token_info['refresh_token'])
-        
-        return spotipy.Spotify(auth=token_info['access_token'])
-        
-    except Exception as e:
-        print(f"Ã¢ÂÅ’ Authentication error: {e}")
-        return None
+def load_shared_dataset(user_id, cache_file, build=None):
+    """
+    DataFrame do utilizador via segmento partilhado (versão = mtime/tamanho do pickle)
     
+    O 1º worker a pedir lê o pickle e publica; os restantes mapeiam o mesmo
+    segmento. Sem store (ou se falhar) é só build().
+    """
+    build = build or (lambda: pd.read_pickle(cache_file))
+    if shared_store is None:
+        return build()
+    
+    try:
+        return shared_store.load(user_id, file_version(cache_file), build)
+    except Exception as e:
+        print(f"⚠️ Shared dataset store unavailable: {e}")
+        return build()
+
+
+def mark_user_active(user_folder):
+    """Marca o utilizador como ativo (1x por processo e dataset; lido pelo warm-up)"""
+    if g.get('warmup'):
+        return  # O próprio warm-up não conta como atividade
+    try:
+        with open(os.path.join(user_folder, LAST_ACTIVE_FILENAME), 'a'):
+            pass
+        os.utime(os.path.join(user_folder, LAST_ACTIVE_FILENAME))
+    except OSError:
+        pass
+
+
 def load_local_data():
     """Load data ISOLADO por utilizador OU de path local"""
     if 'user_id' in session:
@@ -259,11 +371,14 @@ def load_local_data():
                 session['files_uploaded'] = True  # ✅ Atualizar sessão
                 
                 cache_key = f'df_music_{session["user_id"]}'
+                cache_file = os.path.join(user_folder, 'processed_data.pkl')
+                # Novo upload (pickle apagado ou reescrito): a cópia em memória deixa de valer
+                if app_cache.get(f'{cache_key}_version') != file_version(cache_file):
+                    app_cache.pop(cache_key, None)
+                
                 if cache_key not in app_cache:
                     try:
                         # Verificar cache em disco
-                        cache_file = os.path.join(user_folder, 'processed_data.pkl')
-                        
                         if os.path.exists(cache_file):
                             print(f"📁 Loading cached data for user {session['user_id'][:8]}...")
                             # ✅ ADICIONAR debug
@@ -271,8 +386,10 @@ def load_local_data():
                             print(f"📁 File size: {os.path.getsize(cache_file):,} bytes")
                             print(f"📁 File modified: {datetime.fromtimestamp(os.path.getmtime(cache_file))}")
                             
-                            df_music = pd.read_pickle(cache_file)
+                            df_music = load_shared_dataset(session['user_id'], cache_file)
                             app_cache[cache_key] = df_music
+                            app_cache[f'{cache_key}_version'] = file_version(cache_file)
+                            mark_user_active(user_folder)
                             
                             if not df_music.empty:
                                 session['data_loaded'] = True
@@ -287,9 +404,12 @@ def load_local_data():
                         df = load_user_data_from_files(user_folder)
                         df_music = filter_music(df)
                         
-                        # Guardar cache
+                        # Guardar cache (pickle + segmento partilhado com os outros workers)
                         df_music.to_pickle(cache_file)
+                        df_music = load_shared_dataset(session['user_id'], cache_file, build=lambda: df_music)
                         app_cache[cache_key] = df_music
+                        app_cache[f'{cache_key}_version'] = file_version(cache_file)
+                        mark_user_active(user_folder)
                         session['data_loaded'] = True
                         
                         print(f"✅ {len(df_music):,} records processed from uploaded files")
@@ -316,6 +436,11 @@ def load_local_data():
     
     # Development mode (path hardcoded)
     else:
+        # JSON do dev alterados: recarregar (tal como um novo upload em produção)
+        version = dev_dataset_version()
+        if app_cache.get('df_music_default_version') != version:
+            app_cache.pop('df_music_default', None)
+        
         if 'df_music_default' not in app_cache:
             try:
                 print("📁 Loading from hardcoded path (development mode)")
@@ -326,10 +451,196 @@ def load_local_data():
             except Exception as e:
                 print(f"❌ Error: {e}")
                 app_cache['df_music_default'] = pd.DataFrame()
+            app_cache['df_music_default_version'] = version
         
         return app_cache['df_music_default']
 
 
+def get_dataset_cache_key():
+    """Chave do dataset ativo em app_cache (por utilizador ou modo dev)"""
+    if 'user_id' in session:
+        return f'df_music_{session["user_id"]}'
+    return 'df_music_default'
+
+
+# ========== CONDITIONAL GET (ETAG POR VERSÃO DO DATASET) ==========
+
+def code_version():
+    """RELEASE_ID, ou impressão digital de todos os módulos, templates e estáticos servidos"""
+    if Config.RELEASE_ID:
+        return Config.RELEASE_ID
+    root = os.path.dirname(os.path.abspath(__file__))
+    paths = glob.glob(os.path.join(root, '*.py'))
+    for folder in ('templates', 'static'):
+        paths += glob.glob(os.path.join(root, folder, '**', '*'), recursive=True)
+    entries = sorted((os.path.relpath(path, root), file_version(path))
+                     for path in paths if os.path.isfile(path))
+    return hashlib.md5(repr(entries).encode()).hexdigest()
+
+
+# Muda a cada deploy: respostas com formato novo não podem dar 304 com o corpo antigo
+CODE_VERSION = code_version()
+
+DATASET_SUFFIXES = ('.json', '.json.gz', 'processed_data.pkl', SKETCH_FILENAME)
+
+# Respostas que não devem ser revalidadas: erros e metadata ainda por preencher
+_UNCACHEABLE_BODY = re.compile(rb'"success":\s*false|"metadata_pending":\s*true')
+
+
+def mark_metadata_incomplete():
+    """Resposta com metadata em falta por erro/Spotify em baixo: não leva ETag"""
+    if has_request_context():
+        g.metadata_incomplete = True
+
+
+def dev_dataset_version():
+    """Modo dev: impressão digital dos JSON de JSON_FOLDER"""
+    folder = data_processing.JSON_FOLDER
+    files = glob.glob(os.path.join(folder, 'Streaming_History_Audio_*.json')) if folder else []
+    entries = sorted((path, file_version(path)) for path in files)
+    return hashlib.md5(repr(entries).encode()).hexdigest()
+
+
+def dataset_version():
+    """Impressão digital dos ficheiros de dados do utilizador ativo (muda com cada upload)"""
+    if 'user_id' not in session:
+        return dev_dataset_version()
+    try:
+        entries = sorted(
+            (entry.name, entry.stat().st_size, entry.stat().st_mtime_ns)
+            for entry in os.scandir(get_user_folder())
+            if entry.name.endswith(DATASET_SUFFIXES)
+        )
+    except OSError:
+        entries = []
+    return hashlib.md5(repr(entries).encode()).hexdigest()
+
+
+def dataset_etag(view):
+    """
+    ETag = utilizador + versão do dataset + URL completo (filtros, limit)
+    
+    If-None-Match igual -> 304 sem calcular nada (só um stat aos ficheiros).
+    Cache-Control privado e curto: o browser revalida pouco depois.
+    Sem ETag se algum item ficou sem metadata por falha (breaker aberto, erro
+    da API): o próximo pedido volta a tentar em vez de receber 304.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        etag = hashlib.sha1('|'.join([
+            CODE_VERSION,
+            Config.ANALYTICS_MODE,
+            session.get('user_id', ''),
+            dataset_version(),
+            request.full_path
+        ]).encode()).hexdigest()[:32]
+        
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if (response.status_code != 200 or g.get('metadata_incomplete')
+                    or _UNCACHEABLE_BODY.search(response.get_data())):
+                return response
+        
+        response.set_etag(etag, weak=True)  # Igual com ou sem compressão
+        response.headers['Cache-Control'] = f'private, max-age={Config.ANALYTICS_CACHE_MAX_AGE}'
+        response.vary.add('Cookie')
+        return response
+    return wrapper
+
+
+def processed_data_version():
+    """Versão do dataset ativo: pickle processado do utilizador (JSON de JSON_FOLDER em modo dev)"""
+    if 'user_id' not in session:
+        return dev_dataset_version()
+    return file_version(os.path.join(get_user_folder(), 'processed_data.pkl'))
+
+
+def load_local_aggregates(df_music=None):
+    """Agregados pré-calculados do dataset ativo (construídos 1x por versão do dataset)"""
+    cache_key = f'{get_dataset_cache_key()}_aggregates'
+    aggregates = app_cache.get(cache_key)
+    
+    # Agregados da versão atual em memória: nem é preciso tocar no DataFrame
+    if df_music is None:
+        if aggregates is not None and aggregates.version is not None \
+                and aggregates.version == processed_data_version():
+            return aggregates
+        df_music = load_local_data()
+    version = processed_data_version()  # O load pode ter acabado de escrever o pickle
+    
+    if aggregates is None or aggregates.version != version or aggregates.n_rows != len(df_music):
+        aggregates = build_aggregates(df_music)
+        aggregates.version = version
+        app_cache[cache_key] = aggregates
+        publish_global_summary(aggregates)
+    
+    return aggregates
+
+
+def publish_global_summary(aggregates):
+    """Envia o resumo do utilizador para os charts globais (só se os dados mudaram)"""
+    if 'user_id' not in session or aggregates.n_rows == 0:
+        return
+    
+    try:
+        summary = build_user_summary(aggregates, processed_data_version())
+        update_user_contribution(Config.UPLOAD_FOLDER, session['user_id'], summary)
+    except Exception as e:
+        print(f"⚠️ Global charts update failed: {e}")
+
+
+def sketch_mode_enabled():
+    """Modo aproximado ativo (só para utilizadores com upload)"""
+    return Config.ANALYTICS_MODE == 'sketch' and 'user_id' in session
+
+
+def load_local_sketch():
+    """Sketch aproximado do utilizador (disco -> RAM), reconstruído se houver uploads novos"""
+    cache_key = f'{get_dataset_cache_key()}_sketch'
+    user_folder = get_user_folder()
+    json_files = sorted(os.path.join(user_folder, f) for f in os.listdir(user_folder)
+                        if f.endswith('.json') or f.endswith('.json.gz'))
+    
+    # Versão dos uploads (mtime/tamanho de cada ficheiro): novo upload -> sketch novo
+    version = '|'.join(f'{os.path.basename(f)}:{file_version(f)}' for f in json_files)
+    cached = app_cache.get(cache_key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    
+    sketch_file = os.path.join(user_folder, SKETCH_FILENAME)
+    newest_upload = max((os.path.getmtime(f) for f in json_files), default=0)
+    if os.path.exists(sketch_file) and os.path.getmtime(sketch_file) >= newest_upload:
+        sketch = pd.read_pickle(sketch_file)
+    else:
+        print(f"📐 Building listening sketch for user {session['user_id'][:8]}...")
+        sketch = build_sketch_from_files(user_folder)
+        pd.to_pickle(sketch, sketch_file)
+    
+    app_cache[cache_key] = (version, sketch)
+    return sketch
+
+
+def sketch_top_list(kind, limit):
+    """Top all-time aproximado do sketch (tracks ou artistas), no formato das top lists"""
+    if kind == 'track':
+        return [
+            {'track_key': track_key, 'plays': plays, 'max_error': error, 'approximate': True}
+            for track_key, plays, error in load_local_sketch().top('track', limit)
+        ]
+    return [
+        {'artist_key': artist_key, 'enhanced_name': artist_key, 'plays': plays,
+         'max_error': error, 'approximate': True}
+        for artist_key, plays, error in load_local_sketch().top('artist', limit)
+    ]
+
+
+def sketch_serves_top(sort, metric, year_filter, month_filter):
+    """O sketch só sabe o top all-time por plays; o resto vem dos agregados"""
+    return (sketch_mode_enabled() and sort == 'plays' and metric == 'plays'
+            and year_filter == 'all' and month_filter == 'all')
+
 
 def get_top_tracks_api_with_images(time_range, limit=50):
     """Get top tracks from Spotify API with images and IDs"""
@@ -352,7 +663,7 @@ def get_top_tracks_api_with_images(time_range, limit=50):
                     'uri': track['uri'],
                     'artist': track['artists'][0]['name'],
                     'album': track['album']['name'],
-                    'image_url': image_url,
+                    'image_url': thumbnail_url(image_url),
                     'spotify_url': track['external_urls']['spotify'],
                     'popularity': track['popularity'],
                     'preview_url': track['preview_url'],
@@ -367,42 +678,17 @@ def get_top_tracks_api_with_images(time_range, limit=50):
     return []
 
 def search_track_get_id(track_name, artist_name):
-    """Buscar track metadata usando SpotifyEnhancer (CLIENT CREDENTIALS GLOBAL)"""
+    """Buscar track metadata usando SpotifyEnhancer (CLIENT CREDENTIALS GLOBAL), com cache persistente"""
     enhancer = get_spotify_enhancer()
     if not enhancer or not enhancer.api_available:
         print(f"❌ SpotifyEnhancer not available")
         return None
     
     try:
-        # Usar SpotifyEnhancer com Client Credentials
-        query = f'track:"{track_name}" artist:"{artist_name}"'
-        print(f"🎵 Searching (enhancer): {query}")
-        
-        results = enhancer.sp.search(q=query, type='track', limit=1)
-        
-        if results['tracks']['items']:
-            track = results['tracks']['items'][0]
-            print(f"  ✅ Found: {track['name']} - {track['artists'][0]['name']}")
-            
-            # Get image URL
-            image_url = None
-            if track['album']['images']:
-                images = track['album']['images']
-                image_url = images[1]['url'] if len(images) > 1 else images[0]['url']
-            
-            return {
-                'id': track['id'],
-                'name': track['name'],
-                'artist': track['artists'][0]['name'],
-                'uri': track['uri'],
-                'spotify_url': track['external_urls']['spotify'],
-                'image_url': image_url,
-                'preview_url': track['preview_url']
-            }
-        
-        print(f"  ❌ No results found")
-        return None
-        
+        return get_metadata_store().get_or_fetch(
+            track_cache_key(track_name, artist_name),
+            lambda: _search_track(enhancer, track_name, artist_name)
+        )
     except Exception as e:
         print(f"❌ Search error for '{track_name}': {e}")
         import traceback
@@ -410,80 +696,258 @@ def search_track_get_id(track_name, artist_name):
         return None
 
 
+def _search_track(enhancer, track_name, artist_name):
+    """Pesquisa na API (sem cache); None se não houver resultados"""
+    query = f'track:"{track_name}" artist:"{artist_name}"'
+    print(f"🎵 Searching (enhancer): {query}")
+    
+    get_rate_limiter().acquire()
+    results = enhancer.sp.search(q=query, type='track', limit=1)
+    
+    if results['tracks']['items']:
+        track = results['tracks']['items'][0]
+        print(f"  ✅ Found: {track['name']} - {track['artists'][0]['name']}")
+        return enhancer.track_payload(track)
+    
+    print(f"  ❌ No results found")
+    return None
+
+
+def lookup_by_uri(kind, uris, cache_only=False):
+    """
+    {uri: metadata} para tracks/artists/albums: cache primeiro, resto em lotes
+    (50 tracks, 50 artistas ou 20 álbuns por pedido)
+    
+    Lotes em paralelo (mesmo pool/rate limit das pesquisas); um lote que falha
+    não é guardado em cache, esses URIs ficam simplesmente de fora.
+    cache_only=True não faz pedidos: devolve só o que já está em cache.
+    """
+    enhancer = get_spotify_enhancer()
+    store = get_metadata_store()
+    
+    found = {}
+    missing = []
+    for uri in dict.fromkeys(uris):
+        cached = store.get(uri_cache_key(uri))
+        # Tracks em cache de antes de guardarmos artist_uri/album_uri são refeitas
+        if cached is MISS or (kind == 'track' and cached and 'album_uri' not in cached):
+            missing.append(uri)
+        else:
+            found[uri] = cached
+    
+    if not missing or cache_only:
+        return found
+    
+    def fetch(batch):
+        get_rate_limiter().acquire()
+        return enhancer.entities_by_uri(kind, list(batch))
+    
+    def fetch_many(keys):
+        """Só os URIs que nenhuma outra thread está a buscar"""
+        size = BATCH_SIZES[kind]
+        batches = [tuple(keys[i:i + size]) for i in range(0, len(keys), size)]
+        print(f"🎵 Resolving {len(keys)} {kind}s by URI in {len(batches)} batch(es)")
+        results = {}
+        for batch, payloads in zip(batches, enrich_unique(batches, fetch)):
+            if payloads is None:
+                continue
+            for uri, payload in zip(batch, payloads):
+                store.set(uri_cache_key(uri), payload)
+                results[uri] = payload
+        return results
+    
+    found.update(get_single_flight().do_many(missing, fetch_many))
+    return found
+
+
+def cached_lookup(cache_key):
+    """Só cache (sem API): metadata ou None"""
+    value = get_metadata_store().get(cache_key)
+    return None if value is MISS else value
+
+
+def lookup_entities_via_tracks(kind, names, cache_only=False):
+    """
+    Artistas/álbuns por ID: track mais tocada (URI do histórico) -> artist_uri/album_uri
+    -> lote GET /artists|/albums. Pesquisa por nome (em cache) só para o que falhar.
+    
+    Returns:
+        lista alinhada com names (None = não encontrado)
+    """
+    uri_index = get_uri_index(kind)
+    track_uris = [uri_index.get(name) for name in names]
+    tracks = lookup_by_uri('track', [uri for uri in track_uris if uri], cache_only)
+    
+    entity_uris = [(tracks.get(uri) or {}).get(f'{kind}_uri') if uri else None for uri in track_uris]
+    entities = lookup_by_uri(kind, [uri for uri in entity_uris if uri], cache_only)
+    lookups = [entities.get(uri) if uri else None for uri in entity_uris]
+    
+    unresolved = [i for i, found in enumerate(lookups) if found is None]
+    if cache_only:
+        cache_key = artist_cache_key if kind == 'artist' else album_cache_key
+        search = lambda name: cached_lookup(cache_key(name))
+    else:
+        search = search_artist_get_id if kind == 'artist' else search_album_get_id
+    for i, found in zip(unresolved, enrich_unique([names[i] for i in unresolved], search)):
+        lookups[i] = found
+    return lookups
+
+
+def get_uri_index(kind='track'):
+    """{nome: track uri} do dataset ativo (vazio em modo sketch: não há URIs por entidade)"""
+    if not has_request_context() or sketch_mode_enabled():  # Fora de um pedido não há dataset ativo
+        return {}
+    try:
+        return load_local_aggregates().uri_index(kind)
+    except Exception as e:
+        print(f"⚠️ URI index unavailable: {e}")
+        return {}
+
+
+def search_artist_get_id(artist_name):
+    """Artista por nome (cache persistente); exceções propagam para o chamador"""
+    enhancer = get_spotify_enhancer()
+    
+    def fetch():
+        get_rate_limiter().acquire()
+        results = enhancer.sp.search(q=f'artist:"{artist_name}"', type='artist', limit=1)
+        if not results['artists']['items']:
+            return None
+        return enhancer.artist_payload(results['artists']['items'][0])
+    
+    return get_metadata_store().get_or_fetch(artist_cache_key(artist_name), fetch)
+
+
+def search_album_get_id(album_name):
+    """Álbum por nome (cache persistente); exceções propagam para o chamador"""
+    enhancer = get_spotify_enhancer()
+    
+    def fetch():
+        get_rate_limiter().acquire()
+        results = enhancer.sp.search(q=f'album:"{album_name}"', type='album', limit=1)
+        if not results['albums']['items']:
+            return None
+        return enhancer.album_payload(results['albums']['items'][0])
+    
+    return get_metadata_store().get_or_fetch(album_cache_key(album_name), fetch)
+
+
+
+
+def split_track_key(track_key):
+    """'Track - Artist' -> (track, artist)"""
+    if ' - ' in track_key:
+        track_name, artist_name = track_key.split(' - ', 1)
+    else:
+        track_name, artist_name = track_key, 'Unknown'
+    return track_name.strip(), artist_name.strip()
+
+
+def resolve_metadata(data_type, items, cache_only=False):
+    """
+    Metadata Spotify para items de um tipo (lista alinhada, None = não encontrado)
+    
+    cache_only=True responde só com a cache (microssegundos): é a resposta
+    rápida; o resto chega depois por /api/metadata.
+    """
+    if data_type == 'track':
+        # 1º por URI do histórico (lotes de 50), pesquisa por texto só para o que faltar
+        uri_index = get_uri_index('track')
+        uris = [item.get('uri') or uri_index.get(item.get('track_key', '')) for item in items]
+        by_uri = lookup_by_uri('track', [uri for uri in uris if uri], cache_only)
+        lookups = [by_uri.get(uri) if uri else None for uri in uris]
+        
+        unresolved = [i for i, found in enumerate(lookups) if found is None]
+        keys = [split_track_key(items[i].get('track_key', '')) for i in unresolved]
+        if cache_only:
+            search = lambda key: cached_lookup(track_cache_key(*key))
+        else:
+            search = lambda key: search_track_get_id(*key)
+        for i, found in zip(unresolved, enrich_unique(keys, search)):
+            lookups[i] = found
+        if not cache_only:
+            check_failed_lookups(lookups, [track_cache_key(*split_track_key(item.get('track_key', '')))
+                                           for item in items])
+        return lookups
+    
+    if data_type in ('artist', 'album'):
+        names = [item.get(f'{data_type}_key', '') for item in items]
+        lookups = lookup_entities_via_tracks(data_type, names, cache_only)
+        if not cache_only:
+            cache_key = artist_cache_key if data_type == 'artist' else album_cache_key
+            check_failed_lookups(lookups, [cache_key(name) for name in names])
+        return lookups
+    
+    return [None] * len(items)
+
+
+def check_failed_lookups(lookups, cache_keys):
+    """
+    None com negativo em cache = não existe no Spotify (estável);
+    None sem nada em cache = a pesquisa falhou (erros não são guardados)
+    """
+    store = get_metadata_store()
+    if any(found is None and store.get(key) is MISS for found, key in zip(lookups, cache_keys)):
+        mark_metadata_incomplete()
 
 
-def enhance_data_with_spotify_ids(data, data_type='track'):
-    """Search Spotify IDs for all items usando SpotifyEnhancer (CLIENT CREDENTIALS GLOBAL)"""
+# top_tracks/top_artists/top_albums(include_metadata=True) usam este mesmo caminho
+set_metadata_resolver(resolve_metadata)
+
+
+def enhance_data_with_spotify_ids(data, data_type='track', cache_only=False):
+    """
+    Search Spotify IDs for all items usando SpotifyEnhancer (CLIENT CREDENTIALS GLOBAL)
+    
+    Pesquisas em paralelo (thread pool + rate limit partilhado), uma por item
+    distinto; a ordem de data é preservada. Com cache_only=True não há
+    pedidos à API e os items sem metadata ficam com metadata_pending=True.
+    """
     enhancer = get_spotify_enhancer()
     if not enhancer or not enhancer.api_available:
         print("❌ SpotifyEnhancer not available - returning data without metadata")
+        mark_metadata_incomplete()
         return data
     
-    enhanced_data = []
-    print(f"🎵 Enriquecendo {min(len(data), 100)} {data_type}s com imagens (CLIENT CREDENTIALS)...")
+    head = data[:100]  # Limite 100
+    if not cache_only:
+        print(f"🎵 Enriquecendo {len(head)} {data_type}s com imagens (CLIENT CREDENTIALS)...")
     
-    for i, item in enumerate(data[:100]):  # Limite 100
+    lookups = resolve_metadata(data_type, head, cache_only)
+    
+    enhanced_data = []
+    for item, found in zip(head, lookups):
         enhanced_item = item.copy()
-        try:
+        if found:
             if data_type == 'track':
-                # Parse track_key
-                track_key = item.get('track_key', '')
-                if ' - ' in track_key:
-                    track_name, artist_name = track_key.split(' - ', 1)
-                else:
-                    track_name = track_key
-                    artist_name = 'Unknown'
-                
-                print(f"  [{i+1}/{min(len(data), 100)}] Searching: {track_name} - {artist_name}")
-                
-                # USA search_track_get_id que agora usa enhancer
-                track_data = search_track_get_id(track_name.strip(), artist_name.strip())
-                
-                if track_data:
-                    enhanced_item['id'] = track_data.get('id')
-                    enhanced_item['uri'] = track_data.get('uri')
-                    enhanced_item['spotify_url'] = track_data.get('spotify_url')
-                    enhanced_item['image_url'] = track_data.get('image_url')
-                    enhanced_item['preview_url'] = track_data.get('preview_url')
-                    print(f"  ✅ Imagem encontrada")
-                else:
-                    print(f"  ❌ Não encontrado")
-            
-            elif data_type == 'artist':
-                artist_name = item.get('artist_key', '')
-                results = enhancer.sp.search(q=f'artist:"{artist_name}"', type='artist', limit=1)
-                if results['artists']['items']:
-                    artist = results['artists']['items'][0]
-                    enhanced_item['artist_id'] = artist['id']
-                    enhanced_item['spotify_url'] = artist['external_urls']['spotify']
-                    if artist['images']:
-                        enhanced_item['image_url'] = artist['images'][0]['url']
-            
-            elif data_type == 'album':
-                album_name = item.get('album_key', '')
-                results = enhancer.sp.search(q=f'album:"{album_name}"', type='album', limit=1)
-                if results['albums']['items']:
-                    album = results['albums']['items'][0]
-                    enhanced_item['album_id'] = album['id']
-                    enhanced_item['spotify_url'] = album['external_urls']['spotify']
-                    if album['images']:
-                        enhanced_item['image_url'] = album['images'][0]['url']
-        
-        except Exception as e:
-            print(f"  ❌ Erro: {e}")
-        
+                enhanced_item['id'] = found.get('id')
+                enhanced_item['uri'] = found.get('uri')
+                enhanced_item['preview_url'] = found.get('preview_url')
+            else:
+                enhanced_item[f'{data_type}_id'] = found['id']
+            enhanced_item['spotify_url'] = found.get('spotify_url')
+            if found.get('image_url') or data_type == 'track':
+                enhanced_item['image_url'] = thumbnail_url(found.get('image_url'))
+        elif cache_only:
+            enhanced_item['metadata_pending'] = True
         enhanced_data.append(enhanced_item)
     
     # Se houver mais de 100, adicionar os restantes sem enriquecimento
     if len(data) > 100:
         enhanced_data.extend(data[100:])
     
-    ids_found = sum(1 for item in enhanced_data if item.get('id') or item.get('image_url'))
-    print(f"✅ Enriquecidos {ids_found}/{len(data)} items com metadados (CLIENT CREDENTIALS)\n")
+    if not cache_only:
+        ids_found = sum(1 for item in enhanced_data if item.get('id') or item.get('image_url'))
+        print(f"✅ Enriquecidos {ids_found}/{len(data)} items com metadados (CLIENT CREDENTIALS)\n")
     
     return enhanced_data
 
 
+def defer_metadata_requested():
+    """?defer_metadata=1: responder já com a cache, metadata em falta via /api/metadata"""
+    return request.args.get('defer_metadata') in ('1', 'true')
+
+
 
 def apply_filters(df, year_filter=None, month_filter=None):
     """Apply year and month filters"""
@@ -501,39 +965,31 @@ def apply_filters(df, year_filter=None, month_filter=None):
     return filtered_df
 
 def search_tracks_for_playlist(track_keys):
-    """Search tracks on Spotify for playlist creation"""
-    sp = get_spotify_client()
-    if not sp:
-        print("Ã¢ÂÅ’ Spotify client not available")
-        return []
-    
-    found_tracks = []
-    
-    print(f"Ã°Å¸â€Â Searching {len(track_keys)} tracks on Spotify...")
+    """
+    URIs Spotify para a playlist, pela ordem de track_keys
     
-    for i, track_key in enumerate(track_keys):  # Use ALL tracks provided
-        try:
-            # Parse track_key (format: "Track Name - Artist Name")
-            if ' - ' in track_key:
-                track_name, artist_name = track_key.split(' - ', 1)
-            else:
-                track_name = track_key
-                artist_name = ''
-            
-            # Use optimized search function
-            track_data = search_track_get_id(track_name, artist_name)
-            
-            if track_data:
-                found_tracks.append(track_data['uri'])
-                print(f"  Ã¢Å“â€¦ [{i+1}/{len(track_keys)}] Found: {track_data['name']} - {track_data['artist']}")
+    1º o índice local track_key -> spotify_track_uri do histórico (sem
+    pedidos); só as que faltam vão à pesquisa (cache persistente + thread
+    pool com rate limit). Tracks não encontradas ficam de fora.
+    """
+    uri_index = get_uri_index('track')
+    uris = [uri_index.get(track_key) for track_key in track_keys]
+    uris = [uri if uri and uri.startswith('spotify:track:') else None for uri in uris]
+    
+    missing = [i for i, uri in enumerate(uris) if uri is None]
+    print(f"🔍 {len(track_keys) - len(missing)}/{len(track_keys)} tracks resolved from history, "
+          f"searching {len(missing)} on Spotify")
+    
+    if missing:
+        keys = [split_track_key(track_keys[i]) for i in missing]
+        for i, found in zip(missing, enrich_unique(keys, lambda key: search_track_get_id(*key))):
+            if found and found.get('uri'):
+                uris[i] = found['uri']
             else:
-                print(f"  Ã¢ÂÅ’ [{i+1}/{len(track_keys)}] Not found: {track_key}")
-                    
-        except Exception as e:
-            print(f"    Ã¢ÂÅ’ Error searching {track_key}: {e}")
-            continue
+                print(f"  ❌ Not found: {track_keys[i]}")
     
-    print(f"Ã¢Å“â€¦ {len(found_tracks)} tracks found out of {len(track_keys)} requested")
+    found_tracks = [uri for uri in uris if uri]
+    print(f"✅ {len(found_tracks)} tracks found out of {len(track_keys)} requested")
     return found_tracks
 
 # ========== CORRECT ANALYTICS FUNCTIONS ==========
@@ -552,37 +1008,26 @@ def repeat_spirals_max_single_day(df, n=50, time_period='all'):
         return []
 
     # FILTRAR APENAS PLAYS INTENTIONAL
-    df_intentional = df[df['play_type'] == 'INTENTIONAL'].copy()
+    df_intentional = df.loc[df['play_type'] == 'INTENTIONAL', ['track_key', 'ts']]
 
     if df_intentional.empty:
         return []
 
-    # Add date column
-    df_intentional['date'] = df_intentional['ts'].dt.date
-
-    # Group by track_key and date/week/month based on period
-    if time_period == 'day':
-        # Max plays in a single day
-        daily_plays = df_intentional.groupby(['track_key', 'date']).size().reset_index(name='plays_per_period')
-    elif time_period == 'week':
-        # Max plays in a single week
-        df_intentional['week'] = df_intentional['ts'].dt.to_period('W').apply(lambda r: r.start_time)
-        daily_plays = df_intentional.groupby(['track_key', 'week']).size().reset_index(name='plays_per_period')
+    # Início do dia/semana/mês de cada play (vetorizado, sem apply por linha)
+    ts = df_intentional['ts']
+    if time_period == 'week':
+        period = ts.dt.to_period('W').dt.start_time
     elif time_period == 'month':
-        # Max plays in a single month
-        df_intentional['month'] = df_intentional['ts'].dt.to_period('M').apply(lambda r: r.start_time)
-        daily_plays = df_intentional.groupby(['track_key', 'month']).size().reset_index(name='plays_per_period')
-    else:  # 'all'
-        daily_plays = df_intentional.groupby(['track_key', 'date']).size().reset_index(name='plays_per_period')
+        period = ts.dt.to_period('M').dt.start_time
+    else:  # 'day' / 'all': max plays num só dia
+        period = ts.dt.normalize()
 
-    # For each track, find the MAXIMUM plays in the period
-    max_single_period = daily_plays.groupby('track_key')['plays_per_period'].max().reset_index()
-    max_single_period.columns = ['track_key', 'max_plays_single_period']
+    # Plays por (track, período) -> máximo por track
+    plays_per_period = df_intentional.groupby(['track_key', period.rename('period')], observed=True).size()
+    max_single_period = plays_per_period.groupby(level='track_key', observed=True).max()
 
     # Sort by max plays and return top n
-    result = max_single_period.sort_values('max_plays_single_period', ascending=False).head(n)
-
-    return [(row['track_key'], row['max_plays_single_period']) for _, row in result.iterrows()]
+    return series_pairs(max_single_period.sort_values(ascending=False, kind='stable').head(n))
 
 def consecutive_days_listening(df, n=100):
     """
@@ -591,39 +1036,11 @@ def consecutive_days_listening(df, n=100):
     if df.empty:
         return []
     
-    # Add date column
-    df_copy = df.copy()
-    df_copy['date'] = df_copy['ts'].dt.date
-    
-    # Get unique dates per track
-    track_dates = df_copy.groupby('track_key')['date'].apply(lambda x: sorted(x.unique())).reset_index()
-    
-    results = []
-    
-    for _, row in track_dates.iterrows():
-        track_key = row['track_key']
-        dates = row['date']
-        
-        if len(dates) == 0:
-            continue
-        
-        # Find longest consecutive sequence
-        max_consecutive = 1
-        current_consecutive = 1
-        
-        for i in range(1, len(dates)):
-            # Check if dates are consecutive (1 day apart)
-            if (dates[i] - dates[i-1]).days == 1:
-                current_consecutive += 1
-                max_consecutive = max(max_consecutive, current_consecutive)
-            else:
-                current_consecutive = 1
-        
-        results.append((track_key, max_consecutive))
+    # Find longest consecutive sequence por track (vetorizado)
+    max_consecutive = longest_daily_streaks(df)
     
     # Sort by consecutive days and return top n
-    results.sort(key=lambda x: x[1], reverse=True)
-    return results[:n]
+    return series_pairs(max_consecutive.sort_values(ascending=False, kind='stable').head(n))
 
 
 def top_tracks_really_played(df, n=100):
@@ -634,22 +1051,9 @@ def top_tracks_really_played(df, n=100):
     if df.empty:
         return []
 
-    # FILTRAR APENAS PLAYS INTENTIONAL
-    df_intentional = df[df['play_type'] == 'INTENTIONAL'].copy()
-
-    if df_intentional.empty:
-        return []
-
-    # Contar plays por track
-    track_counts = (
-        df_intentional.groupby('track_key', sort=False)
-        .size()
-        .reset_index(name='plays')
-        .sort_values('plays', ascending=False)
-        .head(n)
-    )
-
-    return [(row['track_key'], row['plays']) for _, row in track_counts.iterrows()]
+    # FILTRAR APENAS PLAYS INTENTIONAL + contar plays por track
+    keys = df.loc[df['play_type'] == 'INTENTIONAL', 'track_key']
+    return series_pairs(top_counts(keys, n))
 
 
 
@@ -661,22 +1065,9 @@ def top_artists_really_played(df, n=100):
     if df.empty:
         return []
 
-    # FILTRAR APENAS PLAYS INTENTIONAL
-    df_intentional = df[df['play_type'] == 'INTENTIONAL'].copy()
-
-    if df_intentional.empty:
-        return []
-
-    # Contar plays por artista
-    artist_counts = (
-        df_intentional.groupby('artist_key', sort=False)
-        .size()
-        .reset_index(name='plays')
-        .sort_values('plays', ascending=False)
-        .head(n)
-    )
-
-    return [(row['artist_key'], row['plays']) for _, row in artist_counts.iterrows()]
+    # FILTRAR APENAS PLAYS INTENTIONAL + contar plays por artista
+    keys = df.loc[df['play_type'] == 'INTENTIONAL', 'artist_key']
+    return series_pairs(top_counts(keys, n))
 
 
 def top_albums_really_played(df, n=100):
@@ -687,22 +1078,9 @@ def top_albums_really_played(df, n=100):
     if df.empty:
         return []
 
-    # FILTRAR APENAS PLAYS INTENTIONAL
-    df_intentional = df[df['play_type'] == 'INTENTIONAL'].copy()
-
-    if df_intentional.empty:
-        return []
-
-    # Contar plays por album
-    album_counts = (
-        df_intentional.groupby('album_key', sort=False)
-        .size()
-        .reset_index(name='plays')
-        .sort_values('plays', ascending=False)
-        .head(n)
-    )
-
-    return [(row['album_key'], row['plays']) for _, row in album_counts.iterrows()]
+    # FILTRAR APENAS PLAYS INTENTIONAL + contar plays por album
+    keys = df.loc[df['play_type'] == 'INTENTIONAL', 'album_key']
+    return series_pairs(top_counts(keys, n))
 
 def get_track_calendar_data(df, track_key):
     """Get all dates when a specific track was played (for calendar view) - FULL DATA"""
@@ -719,15 +1097,67 @@ def get_track_calendar_data(df, track_key):
     track_data['date'] = track_data['ts'].dt.date
     
     # Group by date and count plays
-    daily_plays = track_data.groupby('date').size().reset_index(name='plays')
-    
-    # Convert to dictionary with date as key and plays as value
-    calendar_data = {}
-    for _, row in daily_plays.iterrows():
-        date_str = row['date'].strftime('%Y-%m-%d')
-        calendar_data[date_str] = int(row['plays'])
-    
-    return calendar_data
+    daily_plays = track_data.groupby('date', observed=True).size().reset_index(name='plays')
+    
+    # {data: plays} a partir das colunas
+    dates = pd.to_datetime(daily_plays['date']).dt.strftime('%Y-%m-%d').tolist()
+    return dict(zip(dates, daily_plays['plays'].astype(int).tolist()))
+
+def build_top_list(aggregates, kind, year_filter, month_filter, limit, sort='plays', metric='plays'):
+    """Top tracks/artists/albums a partir dos agregados, no formato JSON dos endpoints"""
+    items = []
+    for entity in aggregates.top_entities(kind, year_filter, month_filter, limit, sort=sort, metric=metric):
+        item = {
+            f'{kind}_key': entity['key'],
+            'plays': entity['plays'],
+            'total_hours': entity['ms_played'] / MS_PER_HOUR,
+            'listening_days': entity['days'],
+            'intentional_plays': entity['intentional'],
+            'skips': entity['skips'],
+            'skip_rate': entity['skip_rate'],
+            'avg_completion': entity['avg_completion'],
+            'spotify_url': '',
+            'image_url': '',
+            'enhanced_name': entity['key'] if kind != 'track' else ''
+        }
+        if kind == 'track':
+            item.update({'enhanced_artist': '', 'preview_url': '', 'uri': '', 'track_id': '', 'id': ''})
+        items.append(item)
+    return items
+
+
+def build_spirals_list(spirals_data, time_period):
+    """Formato JSON dos repeat spirals (sem metadata)"""
+    return [
+        {
+            'track_key': track_key,
+            'max_single_day_plays': int(max_single_day),
+            'time_period': time_period,
+            'spotify_url': '',
+            'image_url': '',
+            'preview_url': '',
+            'uri': '',
+            'id': ''
+        }
+        for track_key, max_single_day in spirals_data
+    ]
+
+
+def build_days_list(days_data):
+    """Formato JSON dos repeat days (sem metadata)"""
+    return [
+        {
+            'track_key': track_key,
+            'consecutive_days': int(consecutive_days),
+            'spotify_url': '',
+            'image_url': '',
+            'preview_url': '',
+            'uri': '',
+            'id': ''
+        }
+        for track_key, consecutive_days in days_data
+    ]
+
 
 # ========== MAIN ROUTES ==========
 
@@ -890,14 +1320,15 @@ def spotify_auth():
     
     redirect_uri = Config.REDIRECT_URI
     
-    auth_manager = SpotifyOAuth(
+    auth_manager = use_api_endpoints(SpotifyOAuth(
         client_id=Config.SPOTIFY_CLIENT_ID,
         client_secret=Config.SPOTIFY_CLIENT_SECRET,
         redirect_uri=redirect_uri,
         scope='user-top-read playlist-modify-public playlist-modify-private streaming user-read-private user-modify-playback-state user-read-playback-state',
         cache_path=cache_path,
-        show_dialog=True
-    )
+        show_dialog=True,
+        requests_session=get_http_session()
+    ))
 
     
     auth_url = auth_manager.get_authorize_url()
@@ -941,13 +1372,14 @@ def callback():
     # OAuth
     redirect_uri = Config.REDIRECT_URI # Ã¢Å“â€¦ ADICIONA
     
-    auth_manager = SpotifyOAuth(
+    auth_manager = use_api_endpoints(SpotifyOAuth(
         client_id=Config.SPOTIFY_CLIENT_ID,
         client_secret=Config.SPOTIFY_CLIENT_SECRET,
         redirect_uri=redirect_uri,  # Ã¢Å“â€¦ USA DINÃƒâ€šMICO
         scope='user-top-read playlist-modify-public playlist-modify-private streaming user-read-private user-modify-playback-state user-read-playback-state',
-        cache_path=cache_path
-    )
+        cache_path=cache_path,
+        requests_session=get_http_session()
+    ))
     
     try:
         token_info = auth_manager.get_access_token(code, as_dict=True, check_cache=False)
@@ -1005,6 +1437,13 @@ def callback():
 def logout():
     """Limpa sessÃƒÂ£o e dados do utilizador"""
     if 'user_id' in session:
+        try:
+            remove_user_contribution(Config.UPLOAD_FOLDER, session['user_id'])
+        except Exception as e:
+            print(f"⚠️ Global charts cleanup failed: {e}")
+        
+        user_client_registry.discard(get_spotify_cache_path())
+        
         user_folder = os.path.join(Config.UPLOAD_FOLDER, session['user_id'])
         if os.path.exists(user_folder):
             shutil.rmtree(user_folder)
@@ -1023,31 +1462,24 @@ def get_artist_top_tracks():
         return jsonify({'success': False, 'error': 'No data available'})
 
     try:
-        df_artist = df[df['master_metadata_album_artist_name'].str.strip() == artist_name].copy()
+        df_artist = df[df['master_metadata_album_artist_name'].str.strip() == artist_name]
         
         if df_artist.empty:
             return jsonify({'success': False, 'error': f'No tracks found for artist: {artist_name}'})
 
         # Get top 10 tracks
-        top_tracks_list = (
-            df_artist.groupby('track_key', sort=False)
-            .size()
-            .reset_index(name='plays')
-            .sort_values('plays', ascending=False)
-            .head(10)
-        )
+        top_tracks_list = top_counts(df_artist['track_key'], 10)
 
         # Format result
         result = []
-        for idx, (_, row) in enumerate(top_tracks_list.iterrows(), 1):
-            track_key = row['track_key']
+        for idx, (track_key, plays) in enumerate(series_pairs(top_tracks_list), 1):
             track_name, artist = track_key.split(' - ', 1) if ' - ' in track_key else (track_key, artist_name)
             result.append({
                 'rank': idx,
                 'track_key': track_key,
                 'name': track_name.strip(),
                 'artist': artist.strip(),
-                'plays': int(row['plays']),
+                'plays': plays,
                 'image_url': None,
                 'spotify_url': '',    # ← ADICIONA
                 'preview_url': '',    # ← ADICIONA
@@ -1066,7 +1498,7 @@ def get_artist_top_tracks():
                     item['uri'] = track_data.get('uri')
                     item['spotify_url'] = track_data.get('spotify_url')
                     item['preview_url'] = track_data.get('preview_url')
-                    item['image_url'] = track_data.get('image_url')
+                    item['image_url'] = thumbnail_url(track_data.get('image_url'))
                     print(f"  ✅ [{i+1}] {item['name']} - dados completos")
             except Exception as e:
                 print(f"  ❌ Erro na track {i+1}: {e}")
@@ -1095,7 +1527,7 @@ def get_album_top_tracks():
         return jsonify({'success': False, 'error': 'No data available'})
 
     try:
-        df_album = df[df['master_metadata_album_album_name'].str.strip() == album_name].copy()
+        df_album = df[df['master_metadata_album_album_name'].str.strip() == album_name]
         
         if df_album.empty:
             all_albums = df['master_metadata_album_album_name'].str.strip().unique()
@@ -1104,25 +1536,18 @@ def get_album_top_tracks():
             return jsonify({'success': False, 'error': f'No tracks found for album: {album_name}'})
 
         # Get top 10 tracks
-        top_tracks_list = (
-            df_album.groupby('track_key', sort=False)
-            .size()
-            .reset_index(name='plays')
-            .sort_values('plays', ascending=False)
-            .head(10)
-        )
+        top_tracks_list = top_counts(df_album['track_key'], 10)
 
         # Format result
         result = []
-        for idx, (_, row) in enumerate(top_tracks_list.iterrows(), 1):
-            track_key = row['track_key']
+        for idx, (track_key, plays) in enumerate(series_pairs(top_tracks_list), 1):
             track_name, artist = track_key.split(' - ', 1) if ' - ' in track_key else (track_key, 'Unknown')
             result.append({
                 'rank': idx,
                 'track_key': track_key,
                 'name': track_name.strip(),
                 'artist': artist.strip(),
-                'plays': int(row['plays']),
+                'plays': plays,
                 'image_url': None,
                 'spotify_url': '',    # ← ADICIONA
                 'preview_url': '',    # ← ADICIONA
@@ -1141,7 +1566,7 @@ def get_album_top_tracks():
                     item['uri'] = track_data.get('uri')
                     item['spotify_url'] = track_data.get('spotify_url')
                     item['preview_url'] = track_data.get('preview_url')
-                    item['image_url'] = track_data.get('image_url')
+                    item['image_url'] = thumbnail_url(track_data.get('image_url'))
                     print(f"  ✅ [{i+1}] {item['name']} - dados completos")
             except Exception as e:
                 print(f"  ❌ Erro na track {i+1}: {e}")
@@ -1163,6 +1588,16 @@ def get_album_top_tracks():
 def dashboard():
     """Dashboard route with data validation"""
     # ✅ VALIDAR se tem dados
+    if sketch_mode_enabled():
+        # Modo sketch: não carregar o DataFrame só para validar
+        try:
+            if load_local_sketch().total_plays > 0:
+                return render_template('dashboard.html', username=session.get('username', 'User'))
+        except Exception as e:
+            print(f"⚠️ Dashboard: sketch unavailable ({e})")
+        session['data_loaded'] = False
+        return redirect(url_for('home'))
+    
     df = load_local_data()
     
     if df.empty:
@@ -1215,6 +1650,7 @@ def api_search_track():
 # ========== CORRECTED API ENDPOINTS ==========
 
 @app.route('/api/track_calendar')
+@dataset_etag
 def api_track_calendar():
     """Get calendar data for a specific track - FULL DATA (no filters)"""
     track_key = request.args.get('track_key', '')
@@ -1245,96 +1681,89 @@ def api_track_calendar():
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/api/local_tracks')
+@dataset_etag
 def api_local_tracks():
     """Top tracks from local data with filters and IDs - TOP 50"""
     try:
-        df_music = load_local_data()
         year_filter = request.args.get('year', 'all')
         month_filter = request.args.get('month', 'all')
-        
-        # Apply filters
-        filtered_df = apply_filters(df_music, year_filter, month_filter)
-        
-        # Get top tracks - TOP 50
         limit = int(request.args.get('limit', 10))  # Default 10
-        tracks_data = top_tracks(filtered_df, n=limit, include_metadata=True)
-        
-        # Convert to list of dictionaries
-        tracks_list = []
-        for _, track in tracks_data.iterrows():
-            tracks_list.append({
-                'track_key': track['track_key'],
-                'plays': int(track['plays']),
-                'spotify_url': track.get('spotify_url', ''),
-                'image_url': track.get('image_url', ''),
-                'enhanced_name': track.get('enhanced_name', ''),
-                'enhanced_artist': track.get('enhanced_artist', ''),
-                'preview_url': track.get('preview_url', ''),
-                'uri': track.get('uri', ''),
-                'track_id': track.get('track_id', ''),
-                'id': track.get('id', '')
-            })
+        sort = request.args.get('sort', 'plays')  # plays | skip_rate | completion | most_skipped
+        if sort not in SORT_MODES:
+            return jsonify({'success': False, 'error': f'Invalid sort: {sort}'}), 400
+        metric = request.args.get('metric', 'plays')  # plays | hours | days | intentional
+        if metric not in METRICS:
+            return jsonify({'success': False, 'error': f'Invalid metric: {metric}'}), 400
+        
+        # Modo sketch: top all-time aproximado sem carregar o DataFrame
+        if sketch_serves_top(sort, metric, year_filter, month_filter):
+            tracks_list = sketch_top_list('track', limit)
+            return jsonify({'success': True, 'data': enhance_data_with_spotify_ids(tracks_list, 'track', cache_only=defer_metadata_requested())})
+        
+        # Get top tracks - TOP 50 (agregados: sem groupby por pedido)
+        tracks_list = build_top_list(
+            load_local_aggregates(), 'track', year_filter, month_filter, limit, sort, metric
+        )
         
         # Search Spotify IDs for ALL tracks
-        tracks_with_ids = enhance_data_with_spotify_ids(tracks_list, 'track')
+        tracks_with_ids = enhance_data_with_spotify_ids(tracks_list, 'track', cache_only=defer_metadata_requested())
         
         return jsonify({'success': True, 'data': tracks_with_ids})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/api/local_artists')
+@dataset_etag
 def api_local_artists():
     """Top artists from local data with filters and IDs - TOP 50"""
     try:
-        df_music = load_local_data()
         year_filter = request.args.get('year', 'all')
         month_filter = request.args.get('month', 'all')
-        
-        filtered_df = apply_filters(df_music, year_filter, month_filter)
         limit = int(request.args.get('limit', 10))  # Default 10
-        artists_data = top_artists(filtered_df, n=limit, include_metadata=True)
-
-        artists_list = []
-        for _, artist in artists_data.iterrows():
-            artists_list.append({
-                'artist_key': artist['artist_key'],
-                'plays': int(artist['plays']),
-                'spotify_url': artist.get('spotify_url', ''),
-                'image_url': artist.get('image_url', ''),
-                'enhanced_name': artist.get('enhanced_name', '')
-            })
+        sort = request.args.get('sort', 'plays')  # plays | skip_rate | completion | most_skipped
+        if sort not in SORT_MODES:
+            return jsonify({'success': False, 'error': f'Invalid sort: {sort}'}), 400
+        metric = request.args.get('metric', 'plays')  # plays | hours | days | intentional
+        if metric not in METRICS:
+            return jsonify({'success': False, 'error': f'Invalid metric: {metric}'}), 400
+        
+        # Modo sketch: top all-time aproximado sem carregar o DataFrame
+        if sketch_serves_top(sort, metric, year_filter, month_filter):
+            artists_list = sketch_top_list('artist', limit)
+            return jsonify({'success': True, 'data': enhance_data_with_spotify_ids(artists_list, 'artist', cache_only=defer_metadata_requested())})
+        
+        artists_list = build_top_list(
+            load_local_aggregates(), 'artist', year_filter, month_filter, limit, sort, metric
+        )
         
         # Search Spotify IDs for ALL artists
-        artists_with_ids = enhance_data_with_spotify_ids(artists_list, 'artist')
+        artists_with_ids = enhance_data_with_spotify_ids(artists_list, 'artist', cache_only=defer_metadata_requested())
         
         return jsonify({'success': True, 'data': artists_with_ids})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/api/local_albums')
+@dataset_etag
 def api_local_albums():
     """Top albums from local data with filters and IDs - TOP 50"""
     try:
-        df_music = load_local_data()
         year_filter = request.args.get('year', 'all')
         month_filter = request.args.get('month', 'all')
-        
-        filtered_df = apply_filters(df_music, year_filter, month_filter)
         limit = int(request.args.get('limit', 10))  # Default 10
-        albums_data = top_albums(filtered_df, n=limit, include_metadata=True)
-
-        albums_list = []
-        for _, album in albums_data.iterrows():
-            albums_list.append({
-                'album_key': album['album_key'],
-                'plays': int(album['plays']),
-                'spotify_url': album.get('spotify_url', ''),
-                'image_url': album.get('image_url', ''),
-                'enhanced_name': album.get('enhanced_name', '')
-            })
+        sort = request.args.get('sort', 'plays')
+        if sort not in SORT_MODES:
+            return jsonify({'success': False, 'error': f'Invalid sort: {sort}'}), 400
+        metric = request.args.get('metric', 'plays')  # plays | hours | days | intentional
+        if metric not in METRICS:
+            return jsonify({'success': False, 'error': f'Invalid metric: {metric}'}), 400
+        
+        albums_list = build_top_list(
+            load_local_aggregates(), 'album', year_filter, month_filter, limit, sort, metric
+        )
         
         # Search Spotify IDs for ALL albums
-        albums_with_ids = enhance_data_with_spotify_ids(albums_list, 'album')
+        albums_with_ids = enhance_data_with_spotify_ids(albums_list, 'album', cache_only=defer_metadata_requested())
         
         return jsonify({'success': True, 'data': albums_with_ids})
     except Exception as e:
@@ -1342,6 +1771,7 @@ def api_local_albums():
 
 
 @app.route('/api/local_tracks_really_played')
+@dataset_etag
 def api_local_tracks_really_played():
     """Top tracks REALLY PLAYED - APENAS PLAYS INTENTIONAL with filters and IDs - TOP 50"""
     try:
@@ -1371,7 +1801,7 @@ def api_local_tracks_really_played():
             })
 
         # Search Spotify IDs for ALL tracks
-        tracks_with_ids = enhance_data_with_spotify_ids(tracks_list, 'track')
+        tracks_with_ids = enhance_data_with_spotify_ids(tracks_list, 'track', cache_only=defer_metadata_requested())
 
         return jsonify({'success': True, 'data': tracks_with_ids})  # Ã¢Å“â€¦ CORRETO
     except Exception as e:
@@ -1379,6 +1809,7 @@ def api_local_tracks_really_played():
 
 
 @app.route('/api/local_artists_really_played')
+@dataset_etag
 def api_local_artists_really_played():
     """Top artists REALLY PLAYED - APENAS PLAYS INTENTIONAL with filters and IDs - TOP 50"""
     try:
@@ -1404,7 +1835,7 @@ def api_local_artists_really_played():
             })
 
         # Search Spotify IDs for artists
-        artists_with_ids = enhance_data_with_spotify_ids(artists_list, 'artist')
+        artists_with_ids = enhance_data_with_spotify_ids(artists_list, 'artist', cache_only=defer_metadata_requested())
 
         return jsonify({'success': True, 'data': artists_with_ids})
 
@@ -1413,6 +1844,7 @@ def api_local_artists_really_played():
 
 
 @app.route('/api/local_albums_really_played')
+@dataset_etag
 def api_local_albums_really_played():
     """Top albums REALLY PLAYED - APENAS PLAYS INTENTIONAL with filters and IDs - TOP 50"""
     try:
@@ -1438,7 +1870,7 @@ def api_local_albums_really_played():
             })
 
         # Search Spotify IDs for albums
-        albums_with_ids = enhance_data_with_spotify_ids(albums_list, 'album')
+        albums_with_ids = enhance_data_with_spotify_ids(albums_list, 'album', cache_only=defer_metadata_requested())
 
         return jsonify({'success': True, 'data': albums_with_ids})
 
@@ -1447,29 +1879,37 @@ def api_local_albums_really_played():
 
 
 @app.route('/api/daily_history')
+@dataset_etag
 def api_daily_history():
     """Daily history with filters"""
     try:
-        df_music = load_local_data()
         year_filter = request.args.get('year', 'all')
         month_filter = request.args.get('month', 'all')
         
+        # Modo sketch: contadores diários fixos (exatos) servem qualquer filtro
+        if sketch_mode_enabled():
+            days = load_local_sketch().daily_history(year_filter, month_filter)
+            history_list = column_records(
+                date=[day.strftime('%Y-%m-%d') for day, _ in days],
+                plays=[plays for _, plays in days]
+            )
+            return jsonify({'success': True, 'data': history_list})
+        
+        df_music = load_local_data()
         filtered_df = apply_filters(df_music, year_filter, month_filter)
         history_data = daily_history(filtered_df)
         
-        # Convert to JSON format
-        history_list = []
-        for _, day in history_data.iterrows():
-            history_list.append({
-                'date': day['date'].strftime('%Y-%m-%d'),
-                'plays': int(day['plays'])
-            })
+        history_list = column_records(
+            date=history_data['date'].dt.strftime('%Y-%m-%d'),
+            plays=history_data['plays'].astype(int)
+        )
         
         return jsonify({'success': True, 'data': history_list})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/api/repeat_spirals')
+@dataset_etag
 def api_repeat_spirals():
     """REPEAT SPIRALS: Max plays in a single day/week/month with filters and IDs - TOP 50
     APENAS PLAYS INTENTIONAL"""
@@ -1487,42 +1927,18 @@ def api_repeat_spirals():
         spirals_data = repeat_spirals_max_single_day(filtered_df, n=limit, time_period=time_period)
 
         # Convert to JSON format
-        spirals_list = []
-        for track_key, max_single_day in spirals_data:
-            spirals_list.append({
-                'track_key': track_key,
-                'max_single_day_plays': max_single_day,
-                'time_period': time_period,
-                'spotify_url': '',           # ← ADICIONA
-                'image_url': '',             # ← ADICIONA
-                'preview_url': '',           # ← ADICIONA
-                'uri': '',                   # ← ADICIONA
-                'id': ''                     # ← ADICIONA
-            })
+        spirals_list = build_spirals_list(spirals_data, time_period)
 
         # Search Spotify IDs for ALL tracks
-        spirals_with_ids = enhance_data_with_spotify_ids(spirals_list, 'track')
-        
-        # ✅ ADICIONAR: Enriquecer com imagens até 100
-        print(f"🎵 Enriquecendo {min(len(spirals_with_ids), 100)} repeat spirals com imagens...")
-        for i, item in enumerate(spirals_with_ids[:100]):  # Limite 100
-            if not item.get('image_url'):  # Só se ainda não tem imagem
-                try:
-                    track_name, artist = item['track_key'].split(' - ', 1) if ' - ' in item['track_key'] else (item['track_key'], 'Unknown')
-                    track_data = search_track_get_id(track_name, artist)
-                    if track_data:
-                        item['image_url'] = track_data.get('image_url')
-                        print(f"  ✅ [{i+1}] {track_name} - imagem encontrada")
-                except Exception as e:
-                    print(f"  ❌ Erro no item {i+1}: {e}")
-                    pass
-
+        spirals_with_ids = enhance_data_with_spotify_ids(spirals_list, 'track', cache_only=defer_metadata_requested())
+        
         return jsonify({'success': True, 'data': spirals_with_ids})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 
 @app.route('/api/repeat_days')
+@dataset_etag
 def api_repeat_days():
     """REPEAT DAYS: Max consecutive days with filters and IDs - TOP 50"""
     try:
@@ -1534,52 +1950,292 @@ def api_repeat_days():
         limit = int(request.args.get('limit', 10))  # Default 10
         days_data = consecutive_days_listening(filtered_df, n=limit)
         
-        days_list = []
-        for track_key, consecutive_days in days_data:
-            days_list.append({
-                'track_key': track_key,
-                'consecutive_days': consecutive_days,
-                'spotify_url': '',           # ← ADICIONA
-                'image_url': '',             # ← ADICIONA
-                'preview_url': '',           # ← ADICIONA
-                'uri': '',                   # ← ADICIONA
-                'id': ''                     # ← ADICIONA
-            })
+        days_list = build_days_list(days_data)
         
         # Search Spotify IDs for ALL tracks
-        days_with_ids = enhance_data_with_spotify_ids(days_list, 'track')
-        
-        # ✅ ADICIONAR: Enriquecer com imagens até 100
-        print(f"🎵 Enriquecendo {min(len(days_with_ids), 100)} repeat days com imagens...")
-        for i, item in enumerate(days_with_ids[:100]):  # Limite 100
-            if not item.get('image_url'):  # Só se ainda não tem imagem
-                try:
-                    track_name, artist = item['track_key'].split(' - ', 1) if ' - ' in item['track_key'] else (item['track_key'], 'Unknown')
-                    track_data = search_track_get_id(track_name, artist)
-                    if track_data:
-                        item['image_url'] = track_data.get('image_url')
-                        print(f"  ✅ [{i+1}] {track_name} - imagem encontrada")
-                except Exception as e:
-                    print(f"  ❌ Erro no item {i+1}: {e}")
-                    pass
+        days_with_ids = enhance_data_with_spotify_ids(days_list, 'track', cache_only=defer_metadata_requested())
         
         return jsonify({'success': True, 'data': days_with_ids})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/listening_clock')
+@dataset_etag
+def api_listening_clock():
+    """LISTENING CLOCK: plays e horas por dia da semana x hora, com filtros"""
+    try:
+        year_filter = request.args.get('year', 'all')
+        month_filter = request.args.get('month', 'all')
+        
+        aggregates = load_local_aggregates()
+        plays, ms_played = aggregates.listening_clock(year_filter, month_filter)
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'days': WEEKDAY_LABELS,
+                'hours': list(range(24)),
+                'plays': plays.astype(int).tolist(),
+                'listening_hours': (ms_played / MS_PER_HOUR).round(2).tolist(),
+                'total_plays': int(plays.sum())
+            }
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/compare_periods')
+@dataset_etag
+def api_compare_periods():
+    """PERIOD COMPARISON: chart do período A vs período B (ex: 2024 vs 2023)"""
+    try:
+        kind = request.args.get('type', 'track')
+        if kind not in ('track', 'artist', 'album'):
+            return jsonify({'success': False, 'error': f'Invalid type: {kind}'}), 400
+        
+        aggregates = load_local_aggregates()
+        if aggregates.n_periods == 0:
+            return jsonify({'success': False, 'error': 'No data available'})
+        
+        # Por defeito: último ano com dados vs ano anterior
+        latest_year = int(aggregates.period_years.max())
+        year_a = request.args.get('year_a', str(latest_year))
+        month_a = request.args.get('month_a', 'all')
+        year_b = request.args.get('year_b', str(int(year_a) - 1) if year_a != 'all' else 'all')
+        month_b = request.args.get('month_b', 'all')
+        limit = int(request.args.get('limit', 10))
+        
+        comparison = aggregates.compare_periods(kind, (year_a, month_a), (year_b, month_b), n=limit)
+        
+        return jsonify({
+            'success': True,
+            'type': kind,
+            'period_a': {'year': year_a, 'month': month_a},
+            'period_b': {'year': year_b, 'month': month_b},
+            'data': comparison
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/discoveries')
+@dataset_etag
+def api_discoveries():
+    """DISCOVERY TIMELINE: descobertas por mês + forgotten favourites"""
+    try:
+        kind = request.args.get('type', 'track')
+        if kind not in ('track', 'artist', 'album'):
+            return jsonify({'success': False, 'error': f'Invalid type: {kind}'}), 400
+        
+        year_filter = request.args.get('year', 'all')
+        month_filter = request.args.get('month', 'all')
+        limit = int(request.args.get('limit', 10))
+        
+        aggregates = load_local_aggregates()
+        if aggregates.n_periods == 0:
+            return jsonify({'success': False, 'error': 'No data available'})
+        
+        return jsonify({
+            'success': True,
+            'type': kind,
+            'data': {
+                'per_month': aggregates.discoveries_per_month(kind),
+                'discoveries': aggregates.discoveries(kind, year_filter, month_filter, n=limit),
+                'forgotten_favourites': aggregates.forgotten_favourites(kind, n=limit)
+            }
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/global_charts')
+def api_global_charts():
+    """GLOBAL CHARTS: mais tocados por todos os utilizadores (sem carregar linhas raw)"""
+    try:
+        limit = int(request.args.get('limit', 10))
+        include_daily = request.args.get('daily', 'false') == 'true'
+        
+        index = load_global_index(Config.UPLOAD_FOLDER)
+        
+        data = {
+            'tracks': [{'track_key': k, 'plays': int(p)} for k, p in global_top(index, 'tracks', limit)],
+            'artists': [{'artist_key': k, 'plays': int(p)} for k, p in global_top(index, 'artists', limit)],
+            'users': len(index['users'])
+        }
+        if include_daily:
+            data['daily'] = [
+                {'date': day.strftime('%Y-%m-%d'), 'plays': int(plays)}
+                for day, plays in global_daily(index)
+            ]
+        
+        return jsonify({'success': True, 'data': data})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/dashboard_bundle')
+@dataset_etag
+def api_dashboard_bundle():
+    """
+    DASHBOARD BUNDLE: todos os painéis num só pedido
+    
+    Um load + um apply_filters; tops, histórico e relógio saem dos agregados,
+    repeats do mesmo filtered_df partilhado.
+    
+    Modo sketch sem filtros: tops, histórico e anos saem do sketch (mesmos
+    números dos endpoints individuais) sem carregar o DataFrame; álbuns,
+    repeats e relógio vêm a null e o frontend pede-os à parte.
+    """
+    try:
+        year_filter = request.args.get('year', 'all')
+        month_filter = request.args.get('month', 'all')
+        time_period = request.args.get('period', 'day')
+        limit = int(request.args.get('limit', 10))
+        filters = {'year': year_filter, 'month': month_filter, 'period': time_period, 'limit': limit}
+        cache_only = defer_metadata_requested()
+        
+        if sketch_serves_top('plays', 'plays', year_filter, month_filter):
+            sketch = load_local_sketch()
+            if sketch.total_plays == 0:
+                return jsonify({'success': False, 'error': 'No data available'})
+            
+            days = sketch.daily_history(year_filter, month_filter)
+            return jsonify({
+                'success': True,
+                'approximate': True,
+                'filters': filters,
+                'years': sketch.available_years(),
+                'tracks': enhance_data_with_spotify_ids(sketch_top_list('track', limit), 'track', cache_only=cache_only),
+                'artists': enhance_data_with_spotify_ids(sketch_top_list('artist', limit), 'artist', cache_only=cache_only),
+                'albums': None,
+                'spirals': None,
+                'days': None,
+                'daily_history': column_records(
+                    date=[day.strftime('%Y-%m-%d') for day, _ in days],
+                    plays=[plays for _, plays in days]
+                ),
+                'listening_clock': None
+            })
+        
+        df_music = load_local_data()
+        if df_music.empty:
+            return jsonify({'success': False, 'error': 'No data available'})
+        
+        aggregates = load_local_aggregates(df_music)
+        filtered_df = apply_filters(df_music, year_filter, month_filter)
+        
+        # Tops a partir dos agregados (sem groupby)
+        tracks_list = build_top_list(aggregates, 'track', year_filter, month_filter, limit)
+        artists_list = build_top_list(aggregates, 'artist', year_filter, month_filter, limit)
+        albums_list = build_top_list(aggregates, 'album', year_filter, month_filter, limit)
+        
+        # Repeats a partir do slice filtrado partilhado
+        spirals_list = build_spirals_list(
+            repeat_spirals_max_single_day(filtered_df, n=limit, time_period=time_period), time_period
+        )
+        days_list = build_days_list(consecutive_days_listening(filtered_df, n=limit))
+        
+        dates, daily_plays = aggregates.daily_history(year_filter, month_filter)
+        clock_plays, clock_ms = aggregates.listening_clock(year_filter, month_filter)
+        
+        return jsonify({
+            'success': True,
+            'filters': filters,
+            'years': load_local_sketch().available_years() if sketch_mode_enabled() else aggregates.available_years(),
+            'tracks': enhance_data_with_spotify_ids(tracks_list, 'track', cache_only=cache_only),
+            'artists': enhance_data_with_spotify_ids(artists_list, 'artist', cache_only=cache_only),
+            'albums': enhance_data_with_spotify_ids(albums_list, 'album', cache_only=cache_only),
+            'spirals': enhance_data_with_spotify_ids(spirals_list, 'track', cache_only=cache_only),
+            'days': enhance_data_with_spotify_ids(days_list, 'track', cache_only=cache_only),
+            'daily_history': column_records(
+                date=dates.astype(str),
+                plays=daily_plays.astype(int)
+            ),
+            'listening_clock': {
+                'plays': clock_plays.astype(int).tolist(),
+                'listening_hours': (clock_ms / MS_PER_HOUR).round(2).tolist()
+            }
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
 @app.route('/api/available_years')
+@dataset_etag
 def api_available_years():
     """Available years in data"""
     try:
-        df_music = load_local_data()
-        if df_music.empty:
-            return jsonify({'success': True, 'years': []})
+        if sketch_mode_enabled():
+            return jsonify({'success': True, 'years': load_local_sketch().available_years()})
         
-        years = sorted(df_music['ts'].dt.year.unique().tolist())
-        return jsonify({'success': True, 'years': years})
+        # Anos a partir dos agregados (sem varrer a coluna ts a cada pedido)
+        return jsonify({'success': True, 'years': load_local_aggregates().available_years()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/image')
+def api_image():
+    """
+    PROXY DE CAPAS: ?url=<imagem do Spotify>&size=<px>&sig=<assinatura>
+    
+    Serve do disco (miniatura se size <= 300); imutável, cache de 1 ano no
+    browser. Se o upstream falhar, redireciona para o URL original.
+    Só URLs assinados por thumbnail_url(): ninguém enche o disco com imagens arbitrárias.
+    """
+    url = request.args.get('url', '')
+    size = request.args.get('size', type=int)
+    if not valid_signature(app.secret_key, url, size, request.args.get('sig', '')):
+        return jsonify({'success': False, 'error': 'Invalid image signature'}), 403
+    
+    cache = get_image_cache()
+    if not cache.allowed(url):
+        return jsonify({'success': False, 'error': 'Image host not allowed'}), 400
+    
+    try:
+        path, mimetype, etag = cache.get(url, size)
+        response = send_file(path, mimetype=mimetype, etag=etag, conditional=True,
+                             max_age=Config.IMAGE_CACHE_MAX_AGE)
+    except (ImageUnavailable, OSError) as e:  # OSError: podado entre get() e send_file
+        print(f"⚠️ Image proxy: {e}")
+        return redirect(url)
+    
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/api/metadata')
+def api_metadata():
+    """
+    METADATA (2ª fase): imagens/IDs para items devolvidos com metadata_pending
+    
+    ?type=track|artist|album&ids=<key>&ids=<key>... (keys = track_key/artist_key/album_key)
+    """
+    try:
+        data_type = request.args.get('type', 'track')
+        if data_type not in ('track', 'artist', 'album'):
+            return jsonify({'success': False, 'error': f'Invalid type: {data_type}'}), 400
+        keys = list(dict.fromkeys(request.args.getlist('ids')))[:100]
+        
+        key_field = f'{data_type}_key'
+        items = enhance_data_with_spotify_ids([{key_field: key} for key in keys], data_type)
+        metadata = {
+            item.pop(key_field): item
+            for item in items
+            if item.get('image_url') or item.get('spotify_url')
+        }
+        return jsonify({'success': True, 'data': metadata})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/metrics')
+def api_metrics():
+    """Métricas do processo: circuit breaker e health probe da API Spotify"""
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'spotify_circuit': get_spotify_breaker().snapshot(),
+        'spotify_health': spotify_enhancer_instance.health if spotify_enhancer_instance else None,
+        'user_clients': len(user_client_registry),
+        'metadata_single_flight': get_single_flight().stats,
+        'image_cache': image_cache_instance.stats if image_cache_instance else None,
+        'shared_store': shared_store.snapshot() if shared_store else None,
+        'warmup': warmup_report
+    })
+
 # ========== PLAYLIST CREATION API ==========
 
 @app.route('/api/create_custom_playlist', methods=['POST'])
@@ -1607,7 +2263,7 @@ def api_create_custom_playlist():
             print(f"❌ Failed to get Spotify user: {e}")
             return jsonify({'success': False, 'error': 'Failed to authenticate with Spotify'}), 401
         
-        # Search tracks on Spotify
+        # URIs do histórico; pesquisa só para as que faltarem
         track_uris = search_tracks_for_playlist(track_keys)
         
         if not track_uris:
@@ -1770,6 +2426,90 @@ def api_previous():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+# ============================================================================
+# APP FACTORY + WARM-UP (GUNICORN --preload)
+# ============================================================================
+
+# Preenchido no master por create_app(); os workers herdam-no no fork
+warmup_report = None
+
+
+def recent_user_ids(limit, max_age):
+    """user_ids com dados, do mais recentemente ativo para o menos (até max_age segundos)"""
+    cutoff = time.time() - max_age
+    candidates = []
+    try:
+        folders = [entry for entry in os.scandir(Config.UPLOAD_FOLDER) if entry.is_dir()]
+    except OSError:
+        return []
+    
+    for folder in folders:
+        marker = os.path.join(folder.path, LAST_ACTIVE_FILENAME)
+        dataset = os.path.join(folder.path, 'processed_data.pkl')
+        if not os.path.exists(dataset):
+            continue  # Sem dataset processado não há nada barato para aquecer
+        last_active = max(os.path.getmtime(path) for path in (marker, dataset) if os.path.exists(path))
+        if last_active >= cutoff:
+            candidates.append((last_active, folder.name))
+    
+    return [user_id for _, user_id in sorted(candidates, reverse=True)[:limit]]
+
+
+def warm_up(user_ids):
+    """
+    Carrega dataset + agregados + bundle por defeito de cada utilizador
+    
+    Corre no master antes do fork: o dataset fica no store partilhado e os
+    agregados / L1 de metadata em app_cache, herdados por todos os workers
+    (incluindo os que o gunicorn reinicia). Metadata só da cache (sem rede).
+    """
+    report = {'users': 0, 'failed': 0, 'seconds': 0.0}
+    start = time.perf_counter()
+    
+    for user_id in user_ids:
+        user_start = time.perf_counter()
+        try:
+            for path in ('/api/dashboard_bundle?defer_metadata=1', '/api/available_years'):
+                with app.test_request_context(path):
+                    session['user_id'] = user_id
+                    g.warmup = True
+                    response = app.make_response(app.view_functions[request.endpoint]())
+                    if not response.get_json().get('success'):
+                        raise RuntimeError(response.get_json().get('error'))
+            report['users'] += 1
+            print(f"🔥 Warmed user {user_id[:8]} in {time.perf_counter() - user_start:.2f}s")
+        except Exception as e:
+            report['failed'] += 1
+            print(f"⚠️ Warm-up failed for user {user_id[:8]}: {e}")
+    
+    report['seconds'] = round(time.perf_counter() - start, 2)
+    return report
+
+
+def create_app(warm=None):
+    """
+    App pronta a servir (gunicorn "app:create_app()" com preload_app)
+    
+    Os imports pesados (pandas, spotipy, fuzzywuzzy) já aconteceram ao
+    importar este módulo; com preload isso e o warm-up correm 1x no master.
+    O índice global não é reconstruído aqui (bloquearia o boot): só via
+    python global_charts.py; até lá os charts globais servem um índice vazio.
+    """
+    global warmup_report
+    if warm is None:
+        warm = Config.WARMUP_ENABLED
+    
+    if not global_index_exists(Config.UPLOAD_FOLDER):
+        print("⚠️ Global charts index missing: run python global_charts.py")
+    
+    if warm and warmup_report is None:
+        user_ids = recent_user_ids(Config.WARMUP_USERS, Config.WARMUP_MAX_AGE)
+        warmup_report = warm_up(user_ids)
+        print(f"🔥 Warm-up: {warmup_report['users']}/{len(user_ids)} users in {warmup_report['seconds']}s")
+    
+    return app
+
+
 if __name__ == '__main__':
     print("=" * 80)
     print("Ã°Å¸Å½Âµ SPOTIFY PEDRO - ADVANCED ANALYTICS DASHBOARD")
@@ -1797,4 +2537,5 @@ if __name__ == '__main__':
     print("Ã°Å¸Å’Â URL: http://localhost:5000")
     print("Ã°Å¸â€â€˜ Connect once for full functionality")
     print("=" * 80)
-    app.run(debug=False, port=5000)
\ No newline at end of file
+    init_spotify_enhancer()
+    create_app().run(debug=False, port=5000)
\ No newline at end of file
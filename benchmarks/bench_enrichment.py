@@ -0,0 +1,74 @@
+# bench_enrichment.py - ENRIQUECIMENTO CONTRA A API FALSA (SEM REDE)
+#
+# Arranca benchmarks/fake_spotify.py no mesmo processo, aponta a app para
+# ele (SPOTIFY_API_URL) com uma cache de metadata temporária e mede:
+#
+# - pesquisa de N tracks por nome, a frio (thread pool + token bucket) e a quente
+# - resolução de N tracks por URI (lotes de 50)
+# - o mesmo com 429 injetados (Retry-After + circuit breaker)
+#
+# Uso: python benchmarks/bench_enrichment.py [n_tracks] [latência_s]
+
+import os
+import sys
+import time
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_spotify import FakeSpotifyServer, load_fixtures, DEFAULT_FIXTURES
+
+
+def timed(label, fn, server):
+    before = server.stats['requests']
+    start = time.perf_counter()
+    results = fn()
+    elapsed = time.perf_counter() - start
+    resolved = sum(1 for r in results if r)
+    print(f"{label:<34} {elapsed * 1000:8.0f} ms  {resolved:4d} resolvidos  "
+          f"{server.stats['requests'] - before:4d} pedidos à API")
+
+
+def main(n_tracks=200, latency=0.05):
+    server = FakeSpotifyServer(load_fixtures(DEFAULT_FIXTURES), latency=latency)
+    tmp = tempfile.mkdtemp(prefix='bench-enrich-')
+    os.environ.update(
+        SPOTIFY_API_URL=server.start(),
+        SPOTIFY_CLIENT_ID='bench-client-id',
+        SPOTIFY_CLIENT_SECRET='bench-client-secret',
+        SPOTIFY_APP_TOKEN_CACHE=os.path.join(tmp, 'app_token'),
+        METADATA_CACHE_PATH=os.path.join(tmp, 'metadata.sqlite'),
+    )
+    os.chdir(ROOT)
+
+    import app
+    from enrichment import enrich_unique
+    from resilience import get_spotify_breaker
+
+    app.init_spotify_enhancer().check_health()
+
+    keys = [(f'Bench Track {i}', f'Bench Artist {i % 25}') for i in range(n_tracks)]
+    uris = [f'spotify:track:{i:022d}' for i in range(n_tracks)]
+
+    def search_all():
+        return enrich_unique(keys, lambda key: app.search_track_get_id(*key))
+
+    print(f"📊 {n_tracks} tracks, latência {latency * 1000:.0f} ms por pedido\n")
+    timed('pesquisa por nome (fria)', search_all, server)
+    timed('pesquisa por nome (quente)', search_all, server)
+    timed('por URI, lotes de 50 (fria)', lambda: app.lookup_by_uri('track', uris).values(), server)
+
+    # 429 a cada 5 pedidos com Retry-After curto: o cliente espera e repete
+    server.rate_limit_every, server.retry_after = 5, 1
+    throttled = [(f'Throttled {i}', 'Bench Artist') for i in range(n_tracks // 4)]
+    timed('pesquisa com 429 injetados', lambda: enrich_unique(
+        throttled, lambda key: app.search_track_get_id(*key)), server)
+    print(f"\n429 enviados: {server.stats['rate_limited']}  breaker: {get_spotify_breaker().snapshot()}")
+    server.stop()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+         float(sys.argv[2]) if len(sys.argv) > 2 else 0.05)
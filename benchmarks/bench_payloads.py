@@ -0,0 +1,122 @@
+# bench_payloads.py - TAMANHO E TEMPO DE SERIALIZAÇÃO DAS RESPOSTAS JSON
+#
+# Compara, para um histórico diário de 10 anos e uma top list de 100 items:
+#
+#   antes:  iterrows + dict por linha, json do Flask (sort_keys), sem compressão
+#   depois: column_records + FastJSONProvider (orjson se instalado), gzip / brotli
+#
+# Uso: python benchmarks/bench_payloads.py [repetições]
+
+import os
+import sys
+import json
+import time
+import statistics
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flask import Flask
+
+from responses import FastJSONProvider, column_records, compress_body, orjson, brotli
+
+
+def synthetic_history(days=3650, seed=7):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'date': pd.date_range('2015-01-01', periods=days, freq='D'),
+        'plays': rng.poisson(35, days),
+    })
+
+
+def synthetic_top(n=100, seed=7):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'track_key': [f'Track number {i} - Artist {i % 37}' for i in range(n)],
+        'plays': rng.integers(50, 2000, n),
+        'ms_played': rng.integers(10 ** 6, 10 ** 9, n),
+        'skip_rate': rng.random(n),
+    })
+
+
+def history_before(history):
+    rows = []
+    for _, day in history.iterrows():
+        rows.append({'date': day['date'].strftime('%Y-%m-%d'), 'plays': int(day['plays'])})
+    return rows
+
+
+def history_after(history):
+    return column_records(date=history['date'].dt.strftime('%Y-%m-%d'), plays=history['plays'])
+
+
+def top_before(top):
+    rows = []
+    for _, row in top.iterrows():
+        rows.append({
+            'track_key': row['track_key'],
+            'plays': int(row['plays']),
+            'total_hours': float(row['ms_played']) / 3_600_000,
+            'skip_rate': float(row['skip_rate']),
+            'spotify_url': '', 'image_url': '', 'preview_url': '', 'uri': '', 'id': '',
+        })
+    return rows
+
+
+def top_after(top):
+    n = len(top)
+    return column_records(
+        track_key=top['track_key'],
+        plays=top['plays'],
+        total_hours=top['ms_played'] / 3_600_000,
+        skip_rate=top['skip_rate'],
+        spotify_url=[''] * n, image_url=[''] * n, preview_url=[''] * n, uri=[''] * n, id=[''] * n,
+    )
+
+
+def timed(fn, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return result, statistics.median(timings) * 1000
+
+
+def main(runs=20):
+    app = Flask(__name__)
+    provider = FastJSONProvider(app)
+    stdlib_dumps = lambda obj: json.dumps(obj, sort_keys=True, separators=(',', ':')).encode()
+    fast_dumps = provider._dumps_bytes
+
+    print(f"encoder: {'orjson' if orjson else 'stdlib (orjson não instalado)'}  "
+          f"brotli: {'sim' if brotli else 'não'}\n")
+
+    cases = {
+        'daily_history (10 anos)': (synthetic_history(), history_before, history_after),
+        'top list (100 items)': (synthetic_top(), top_before, top_after),
+    }
+    for label, (frame, before, after) in cases.items():
+        rows_before, build_before = timed(lambda: before(frame), runs)
+        rows_after, build_after = timed(lambda: after(frame), runs)
+        assert json.loads(stdlib_dumps(rows_before)) == json.loads(fast_dumps(rows_after))
+
+        body_before, dump_before = timed(lambda: stdlib_dumps({'success': True, 'data': rows_before}), runs)
+        body_after, dump_after = timed(lambda: fast_dumps({'success': True, 'data': rows_after}), runs)
+        gzipped, gzip_ms = timed(lambda: compress_body(body_after, 'gzip'), runs)
+
+        print(f"📊 {label}")
+        print(f"  construir payload   {build_before:8.2f} ms -> {build_after:6.2f} ms")
+        print(f"  serializar          {dump_before:8.2f} ms -> {dump_after:6.2f} ms")
+        print(f"  bytes               {len(body_before):8d}    -> gzip {len(gzipped)} ({gzip_ms:.2f} ms)", end='')
+        if brotli:
+            brotli_body, brotli_ms = timed(lambda: compress_body(body_after, 'br'), runs)
+            print(f", br {len(brotli_body)} ({brotli_ms:.2f} ms)", end='')
+        print('\n')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
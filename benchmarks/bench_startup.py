@@ -0,0 +1,72 @@
+# bench_startup.py - TEMPO DE IMPORT DA APP (BOOT DE UM WORKER)
+#
+# Mede `import app` num processo novo, com e sem credenciais Spotify. Com
+# credenciais, o tráfego HTTPS vai para um proxy local que aceita a ligação
+# e nunca responde: se o boot dependesse da rede, este caso ficaria preso
+# até TIMEOUT em vez de demorar o mesmo que o caso offline.
+#
+# Uso: python benchmarks/bench_startup.py [repetições]
+
+import os
+import sys
+import time
+import socket
+import threading
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TIMEOUT = 30
+
+
+def start_blackhole():
+    """Servidor TCP que aceita ligações e nunca responde; devolve a porta"""
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen()
+    held = []
+
+    def accept_forever():
+        while True:
+            held.append(server.accept())
+
+    threading.Thread(target=accept_forever, daemon=True).start()
+    return server.getsockname()[1]
+
+
+def time_import(env):
+    start = time.perf_counter()
+    try:
+        subprocess.run(
+            [sys.executable, '-c', 'import app'],
+            cwd=ROOT, env=env, check=True, timeout=TIMEOUT,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+    except subprocess.TimeoutExpired:
+        pass
+    return time.perf_counter() - start
+
+
+def main(runs=5):
+    blackhole = f'http://127.0.0.1:{start_blackhole()}'
+    base = dict(os.environ, SPOTIFY_CLIENT_ID='', SPOTIFY_CLIENT_SECRET='')
+    cases = {
+        'sem credenciais (offline)': base,
+        'com credenciais, rede inacessível': dict(
+            base,
+            SPOTIFY_CLIENT_ID='bench-client-id',
+            SPOTIFY_CLIENT_SECRET='bench-client-secret',
+            HTTPS_PROXY=blackhole,
+            SPOTIFY_APP_TOKEN_CACHE=os.devnull
+        ),
+    }
+
+    for label, env in cases.items():
+        timings = [time_import(env) for _ in range(runs)]
+        print(f"{label:<36} mediana {statistics.median(timings) * 1000:7.0f} ms  "
+              f"(min {min(timings) * 1000:.0f}, max {max(timings) * 1000:.0f})")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
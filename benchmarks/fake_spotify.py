@@ -0,0 +1,491 @@
+# fake_spotify.py - SERVIDOR LOCAL QUE IMITA A WEB API DO SPOTIFY
+#
+# Para testar e medir o enriquecimento (concorrência, cache, rate limit) sem
+# credenciais nem rede. Serve, a partir de fixtures JSON:
+#
+#   POST /api/token                 client credentials, authorization code, refresh
+#   GET  /authorize                 redirect imediato para redirect_uri?code=...
+#   GET  /v1/search                 track / artist / album (filtros track:"" artist:"" album:"")
+#   GET  /v1/tracks?ids=            e /v1/tracks/<id>   (máx. 50 ids)
+#   GET  /v1/artists?ids=           (máx. 50)          GET /v1/albums?ids= (máx. 20)
+#   GET  /v1/me, /v1/me/top/tracks
+#   POST /v1/users/<id>/playlists   POST /v1/playlists/<id>/tracks (máx. 100)  GET /v1/playlists/<id>
+#   GET  /v1/me/player/devices      PUT play/pause, POST next/previous
+#   GET  /image/<id>                PNG gerado (cor derivada do id)
+#   GET  /_stats                    contadores por endpoint (não conta para latência/429)
+#
+# Nomes ou IDs que não estão nas fixtures são sintetizados de forma
+# determinística (mesmo nome -> mesmo ID), por isso qualquer histórico
+# real resolve. --strict devolve resultados vazios / null nesses casos.
+#
+# Latência (--latency s) e 429 com Retry-After (--rate-limit-every N:
+# cada N-ésimo pedido à API) são injetados em todos os endpoints /v1.
+#
+# Ligar a app ao servidor: SPOTIFY_API_URL=http://127.0.0.1:8765 e
+# SPOTIFY_CLIENT_ID / SPOTIFY_CLIENT_SECRET com qualquer valor.
+#
+# Uso: python benchmarks/fake_spotify.py [--port 8765] [--latency 0.05]
+#          [--rate-limit-every 0] [--retry-after 1] [--fixtures path] [--strict]
+
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import struct
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, urlencode
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_FIXTURES = os.path.join(ROOT, 'fixtures', 'spotify_catalog.json')
+
+# Limites da API real (pedidos acima disto dão 400)
+MAX_IDS = {'tracks': 50, 'artists': 50, 'albums': 20}
+MAX_PLAYLIST_ITEMS = 100
+
+_FILTER = re.compile(r'(track|artist|album):"([^"]*)"')
+
+
+def fake_id(*parts):
+    """ID base62-like de 22 caracteres, estável para os mesmos nomes"""
+    digest = hashlib.sha1('|'.join(p.casefold() for p in parts).encode()).hexdigest()
+    return digest[:22]
+
+
+def solid_png(rgb, size=64):
+    """PNG size x size de uma só cor (sem dependências)"""
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body))
+
+    row = b'\x00' + bytes(rgb) * size
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(row * size))
+            + chunk(b'IEND', b''))
+
+
+# ============================================================================
+# CATÁLOGO
+# ============================================================================
+
+class Catalog:
+    """Fixtures + entidades sintetizadas, já no formato da API"""
+
+    def __init__(self, fixtures=None, base_url='', strict=False):
+        self.base_url = base_url
+        self.strict = strict
+        self.artists, self.albums, self.tracks = {}, {}, {}
+        self.playlists = {}
+        self._lock = threading.Lock()
+
+        fixtures = fixtures or {}
+        for artist in fixtures.get('artists', []):
+            self.artists[artist['id']] = artist
+        for album in fixtures.get('albums', []):
+            self.albums[album['id']] = album
+        for track in fixtures.get('tracks', []):
+            self.tracks[track['id']] = track
+
+    # --- objetos da API ---
+
+    def _images(self, entity_id):
+        url = f'{self.base_url}/image/{entity_id}'
+        return [{'url': f'{url}?size=640', 'height': 640, 'width': 640},
+                {'url': f'{url}?size=300', 'height': 300, 'width': 300},
+                {'url': f'{url}?size=64', 'height': 64, 'width': 64}]
+
+    def artist_object(self, artist_id):
+        artist = self.artists.get(artist_id)
+        if artist is None:
+            return None
+        return {
+            'id': artist_id,
+            'name': artist['name'],
+            'uri': f'spotify:artist:{artist_id}',
+            'type': 'artist',
+            'external_urls': {'spotify': f'https://open.spotify.com/artist/{artist_id}'},
+            'images': self._images(artist_id),
+            'genres': artist.get('genres', []),
+            'popularity': artist.get('popularity', 50),
+            'followers': {'href': None, 'total': artist.get('followers', 1000)},
+        }
+
+    def _artist_ref(self, artist_id):
+        artist = self.artists[artist_id]
+        return {'id': artist_id, 'name': artist['name'], 'uri': f'spotify:artist:{artist_id}',
+                'external_urls': {'spotify': f'https://open.spotify.com/artist/{artist_id}'}}
+
+    def album_object(self, album_id):
+        album = self.albums.get(album_id)
+        if album is None:
+            return None
+        return {
+            'id': album_id,
+            'name': album['name'],
+            'uri': f'spotify:album:{album_id}',
+            'type': 'album',
+            'album_type': album.get('album_type', 'album'),
+            'artists': [self._artist_ref(album['artist_id'])],
+            'external_urls': {'spotify': f'https://open.spotify.com/album/{album_id}'},
+            'images': self._images(album_id),
+            'release_date': album.get('release_date', '2020-01-01'),
+            'total_tracks': album.get('total_tracks', 10),
+            'popularity': album.get('popularity', 50),
+        }
+
+    def track_object(self, track_id):
+        track = self.tracks.get(track_id)
+        if track is None:
+            return None
+        album = self.album_object(track['album_id'])
+        album.pop('popularity', None)
+        return {
+            'id': track_id,
+            'name': track['name'],
+            'uri': f'spotify:track:{track_id}',
+            'type': 'track',
+            'artists': [self._artist_ref(track['artist_id'])],
+            'album': album,
+            'external_urls': {'spotify': f'https://open.spotify.com/track/{track_id}'},
+            'preview_url': None,
+            'popularity': track.get('popularity', 50),
+            'duration_ms': track.get('duration_ms', 200000),
+        }
+
+    # --- síntese ---
+
+    def ensure_artist(self, name, artist_id=None):
+        artist_id = artist_id or fake_id('artist', name)
+        with self._lock:
+            self.artists.setdefault(artist_id, {'id': artist_id, 'name': name})
+        return artist_id
+
+    def ensure_album(self, name, artist_name, album_id=None):
+        artist_id = self.ensure_artist(artist_name)
+        album_id = album_id or fake_id('album', name, artist_name)
+        with self._lock:
+            self.albums.setdefault(album_id, {'id': album_id, 'name': name, 'artist_id': artist_id})
+        return album_id
+
+    def ensure_track(self, name, artist_name, track_id=None):
+        artist_id = self.ensure_artist(artist_name)
+        album_id = self.ensure_album(f'{name} (Single)', artist_name)
+        track_id = track_id or fake_id('track', name, artist_name)
+        with self._lock:
+            self.tracks.setdefault(track_id, {
+                'id': track_id, 'name': name, 'artist_id': artist_id, 'album_id': album_id
+            })
+        return track_id
+
+    def lookup(self, kind, entity_id):
+        """Objeto por ID; IDs desconhecidos são sintetizados (exceto em strict)"""
+        table = {'tracks': self.tracks, 'artists': self.artists, 'albums': self.albums}[kind]
+        if entity_id not in table:
+            if self.strict:
+                return None
+            if kind == 'tracks':
+                self.ensure_track(f'Track {entity_id[:6]}', f'Artist {entity_id[:4]}', entity_id)
+            elif kind == 'artists':
+                self.ensure_artist(f'Artist {entity_id[:6]}', entity_id)
+            else:
+                self.ensure_album(f'Album {entity_id[:6]}', f'Artist {entity_id[:4]}', entity_id)
+        return {'tracks': self.track_object, 'artists': self.artist_object,
+                'albums': self.album_object}[kind](entity_id)
+
+    def search(self, query, kind, limit):
+        filters = {key: value for key, value in _FILTER.findall(query)}
+        free_text = _FILTER.sub('', query).strip()
+
+        def matches(name, wanted):
+            return wanted is None or name.casefold() == wanted.casefold()
+
+        results = []
+        if kind == 'track':
+            name = filters.get('track') or free_text
+            for track_id, track in list(self.tracks.items()):
+                artist = self.artists[track['artist_id']]['name']
+                if matches(track['name'], name) and matches(artist, filters.get('artist')):
+                    results.append(self.track_object(track_id))
+            if not results and not self.strict and name:
+                results.append(self.track_object(self.ensure_track(name, filters.get('artist', 'Unknown'))))
+        elif kind == 'artist':
+            name = filters.get('artist') or free_text
+            for artist_id, artist in list(self.artists.items()):
+                if matches(artist['name'], name):
+                    results.append(self.artist_object(artist_id))
+            if not results and not self.strict and name:
+                results.append(self.artist_object(self.ensure_artist(name)))
+        elif kind == 'album':
+            name = filters.get('album') or free_text
+            for album_id, album in list(self.albums.items()):
+                artist = self.artists[album['artist_id']]['name']
+                if matches(album['name'], name) and matches(artist, filters.get('artist')):
+                    results.append(self.album_object(album_id))
+            if not results and not self.strict and filters.get('album'):
+                album_id = self.ensure_album(filters['album'], filters.get('artist', 'Unknown'))
+                results.append(self.album_object(album_id))
+
+        items = results[:limit]
+        return {f'{kind}s': {'items': items, 'total': len(results), 'limit': limit, 'offset': 0}}
+
+
+# ============================================================================
+# SERVIDOR
+# ============================================================================
+
+class FakeSpotifyServer:
+    """ThreadingHTTPServer numa thread daemon; start() devolve o URL base"""
+
+    def __init__(self, fixtures=None, host='127.0.0.1', port=0, latency=0.0,
+                 rate_limit_every=0, retry_after=1, strict=False):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.catalog = Catalog(fixtures, strict=strict)
+        self.stats = {'requests': 0, 'rate_limited': 0, 'by_endpoint': {}}
+        self.player = {'is_playing': False, 'uris': [], 'position': 0}
+        self._lock = threading.Lock()
+        self._token_count = 0
+
+        server = self
+
+        class Handler(_Handler):
+            fake = server
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f'http://{host}:{self.httpd.server_address[1]}'
+        self.catalog.base_url = self.url
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name='fake-spotify', daemon=True).start()
+        return self.url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def count(self, endpoint):
+        """Conta o pedido; True se este deve levar 429"""
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['by_endpoint'][endpoint] = self.stats['by_endpoint'].get(endpoint, 0) + 1
+            throttle = bool(self.rate_limit_every) and self.stats['requests'] % self.rate_limit_every == 0
+            if throttle:
+                self.stats['rate_limited'] += 1
+            return throttle
+
+    def new_token(self, scope=''):
+        with self._lock:
+            self._token_count += 1
+            return {
+                'access_token': f'fake-access-{self._token_count}',
+                'token_type': 'Bearer',
+                'expires_in': 3600,
+                'scope': scope,
+                'refresh_token': 'fake-refresh',
+            }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    fake = None  # FakeSpotifyServer (definido na subclasse)
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    # --- respostas ---
+
+    def _send(self, status, body=b'', content_type='application/json', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, payload, status=200):
+        self._send(status, json.dumps(payload).encode())
+
+    def _error(self, status, message, headers=None):
+        body = json.dumps({'error': {'status': status, 'message': message}}).encode()
+        self._send(status, body, headers=headers)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    # --- dispatch ---
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def _dispatch(self, method):
+        parsed = urlparse(self.path)
+        path = parsed.path.rstrip('/') or '/'
+        query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        body = self._body()
+
+        if path == '/_stats':
+            return self._json(self.fake.stats)
+        if path.startswith('/image/'):
+            digest = hashlib.md5(path.encode()).digest()
+            return self._send(200, solid_png(digest[:3]), 'image/png',
+                              {'Cache-Control': 'public, max-age=86400'})
+        if path == '/authorize':
+            target = f"{query.get('redirect_uri', '/')}?{urlencode({'code': 'fake-code', 'state': query.get('state', '')})}"
+            return self._send(302, headers={'Location': target})
+        if path == '/api/token' and method == 'POST':
+            form = {key: values[-1] for key, values in parse_qs(body.decode()).items()}
+            return self._json(self.fake.new_token(form.get('scope', query.get('scope', ''))))
+
+        if not path.startswith('/v1/'):
+            return self._error(404, 'Not found')
+        if not (self.headers.get('Authorization') or '').startswith('Bearer '):
+            return self._error(401, 'No token provided')
+
+        endpoint = f"{method} {re.sub(r'/[A-Za-z0-9]{16,}', '/{id}', path[3:])}"
+        if self.fake.count(endpoint):
+            return self._error(429, 'API rate limit exceeded',
+                               {'Retry-After': str(self.fake.retry_after)})
+        if self.fake.latency:
+            time.sleep(self.fake.latency)
+
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError:
+            return self._error(400, 'Invalid JSON')
+        self._route(method, path[3:], query, payload)
+
+    def _route(self, method, path, query, payload):
+        catalog = self.fake.catalog
+        parts = path.strip('/').split('/')
+
+        if method == 'GET' and parts == ['search']:
+            kind = query.get('type', 'track').split(',')[0]
+            limit = min(int(query.get('limit', 10)), 50)
+            return self._json(catalog.search(query.get('q', ''), kind, limit))
+
+        if method == 'GET' and parts[0] in MAX_IDS:
+            kind = parts[0]
+            if len(parts) == 2:
+                entity = catalog.lookup(kind, parts[1])
+                return self._json(entity) if entity else self._error(404, 'Non existing id')
+            ids = [i for i in query.get('ids', '').split(',') if i]
+            if not ids or len(ids) > MAX_IDS[kind]:
+                return self._error(400, 'Invalid number of ids')
+            return self._json({kind: [catalog.lookup(kind, i) for i in ids]})
+
+        if method == 'GET' and parts == ['me']:
+            return self._json({'id': 'fake-user', 'display_name': 'Fake User',
+                               'uri': 'spotify:user:fake-user', 'product': 'premium'})
+
+        if method == 'GET' and parts == ['me', 'top', 'tracks']:
+            limit = min(int(query.get('limit', 20)), 50)
+            items = [catalog.track_object(i) for i in list(catalog.tracks)[:limit]]
+            return self._json({'items': items, 'total': len(items), 'limit': limit, 'offset': 0})
+
+        if method == 'POST' and len(parts) == 3 and parts[0] == 'users' and parts[2] == 'playlists':
+            playlist_id = fake_id('playlist', str(time.time_ns()))
+            playlist = {
+                'id': playlist_id,
+                'name': payload.get('name', 'New Playlist'),
+                'description': payload.get('description', ''),
+                'public': payload.get('public', True),
+                'uri': f'spotify:playlist:{playlist_id}',
+                'external_urls': {'spotify': f'https://open.spotify.com/playlist/{playlist_id}'},
+                'owner': {'id': parts[1]},
+                'tracks': {'items': [], 'total': 0},
+            }
+            catalog.playlists[playlist_id] = playlist
+            return self._json(playlist, status=201)
+
+        if len(parts) >= 2 and parts[0] == 'playlists':
+            playlist = catalog.playlists.get(parts[1])
+            if playlist is None:
+                return self._error(404, 'Not found')
+            if method == 'GET' and len(parts) == 2:
+                return self._json(playlist)
+            if method == 'POST' and parts[2:] == ['tracks']:
+                # spotipy manda a lista de URIs como corpo; a API também aceita {"uris": [...]}
+                uris = payload if isinstance(payload, list) else payload.get('uris') or []
+                if len(uris) > MAX_PLAYLIST_ITEMS:
+                    return self._error(400, 'You can add a maximum of 100 tracks per request.')
+                playlist['tracks']['items'].extend({'track': {'uri': uri}} for uri in uris)
+                playlist['tracks']['total'] = len(playlist['tracks']['items'])
+                return self._json({'snapshot_id': fake_id('snapshot', str(time.time_ns()))}, status=201)
+
+        if parts[:2] == ['me', 'player']:
+            return self._player(method, parts[2:], payload)
+
+        return self._error(404, 'Service not found')
+
+    def _player(self, method, action, payload):
+        player = self.fake.player
+        if method == 'GET' and action == ['devices']:
+            return self._json({'devices': [{'id': 'fake-device', 'is_active': True, 'name': 'Fake Speaker',
+                                            'type': 'Computer', 'volume_percent': 50}]})
+        if method == 'GET' and action in ([], ['currently-playing']):
+            return self._json({'is_playing': player['is_playing'], 'item': None,
+                               'progress_ms': player['position']})
+        if method == 'PUT' and action == ['play']:
+            if payload.get('uris'):
+                player['uris'] = payload['uris']
+            player['is_playing'] = True
+        elif method == 'PUT' and action == ['pause']:
+            player['is_playing'] = False
+        elif method == 'POST' and action in (['next'], ['previous']):
+            player['position'] = 0
+        else:
+            return self._error(404, 'Service not found')
+        return self._send(204)
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def load_fixtures(path):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Servidor local que imita a Web API do Spotify')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='segundos por pedido /v1')
+    parser.add_argument('--rate-limit-every', type=int, default=0, help='429 a cada N pedidos (0 = nunca)')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After dos 429 (segundos)')
+    parser.add_argument('--fixtures', default=DEFAULT_FIXTURES)
+    parser.add_argument('--strict', action='store_true', help='não sintetizar nomes/IDs desconhecidos')
+    args = parser.parse_args(argv)
+
+    server = FakeSpotifyServer(
+        load_fixtures(args.fixtures), host=args.host, port=args.port, latency=args.latency,
+        rate_limit_every=args.rate_limit_every, retry_after=args.retry_after, strict=args.strict
+    )
+    print(f"🎭 Fake Spotify API em {server.url}  (SPOTIFY_API_URL={server.url})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -13,6 +13,8 @@ class Config:
     SPOTIFY_CLIENT_ID = os.environ.get('SPOTIFY_CLIENT_ID')
     SPOTIFY_CLIENT_SECRET = os.environ.get('SPOTIFY_CLIENT_SECRET')
     REDIRECT_URI = os.environ.get('REDIRECT_URI', 'https://spotifydashboard.pythonanywhere.com/callback')
+    # Base alternativa da API + accounts (p.ex. benchmarks/fake_spotify.py); vazio = Spotify real
+    SPOTIFY_API_URL = os.environ.get('SPOTIFY_API_URL', '')
     
     # Flask
     SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-key-CHANGE')
@@ -22,5 +24,67 @@ class Config:
     MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 100MB
     ALLOWED_EXTENSIONS = {'json'}
     
+    # Analytics: 'exact' (DataFrame completo) ou 'sketch' (aproximado, ~250KB/user;
+    # tops filtrados continuam a usar o DataFrame, ver sketches.py)
+    ANALYTICS_MODE = os.environ.get('ANALYTICS_MODE', 'exact')
+    
+    # Cache de metadata do Spotify (SQLite partilhado entre workers)
+    METADATA_CACHE_PATH = os.environ.get(
+        'METADATA_CACHE_PATH', os.path.join(UPLOAD_FOLDER, 'metadata_cache.sqlite')
+    )
+    METADATA_TTL = int(os.environ.get('METADATA_TTL', 30 * 24 * 60 * 60))  # 30 dias
+    METADATA_NEGATIVE_TTL = int(os.environ.get('METADATA_NEGATIVE_TTL', 24 * 60 * 60))  # 1 dia
+    METADATA_MEMORY_MAX = int(os.environ.get('METADATA_MEMORY_MAX', 50_000))  # L1 (LRU) por worker
+    
+    # Enriquecimento concorrente (thread pool + token bucket partilhado)
+    ENRICH_MAX_WORKERS = int(os.environ.get('ENRICH_MAX_WORKERS', 8))
+    SPOTIFY_RATE_LIMIT = float(os.environ.get('SPOTIFY_RATE_LIMIT', 10))  # pedidos/s
+    SPOTIFY_RATE_BURST = int(os.environ.get('SPOTIFY_RATE_BURST', 50))  # uma top list fria numa rajada
+    
+    # Token de client credentials partilhado entre workers (evita 1 pedido por boot)
+    SPOTIFY_APP_TOKEN_CACHE = os.environ.get(
+        'SPOTIFY_APP_TOKEN_CACHE', os.path.join(UPLOAD_FOLDER, '.spotify_app_token')
+    )
+    
+    # Pool HTTP partilhado por todos os clientes Spotify (threads gunicorn + pool de enriquecimento)
+    SPOTIFY_POOL_SIZE = int(os.environ.get('SPOTIFY_POOL_SIZE', 16))
+    
+    # Clientes OAuth por utilizador: refresh antes de expirar, esquecidos após inatividade
+    OAUTH_REFRESH_MARGIN = int(os.environ.get('OAUTH_REFRESH_MARGIN', 5 * 60))
+    OAUTH_CLIENT_IDLE_TTL = int(os.environ.get('OAUTH_CLIENT_IDLE_TTL', 60 * 60))
+    
+    # Resiliência da API Spotify (Retry-After + circuit breaker partilhado)
+    SPOTIFY_BREAKER_THRESHOLD = int(os.environ.get('SPOTIFY_BREAKER_THRESHOLD', 5))  # falhas seguidas
+    SPOTIFY_BREAKER_RESET = float(os.environ.get('SPOTIFY_BREAKER_RESET', 30))  # segundos aberto
+    SPOTIFY_MAX_RETRY_WAIT = float(os.environ.get('SPOTIFY_MAX_RETRY_WAIT', 2))  # espera máx. em linha
+    
+    # ETag + Cache-Control privado dos endpoints de análise (segundos até revalidar)
+    ANALYTICS_CACHE_MAX_AGE = int(os.environ.get('ANALYTICS_CACHE_MAX_AGE', 60))
+    # Versão do código nas ETags; sem RELEASE_ID usa-se o mtime dos .py/templates/static
+    RELEASE_ID = os.environ.get('RELEASE_ID') or os.environ.get('HEROKU_RELEASE_VERSION')
+    
+    # Respostas comprimidas (gzip/brotli) só a partir deste tamanho (bytes)
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    
+    # Datasets partilhados entre workers (segmentos mapeados em memória, 1 load por host)
+    SHARED_STORE_ENABLED = os.environ.get('SHARED_STORE_ENABLED', '1').lower() not in ('0', 'false', 'no')
+    SHARED_STORE_DIR = os.environ.get(
+        'SHARED_STORE_DIR',
+        '/dev/shm/spotify_dashboard' if os.path.isdir('/dev/shm') else os.path.join(UPLOAD_FOLDER, '.shared_store')
+    )
+    SHARED_STORE_IDLE_TTL = int(os.environ.get('SHARED_STORE_IDLE_TTL', 6 * 60 * 60))  # sem workers a usar
+    
+    # Warm-up no arranque (create_app): utilizadores ativos recentemente
+    WARMUP_ENABLED = os.environ.get('WARMUP_ENABLED', '1').lower() not in ('0', 'false', 'no')
+    WARMUP_USERS = int(os.environ.get('WARMUP_USERS', 20))
+    WARMUP_MAX_AGE = int(os.environ.get('WARMUP_MAX_AGE', 7 * 24 * 60 * 60))  # ativos na última semana
+    
+    # Proxy de capas (/api/image): cache em disco endereçada por conteúdo + miniaturas
+    IMAGE_PROXY_ENABLED = os.environ.get('IMAGE_PROXY_ENABLED', '1').lower() not in ('0', 'false', 'no')
+    IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', os.path.join(UPLOAD_FOLDER, 'image_cache'))
+    IMAGE_THUMB_SIZE = int(os.environ.get('IMAGE_THUMB_SIZE', 128))  # tiles de 40px em ecrãs 3x
+    IMAGE_CACHE_MAX_AGE = int(os.environ.get('IMAGE_CACHE_MAX_AGE', 365 * 24 * 60 * 60))
+    IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024))  # objects + thumbs + refs
+    
     # Session
     PERMANENT_SESSION_LIFETIME = timedelta(hours=24)
@@ -22,6 +22,8 @@ from spotify_api import SpotifyEnhancer
 
 # Variável global para armazenar a instância
 _spotify_enhancer = None
+# resolve_metadata da app: o único caminho de enriquecimento (cache partilhada)
+_metadata_resolver = None
 
 def set_spotify_enhancer(enhancer):
     """Define a instância do SpotifyEnhancer"""
@@ -32,6 +34,11 @@ def get_spotify_enhancer():
     """Retorna a instância do SpotifyEnhancer"""
     return _spotify_enhancer
 
+def set_metadata_resolver(resolver):
+    """Define resolver(data_type, items) -> [metadata | None] (app.resolve_metadata)"""
+    global _metadata_resolver
+    _metadata_resolver = resolver
+
 
 
 # ============================================================================
@@ -40,8 +47,7 @@ def get_spotify_enhancer():
 
 JSON_FOLDER = None
 
-# Cache global otimizado
-METADATA_CACHE = {}
+# Cache global otimizado (metadata do Spotify vive no store persistente, ver metadata_cache.py)
 PROCESSED_CACHE = {}
 
 logger = logging.getLogger(__name__)
@@ -474,7 +480,7 @@ def top_tracks_ultra_fast(df, n=10):
     
     # Aggregação vectorizada
     result = (
-        df.groupby('track_key', sort=False)
+        df.groupby('track_key', sort=False, observed=True)
         .agg({
             'is_play': 'sum',
             'is_skip': 'sum',
@@ -577,7 +583,7 @@ def daily_history_optimized(df):
     
     # Todos os registos já são plays válidos (filtrados em filter_music)
     daily_counts = (
-        df.groupby('date', sort=True)
+        df.groupby('date', sort=True, observed=True)
         .size()
         .reset_index(name='plays')
     )
@@ -618,7 +624,7 @@ def repeat_spirals_correct(df, n=10):
     
     # Contar dias únicos por track (100% vectorizado)
     track_unique_days = (
-        df.groupby('track_key', sort=False)['date']
+        df.groupby('track_key', sort=False, observed=True)['date']
         .nunique()
         .sort_values(ascending=False)
         .head(n)
@@ -631,6 +637,28 @@ def repeat_spirals_correct(df, n=10):
     return result
 
 
+def longest_daily_streaks(df):
+    """
+    Series track_key -> maior nº de dias seguidos com plays (ordenada por track)
+    
+    Pares (track, dia) distintos e ordenados; um "run" começa quando muda a
+    track ou o dia não é o seguinte ao anterior. Tamanho de cada run via
+    bincount e máximo por track, tudo em arrays.
+    """
+    pairs = pd.DataFrame({
+        'track_key': df['track_key'].to_numpy(),
+        'day': df['ts'].to_numpy().astype('datetime64[D]').astype('int64'),
+    }).drop_duplicates().sort_values(['track_key', 'day'])
+    tracks = pairs['track_key'].to_numpy()
+    days = pairs['day'].to_numpy()
+    
+    new_run = np.ones(len(days), dtype=bool)
+    new_run[1:] = (tracks[1:] != tracks[:-1]) | (days[1:] - days[:-1] != 1)
+    run_ids = np.cumsum(new_run)
+    run_lengths = np.bincount(run_ids)[run_ids]
+    return pd.Series(run_lengths, index=tracks).groupby(level=0, sort=False).max()
+
+
 def repeat_days_consecutive(df, n=10):
     """
     REPEAT DAYS: Número máximo de dias CONSECUTIVOS que uma música foi ouvida
@@ -644,43 +672,12 @@ def repeat_days_consecutive(df, n=10):
     if cache_key in PROCESSED_CACHE:
         return PROCESSED_CACHE[cache_key]
     
-    # Obter datas únicas por track (vectorizado)
-    track_dates = df.groupby('track_key', sort=False)['date'].apply(
-        lambda x: sorted(x.unique())
-    ).reset_index()
-    
-    consecutive_counts = {}
-    
-    # Calcular sequências consecutivas (otimizado com NumPy)
-    for _, row in track_dates.iterrows():
-        track_key = row['track_key']
-        dates = row['date']
-        
-        if len(dates) == 0:
-            continue
-        
-        if len(dates) == 1:
-            consecutive_counts[track_key] = 1
-            continue
-        
-        # Converter para numpy array para performance
-        dates_array = np.array([d.toordinal() for d in dates])
-        
-        # Calcular diferenças entre dias consecutivos
-        diffs = np.diff(dates_array)
-        
-        # Encontrar onde não é consecutivo (diff != 1)
-        splits = np.where(diffs != 1)[0] + 1
-        
-        # Split em sequências consecutivas
-        sequences = np.split(dates_array, splits)
-        
-        # Encontrar maior sequência
-        max_consecutive = max(len(seq) for seq in sequences)
-        consecutive_counts[track_key] = max_consecutive
+    # Maior sequência de dias seguidos por track (vectorizado, sem loop por track)
+    streaks = longest_daily_streaks(df)
     
     # Ordenar e retornar top n
-    result = sorted(consecutive_counts.items(), key=lambda x: x[1], reverse=True)[:n]
+    top = streaks.sort_values(ascending=False, kind='stable').head(n)
+    result = list(zip(top.index.tolist(), top.tolist()))
     PROCESSED_CACHE[cache_key] = result
     
     logger.info(f"📅 Repeat days: top {len(result)} tracks calculados")
@@ -717,7 +714,7 @@ def viciado_tracks_sessions(df, n=10):
     
     # Contar plays por track por sessão
     session_track_counts = (
-        df_sorted.groupby(['session_id', 'track_key'], sort=False)
+        df_sorted.groupby(['session_id', 'track_key'], sort=False, observed=True)
         .size()
         .reset_index(name='plays_in_session')
     )
@@ -726,7 +723,7 @@ def viciado_tracks_sessions(df, n=10):
     multiple_plays = session_track_counts[session_track_counts['plays_in_session'] > 1]
     
     viciado_counts = (
-        multiple_plays.groupby('track_key', sort=False)
+        multiple_plays.groupby('track_key', sort=False, observed=True)
         .size()
         .sort_values(ascending=False)
         .head(n)
@@ -745,8 +742,11 @@ def viciado_tracks_sessions(df, n=10):
 
 def enrich_with_spotify_metadata_fast(df, item_type='track', max_items=100):
     """
-    Enriquece APENAS os top 5 items com metadata da API do Spotify
-    Resto fica sem metadata para manter performance alta
+    Enriquece os top max_items com metadata do Spotify
+
+    Usa o mesmo resolver dos endpoints (set_metadata_resolver): mesmas chaves
+    de cache, lotes por URI e regras de cache negativo. Sem resolver
+    registado os items ficam sem metadata.
     """
     if df.empty:
         return df
@@ -754,77 +754,43 @@ def enrich_with_spotify_metadata_fast(df, item_type='track', max_items=100):
     df_top = df.head(max_items).copy()
     df_rest = df.iloc[max_items:].copy() if len(df) > max_items else pd.DataFrame()
     
-    enriched_items = []
+    items = df_top.to_dict('records')
+    lookups = [None] * len(items)
+    if _metadata_resolver is not None:
+        try:
+            lookups = _metadata_resolver(item_type, items)
+        except Exception as e:
+            logger.warning(f"Spotify metadata unavailable: {e}")
     
-    # Processar top 5 com API do Spotify
-    for idx, row in df_top.iterrows():
-        cache_key = None
-        metadata = None
-        
-        if item_type == 'track':
-            cache_key = f"track:{row.get('track_key', '')}"
-            if cache_key not in METADATA_CACHE:
-                track_artist = str(row.get('track_key', '')).split(' - ', 1)
-                track_name = track_artist[0] if len(track_artist) > 0 else ''
-                artist_name = track_artist[1] if len(track_artist) > 1 else ''
-                
-                enhancer = get_spotify_enhancer()
-                if enhancer and enhancer.api_available:
-                    metadata = enhancer.search_track_metadata(track_name, artist_name)
-
-            else:
-                metadata = METADATA_CACHE[cache_key]
-        
-        elif item_type == 'artist':
-            artist_name = str(row.get('artist_key', ''))
-            cache_key = f"artist:{artist_name}"
-            if cache_key not in METADATA_CACHE:
-                enhancer = get_spotify_enhancer()
-                if enhancer and enhancer.api_available:
-                    metadata = enhancer.search_artist_metadata(artist_name)
-
-            else:
-                metadata = METADATA_CACHE[cache_key]
-        
-        elif item_type == 'album':
-            album_name = str(row.get('album_key', ''))
-            cache_key = f"album:{album_name}"
-            if cache_key not in METADATA_CACHE:
-                enhancer = get_spotify_enhancer()
-            if enhancer and enhancer.api_available:
-                metadata = enhancer.search_album_metadata(album_name, "")
-
-            else:
-                metadata = METADATA_CACHE[cache_key]
-        
-        enriched_item = row.to_dict()
+    enriched_items = []
+    for enriched_item, metadata in zip(items, lookups):
         if metadata:
             enriched_item.update({
                 'image_url': metadata.get('image_url'),
                 'spotify_url': metadata.get('spotify_url'),
-                'spotify_id': metadata.get('spotify_url', '').split('/')[-1] if metadata.get('spotify_url') else None,
+                'spotify_id': metadata.get('id'),
                 'enhanced_name': metadata.get('name'),
                 'enhanced_artist': metadata.get('artist'),
                 'preview_url': metadata.get('preview_url')
             })
-        
         enriched_items.append(enriched_item)
     
-    # Resto sem API (para manter performance)
+    enriched = pd.DataFrame(enriched_items)
+    
+    # Resto sem API (para manter performance): colunas atribuídas de uma vez
     if not df_rest.empty:
-        for idx, row in df_rest.iterrows():
-            enriched_item = row.to_dict()
-            enriched_item.update({
-                'image_url': None,
-                'spotify_url': f'https://open.spotify.com/search/{row.get("track_key", "")}',
-                'spotify_id': None,
-                'enhanced_name': None,
-                'enhanced_artist': None,
-                'preview_url': None
-            })
-            enriched_items.append(enriched_item)
+        search_keys = df_rest['track_key'].astype(str) if 'track_key' in df_rest else ''
+        df_rest = df_rest.assign(
+            image_url=None,
+            spotify_url='https://open.spotify.com/search/' + search_keys,
+            spotify_id=None,
+            enhanced_name=None,
+            enhanced_artist=None,
+            preview_url=None
+        )
+        enriched = pd.concat([enriched, df_rest], ignore_index=True)
     
-    return pd.DataFrame(enriched_items)
+    return enriched
 
 
 # ============================================================================
@@ -965,7 +931,7 @@ def normalize_album_names(df):
         # Usar o nome mais comum como canonical
         if len(similar_albums) > 1:
             # Contar plays de cada variante
-            counts = df[df['master_metadata_album_album_name'].isin(similar_albums)].groupby('master_metadata_album_album_name').size()
+            counts = df[df['master_metadata_album_album_name'].isin(similar_albums)].groupby('master_metadata_album_album_name', observed=True).size()
             canonical = counts.idxmax()  # Nome com mais plays
             
             for variant in similar_albums:
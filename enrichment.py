@@ -0,0 +1,196 @@
+# enrichment.py - ENRIQUECIMENTO CONCORRENTE COM RATE LIMIT
+#
+# Pesquisas ao Spotify são I/O puro: em vez de 50 chamadas em série, correm
+# num thread pool limitado. Todas as threads (e todos os pedidos do mesmo
+# processo) partilham um token bucket, por isso a taxa total para a API fica
+# em SPOTIFY_RATE_LIMIT pedidos/s, com rajadas até SPOTIFY_RATE_BURST.
+#
+# enrich_unique() deduplica as chaves antes de submeter e devolve os
+# resultados na ordem de entrada.
+#
+# Single-flight: pedidos concorrentes (threads gthread diferentes, p.ex.
+# tracks + repeat days + spirals do mesmo dashboard) que procuram a mesma
+# chave ao mesmo tempo esperam pela chamada que já está a decorrer em vez de
+# a repetir. Os pedidos poupados contam em get_single_flight().stats.
+
+import time
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+# RATE LIMIT
+# ============================================================================
+
+class TokenBucket:
+    """Token bucket thread-safe: rate tokens/s, no máximo capacity acumulados"""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Bloqueia até haver um token disponível"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# ============================================================================
+# SINGLE-FLIGHT
+# ============================================================================
+
+class SingleFlight:
+    """Coalesce chamadas concorrentes com a mesma chave numa só (por processo)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}  # key -> Future
+        self.stats = {'calls': 0, 'deduplicated': 0}
+
+    def _claim(self, keys):
+        """Divide keys em (minhas, {key: future de outra thread})"""
+        owned, waiting = [], {}
+        with self._lock:
+            for key in keys:
+                future = self._in_flight.get(key)
+                if future is None:
+                    self._in_flight[key] = Future()
+                    owned.append(key)
+                else:
+                    waiting[key] = future
+            self.stats['calls'] += len(owned)
+            self.stats['deduplicated'] += len(waiting)
+        return owned, waiting
+
+    def _settle(self, keys, results=None, error=None):
+        with self._lock:
+            futures = [self._in_flight.pop(key) for key in keys]
+        for key, future in zip(keys, futures):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(results.get(key))
+
+    def do(self, key, fn):
+        """fn() uma só vez para chamadas simultâneas com a mesma key"""
+        owned, waiting = self._claim([key])
+        if waiting:
+            return waiting[key].result()
+        try:
+            result = fn()
+        except Exception as e:
+            self._settle(owned, error=e)
+            raise
+        self._settle(owned, {key: result})
+        return result
+
+    def do_many(self, keys, fetch_many):
+        """
+        Versão em lote: fetch_many(keys_livres) -> {key: valor}
+
+        Só as keys que ninguém está a buscar vão a fetch_many; as restantes
+        esperam pela thread dona. Keys sem valor (ou cujo lote falhou
+        noutra thread) ficam de fora do resultado.
+        """
+        owned, waiting = self._claim(list(dict.fromkeys(keys)))
+        results = {}
+        if owned:
+            try:
+                results = fetch_many(owned)
+            except Exception as e:
+                self._settle(owned, error=e)
+                raise
+            self._settle(owned, results)
+
+        for key, future in waiting.items():
+            try:
+                value = future.result()
+            except Exception:
+                continue
+            if value is not None:
+                results[key] = value
+        return results
+
+
+_SINGLE_FLIGHT = SingleFlight()
+
+
+def get_single_flight():
+    """Single-flight partilhado pelas pesquisas de metadata deste processo"""
+    return _SINGLE_FLIGHT
+
+
+# ============================================================================
+# ENGINE
+# ============================================================================
+
+_STATE = {'executor': None, 'limiter': None}
+_STATE_LOCK = threading.Lock()
+
+
+def _config():
+    from config import Config
+    return Config
+
+
+def get_rate_limiter():
+    """Token bucket partilhado por todas as chamadas à API deste processo"""
+    with _STATE_LOCK:
+        if _STATE['limiter'] is None:
+            config = _config()
+            _STATE['limiter'] = TokenBucket(config.SPOTIFY_RATE_LIMIT, config.SPOTIFY_RATE_BURST)
+        return _STATE['limiter']
+
+
+def _get_executor():
+    with _STATE_LOCK:
+        if _STATE['executor'] is None:
+            _STATE['executor'] = ThreadPoolExecutor(
+                max_workers=_config().ENRICH_MAX_WORKERS,
+                thread_name_prefix='enrich'
+            )
+        return _STATE['executor']
+
+
+def enrich_unique(keys, fetch):
+    """
+    Corre fetch(key) uma vez por chave distinta, em paralelo
+
+    Args:
+        keys: lista de chaves hashable (p.ex. (track, artist)), pode ter repetidas
+        fetch: função I/O; exceções ficam isoladas na sua chave (resultado None)
+
+    Returns:
+        lista de resultados alinhada com keys
+    """
+    unique = list(dict.fromkeys(keys))
+    if not unique:
+        return []
+
+    def safe_fetch(key):
+        try:
+            return fetch(key)
+        except Exception as e:
+            logger.error(f"Enrichment failed for {key}: {e}")
+            return None
+
+    if len(unique) == 1:
+        results = {unique[0]: safe_fetch(unique[0])}
+    else:
+        results = dict(zip(unique, _get_executor().map(safe_fetch, unique)))
+
+    return [results[key] for key in keys]
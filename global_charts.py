@@ -0,0 +1,299 @@
+# global_charts.py - CHARTS GLOBAIS (TODOS OS UTILIZADORES)
+#
+# Map-reduce sobre resumos compactos por utilizador:
+#
+# - MAP: cada utilizador tem um chart_summary.pkl na sua pasta com vetores
+#   (track -> plays, artist -> plays, dia -> plays). Gerado a partir dos
+#   agregados, nunca das linhas raw quando o índice é servido.
+# - REDUCE: soma dos resumos num índice global (global_charts.pkl).
+#
+# Atualização incremental: quando os dados de um utilizador mudam, o índice
+# subtrai o resumo antigo e soma o novo (delta), sem tocar nos outros.
+# Reconstrução completa (p.ex. 1ª vez) corre em paralelo num process pool,
+# só a partir da CLI, nunca num pedido nem no boot: sem índice, os pedidos
+# recebem um índice vazio.
+#
+# Uso standalone: python global_charts.py  → reconstrói o índice
+
+import os
+import time
+import fcntl
+import heapq
+import logging
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import date
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+# CONFIGURAÇÃO
+# ============================================================================
+
+SUMMARY_FILENAME = 'chart_summary.pkl'
+INDEX_FILENAME = 'global_charts.pkl'
+LOCK_FILENAME = 'global_charts.lock'
+
+# Cache do índice em memória (por processo), invalidado pelo mtime do ficheiro
+_INDEX_CACHE = {'mtime': None, 'index': None}
+
+
+# ============================================================================
+# RESUMOS POR UTILIZADOR (MAP)
+# ============================================================================
+
+def build_user_summary(aggregates, source_version=None):
+    """
+    Resumo compacto a partir de DatasetAggregates
+
+    Args:
+        aggregates: DatasetAggregates do utilizador
+        source_version: file_version() do processed_data.pkl de origem
+    """
+    summary = {
+        'source_version': source_version,
+        'n_rows': aggregates.n_rows,
+        'tracks': {},
+        'artists': {},
+        'daily': {},
+    }
+
+    for kind, field in (('track', 'tracks'), ('artist', 'artists')):
+        if kind not in aggregates.entities:
+            continue
+        labels = aggregates.entities[kind].labels
+        plays = aggregates.entity_vector(kind)
+        nonzero = plays > 0
+        summary[field] = dict(zip(labels[nonzero].tolist(), plays[nonzero].astype(int).tolist()))
+
+    for offset, plays in enumerate(aggregates.daily_plays.tolist()):
+        if plays:
+            summary['daily'][aggregates.first_day + offset] = plays
+
+    return summary
+
+
+def _summary_path(upload_folder, user_id):
+    return os.path.join(upload_folder, user_id, SUMMARY_FILENAME)
+
+
+def _load_summary(upload_folder, user_id):
+    path = _summary_path(upload_folder, user_id)
+    if not os.path.exists(path):
+        return None
+    return pd.read_pickle(path)
+
+
+def _map_user(args):
+    """
+    Worker do process pool: devolve (user_id, resumo)
+
+    O resumo guardado só é reutilizado se o source_version coincidir com o
+    processed_data.pkl atual; senão (ou se não existir) é regenerado a partir
+    dele (só acontece na reconstrução, nunca ao servir charts).
+    """
+    from aggregates import build_aggregates, file_version
+
+    upload_folder, user_id = args
+    cache_file = os.path.join(upload_folder, user_id, 'processed_data.pkl')
+    version = file_version(cache_file)
+    if version is None:
+        return user_id, None
+
+    summary = _load_summary(upload_folder, user_id)
+    if summary is not None and summary['source_version'] == version:
+        return user_id, summary
+
+    df_music = pd.read_pickle(cache_file)
+    summary = build_user_summary(build_aggregates(df_music), version)
+    pd.to_pickle(summary, _summary_path(upload_folder, user_id))
+    return user_id, summary
+
+
+# ============================================================================
+# ÍNDICE GLOBAL (REDUCE)
+# ============================================================================
+
+def _empty_index():
+    return {
+        'tracks': Counter(),
+        'artists': Counter(),
+        'daily': Counter(),
+        'users': {},          # user_id -> source_version incluída
+        'updated_at': None,
+    }
+
+
+def _apply(index, summary, sign):
+    """Soma (sign=1) ou subtrai (sign=-1) um resumo ao índice"""
+    for field in ('tracks', 'artists', 'daily'):
+        totals = index[field]
+        for key, plays in summary[field].items():
+            totals[key] += sign * plays
+            if totals[key] <= 0:
+                del totals[key]
+
+
+@contextmanager
+def _index_lock(upload_folder):
+    """Lock entre processos (workers gunicorn) para escrever o índice"""
+    os.makedirs(upload_folder, exist_ok=True)
+    with open(os.path.join(upload_folder, LOCK_FILENAME), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read_index(upload_folder):
+    path = os.path.join(upload_folder, INDEX_FILENAME)
+    if not os.path.exists(path):
+        return None
+    return pd.read_pickle(path)
+
+
+def _write_index(upload_folder, index):
+    index['updated_at'] = time.time()
+    path = os.path.join(upload_folder, INDEX_FILENAME)
+    tmp_path = path + '.tmp'
+    pd.to_pickle(index, tmp_path)
+    os.replace(tmp_path, path)  # Atómico: leitores nunca veem ficheiro a meio
+
+
+def _has_dataset(folder):
+    """Pasta de utilizador = tem processed_data.pkl ou uploads JSON (não image_cache, locks...)"""
+    return any(
+        name == 'processed_data.pkl' or name.endswith(('.json', '.json.gz'))
+        for name in os.listdir(folder)
+    )
+
+
+def _user_ids(upload_folder):
+    if not os.path.exists(upload_folder):
+        return []
+    return [
+        entry.name for entry in os.scandir(upload_folder)
+        if entry.is_dir() and _has_dataset(entry.path)
+    ]
+
+
+def rebuild_global_index(upload_folder, max_workers=None):
+    """
+    Reconstrução completa: map em paralelo (process pool) + reduce
+
+    Só para a CLI: o pool usa spawn (fork num processo com threads
+    pode bloquear) e o lock é mantido do map à escrita, para que uma
+    update_user_contribution concorrente não seja sobrescrita por um resumo antigo.
+    """
+    index = _empty_index()
+
+    start = time.time()
+    with _index_lock(upload_folder):
+        user_ids = _user_ids(upload_folder)
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            for user_id, summary in pool.map(_map_user, [(upload_folder, u) for u in user_ids]):
+                if summary is None:
+                    continue
+                _apply(index, summary, 1)
+                index['users'][user_id] = summary['source_version']
+
+        _write_index(upload_folder, index)
+
+    logger.info(
+        f"🌍 Índice global reconstruído: {len(index['users'])} utilizadores, "
+        f"{len(index['tracks']):,} tracks em {time.time() - start:.1f}s"
+    )
+    return index
+
+
+def update_user_contribution(upload_folder, user_id, summary):
+    """
+    Atualização incremental: troca o resumo de um utilizador no índice
+
+    Não faz nada se esta versão já estiver incluída.
+    """
+    with _index_lock(upload_folder):
+        index = _read_index(upload_folder)
+        if index is None:
+            index = _empty_index()
+
+        if user_id in index['users'] and index['users'][user_id] == summary['source_version']:
+            return False
+
+        if user_id in index['users']:
+            previous = _load_summary(upload_folder, user_id)
+            if previous is not None:
+                _apply(index, previous, -1)
+
+        _apply(index, summary, 1)
+        index['users'][user_id] = summary['source_version']
+
+        pd.to_pickle(summary, _summary_path(upload_folder, user_id))
+        _write_index(upload_folder, index)
+
+    logger.info(f"🌍 Índice global atualizado para user {user_id[:8]}")
+    return True
+
+
+def remove_user_contribution(upload_folder, user_id):
+    """Remove um utilizador do índice (p.ex. logout apaga os dados)"""
+    with _index_lock(upload_folder):
+        index = _read_index(upload_folder)
+        if index is None or user_id not in index['users']:
+            return False
+
+        previous = _load_summary(upload_folder, user_id)
+        if previous is not None:
+            _apply(index, previous, -1)
+        del index['users'][user_id]
+        _write_index(upload_folder, index)
+
+    return True
+
+
+# ============================================================================
+# CONSULTA
+# ============================================================================
+
+def global_index_exists(upload_folder):
+    return os.path.exists(os.path.join(upload_folder, INDEX_FILENAME))
+
+
+def load_global_index(upload_folder):
+    """Índice global (memória → disco); vazio se ainda não foi construído"""
+    path = os.path.join(upload_folder, INDEX_FILENAME)
+    if not os.path.exists(path):
+        logger.warning("🌍 Índice global em falta: corre python global_charts.py")
+        return _empty_index()
+
+    mtime = os.path.getmtime(path)
+    if _INDEX_CACHE['mtime'] != mtime:
+        _INDEX_CACHE['index'] = _read_index(upload_folder)
+        _INDEX_CACHE['mtime'] = mtime
+    return _INDEX_CACHE['index']
+
+
+def global_top(index, field, n=10):
+    """[(key, plays)] mais tocados por todos os utilizadores"""
+    return heapq.nlargest(n, index[field].items(), key=lambda x: x[1])
+
+
+def global_daily(index):
+    """[(date, plays)] ordenado"""
+    epoch = date(1970, 1, 1).toordinal()
+    return [(date.fromordinal(epoch + day), plays) for day, plays in sorted(index['daily'].items())]
+
+
+if __name__ == '__main__':
+    from config import Config
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    rebuild_global_index(Config.UPLOAD_FOLDER)
+    print("✅ Global charts index rebuilt!")
@@ -0,0 +1,26 @@
+# gunicorn.conf.py - ARRANQUE COM PRELOAD + WARM-UP
+#
+# preload_app: o master importa a app (pandas, spotipy, fuzzywuzzy) e corre
+# create_app() -> warm-up dos utilizadores ativos recentemente ANTES do fork.
+# Cada worker (e cada worker reiniciado) nasce com os datasets mapeados do
+# store partilhado e os agregados já em memória, sem pico de latência.
+# Ligações de rede (SpotifyEnhancer, health probe) só nascem no post_fork.
+#
+# Uso: gunicorn "app:create_app()" -c gunicorn.conf.py
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+timeout = 120
+
+preload_app = True
+
+
+
+def post_fork(server, worker):
+    """SpotifyEnhancer do worker: sessões HTTP próprias + health probe (nada herdado do master)"""
+    from app import init_spotify_enhancer
+    init_spotify_enhancer()
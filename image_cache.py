@@ -0,0 +1,316 @@
+# image_cache.py - PROXY DE CAPAS COM CACHE EM DISCO E MINIATURAS
+#
+# As listas mostram capas de 40px, mas o browser descarregava do i.scdn.co
+# as variantes de 300/640px em cada visita. /api/image serve-as a partir
+# do disco, já reduzidas:
+#
+# - Originais endereçados pelo conteúdo (sha256): o mesmo ficheiro vindo de
+#   URLs diferentes (track e álbum partilham a capa) só é guardado 1x.
+#   Uma referência url -> digest evita voltar à rede.
+# - Miniaturas JPEG pré-calculadas (THUMB_SIZES) com Pillow; sem Pillow
+#   instalado serve-se o original.
+# - Tudo é imutável (o digest muda se a imagem mudar), por isso as respostas
+#   levam Cache-Control de 1 ano.
+#
+# O fetcher é injetável (ImageCache(fetcher=...)) para testar contra um stub
+# local; pedidos simultâneos do mesmo URL fazem uma só descarga.
+#
+# Limites: só URLs assinados pela app (proxied_url com a secret key) são
+# servidos, cada descarga pára em MAX_IMAGE_BYTES e objects/ + thumbs/ + refs/ são
+# podados por LRU (mtime, renovado a cada hit) acima de max_bytes.
+
+import os
+import io
+import hmac
+import hashlib
+import logging
+import threading
+from urllib.parse import urlparse, urlencode
+
+from enrichment import SingleFlight
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow é opcional: sem ele não há miniaturas
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+# CONFIGURAÇÃO
+# ============================================================================
+
+# Lados (px) das miniaturas; pedidos são arredondados para o tamanho acima
+THUMB_SIZES = (64, 128, 300)
+
+# CDNs de imagens do Spotify (o proxy não descarrega mais nada)
+SPOTIFY_IMAGE_HOSTS = (
+    'i.scdn.co',
+    'mosaic.scdn.co',
+    'image-cdn-ak.spotifycdn.com',
+    'image-cdn-fa.spotifycdn.com',
+)
+
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
+FETCH_TIMEOUT = 10
+FETCH_CHUNK = 64 * 1024
+
+# Poda quando já se escreveu 1/10 de max_bytes desde a última; desce até 90%
+SWEEP_EVERY_FRACTION = 10
+SWEEP_TARGET = 0.9
+
+_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF8', 'image/gif'),
+)
+
+
+class ImageUnavailable(Exception):
+    """Imagem fora dos hosts permitidos, inválida ou impossível de descarregar"""
+
+
+def sniff_mimetype(data):
+    """Tipo pela assinatura do ficheiro (não confia no Content-Type do upstream)"""
+    for signature, mimetype in _SIGNATURES:
+        if data.startswith(signature):
+            return mimetype
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+def http_fetcher(url):
+    """Fetcher por defeito: pool HTTP partilhado da app, em streaming até MAX_IMAGE_BYTES"""
+    from resilience import get_http_session
+    with get_http_session().get(url, timeout=FETCH_TIMEOUT, stream=True) as response:
+        response.raise_for_status()
+        if int(response.headers.get('Content-Length') or 0) > MAX_IMAGE_BYTES:
+            raise ImageUnavailable(f'Image too large: {url}')
+
+        data = bytearray()
+        for chunk in response.iter_content(FETCH_CHUNK):
+            data.extend(chunk)
+            if len(data) > MAX_IMAGE_BYTES:
+                raise ImageUnavailable(f'Image too large: {url}')
+    return bytes(data)
+
+
+def sign(secret, url, size):
+    """Assinatura de (url, size): só URLs emitidos pela app passam no proxy"""
+    message = f'{url}|{size or ""}'.encode()
+    return hmac.new(str(secret).encode(), message, hashlib.sha256).hexdigest()[:32]
+
+
+def valid_signature(secret, url, size, signature):
+    return bool(signature) and hmac.compare_digest(sign(secret, url, size), signature)
+
+
+def thumb_size(size):
+    """Menor miniatura >= size (None = original)"""
+    if not size:
+        return None
+    for candidate in THUMB_SIZES:
+        if size <= candidate:
+            return candidate
+    return None
+
+
+# ============================================================================
+# CACHE
+# ============================================================================
+
+class ImageCache:
+    """Originais por sha256 + miniaturas, em root/"""
+
+    def __init__(self, root, fetcher=None, allowed_hosts=SPOTIFY_IMAGE_HOSTS, max_bytes=None):
+        self.root = root
+        self.fetcher = fetcher or http_fetcher
+        self.allowed_hosts = set(allowed_hosts)
+        self.max_bytes = max_bytes  # None = sem limite
+        self._flight = SingleFlight()
+        self._sweep_lock = threading.Lock()
+        self._written = 0  # Bytes escritos desde a última poda
+        self.stats = {'hits': 0, 'fetches': 0, 'thumbnails': 0, 'evicted': 0}
+        for folder in ('refs', 'objects', 'thumbs'):
+            os.makedirs(os.path.join(root, folder), exist_ok=True)
+
+    def allowed(self, url):
+        parsed = urlparse(url or '')
+        return parsed.scheme in ('http', 'https') and parsed.netloc in self.allowed_hosts
+
+    # --- caminhos ---
+
+    def _path(self, folder, name):
+        return os.path.join(self.root, folder, name[:2], name)
+
+    def _write(self, path, data):
+        """Escrita atómica (outros workers podem estar a ler o mesmo ficheiro)"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        if self.max_bytes:
+            self._written += len(data)
+            if self._written > self.max_bytes // SWEEP_EVERY_FRACTION:
+                self.sweep()
+
+    # --- limite de espaço ---
+
+    def sweep(self):
+        """Apaga originais/miniaturas/refs menos usados (mtime) até SWEEP_TARGET * max_bytes"""
+        if not self._sweep_lock.acquire(blocking=False):
+            return  # Outra thread já está a podar
+        try:
+            self._written = 0
+            files = []
+            for folder in ('objects', 'thumbs', 'refs'):
+                for dirpath, _, names in os.walk(os.path.join(self.root, folder)):
+                    for name in names:
+                        if name.endswith('.tmp'):
+                            continue
+                        path = os.path.join(dirpath, name)
+                        try:
+                            stat = os.stat(path)
+                        except OSError:
+                            continue
+                        files.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in files)
+            target = self.max_bytes * SWEEP_TARGET
+            for _, size, path in sorted(files):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)  # Outros workers: ref sem objeto = nova descarga
+                except OSError:
+                    continue
+                total -= size
+                self.stats['evicted'] += 1
+        finally:
+            self._sweep_lock.release()
+
+    @staticmethod
+    def _touch(path):
+        """Hit renova o mtime (ordem LRU da poda); OSError se a poda já o apagou"""
+        os.utime(path)
+
+    # --- originais ---
+
+    def digest_for(self, url):
+        """sha256 do conteúdo de url; descarrega só se ainda não estiver em disco"""
+        if not self.allowed(url):
+            raise ImageUnavailable(f'Host not allowed: {url}')
+
+        ref_path = self._path('refs', hashlib.sha1(url.encode()).hexdigest())
+        try:
+            with open(ref_path) as f:
+                digest = f.read().strip()
+            if os.path.exists(self._path('objects', digest)):
+                self.stats['hits'] += 1
+                return digest
+        except OSError:
+            pass
+
+        return self._flight.do(url, lambda: self._fetch(url, ref_path))
+
+    def _forget(self, url):
+        """Apaga a ref de url: o próximo digest_for volta a descarregar"""
+        try:
+            os.remove(self._path('refs', hashlib.sha1(url.encode()).hexdigest()))
+        except OSError:
+            pass
+
+    def _fetch(self, url, ref_path):
+        try:
+            data = self.fetcher(url)
+        except Exception as e:
+            raise ImageUnavailable(f'Fetch failed for {url}: {e}') from e
+        if not data or len(data) > MAX_IMAGE_BYTES or sniff_mimetype(data) is None:
+            raise ImageUnavailable(f'Not an image: {url}')
+
+        digest = hashlib.sha256(data).hexdigest()
+        object_path = self._path('objects', digest)
+        if not os.path.exists(object_path):
+            self._write(object_path, data)
+        self._write(ref_path, digest.encode())
+        self.stats['fetches'] += 1
+        return digest
+
+    # --- miniaturas ---
+
+    def _thumbnail(self, digest, size):
+        """Caminho da miniatura size x size (gerada 1x) ou None sem Pillow"""
+        if Image is None:
+            return None
+        path = self._path('thumbs', f'{digest}_{size}.jpg')
+        if os.path.exists(path):
+            return path
+        return self._flight.do(path, lambda: self._resize(digest, size, path))
+
+    def _resize(self, digest, size, path):
+        try:
+            with Image.open(self._path('objects', digest)) as image:
+                image = flatten(image)
+                image.thumbnail((size, size), Image.LANCZOS)
+                buffer = io.BytesIO()
+                image.save(buffer, 'JPEG', quality=85, optimize=True)
+        except Exception as e:
+            logger.warning(f"Thumbnail failed for {digest}: {e}")
+            return None
+        self._write(path, buffer.getvalue())
+        self.stats['thumbnails'] += 1
+        return path
+
+    def get(self, url, size=None):
+        """
+        (caminho, mimetype, etag) da imagem para servir
+
+        size é arredondado para THUMB_SIZES; acima disso (ou sem Pillow)
+        serve o original. Lança ImageUnavailable.
+
+        A poda (outra thread/worker) pode apagar o original ou a miniatura
+        entre o lookup e a leitura: a ref é descartada e tenta-se 1x de novo.
+        """
+        size = thumb_size(size)
+        for attempt in range(2):
+            digest = self.digest_for(url)
+            try:
+                return self._locate(digest, size)
+            except OSError as e:
+                if attempt:
+                    raise ImageUnavailable(f'Image evicted while serving {url}: {e}') from e
+                self._forget(url)
+
+    def _locate(self, digest, size):
+        if size:
+            path = self._thumbnail(digest, size)
+            if path:
+                self._touch(path)
+                return path, 'image/jpeg', f'{digest[:32]}-{size}'
+
+        path = self._path('objects', digest)
+        with open(path, 'rb') as f:
+            mimetype = sniff_mimetype(f.read(16))
+        self._touch(path)
+        return path, mimetype, digest[:32]
+
+
+def flatten(image):
+    """RGB para JPEG; transparência (PNG/GIF) sobre fundo branco em vez de preto"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        rgba = image.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def proxied_url(url, size, secret, route='/api/image'):
+    """URL assinado do proxy para uma imagem (None/'' passam sem alteração)"""
+    if not url:
+        return url
+    return f"{route}?{urlencode({'url': url, 'size': size, 'sig': sign(secret, url, size)})}"
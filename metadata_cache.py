@@ -0,0 +1,212 @@
+# metadata_cache.py - CACHE PERSISTENTE DE METADATA DO SPOTIFY
+#
+# Guarda os resultados das pesquisas ao Spotify (track, artista, álbum e URI)
+# numa base SQLite partilhada por todos os workers gunicorn:
+#
+# - L1: LRU em memória por processo (METADATA_MEMORY_MAX entradas) → leituras
+#   quentes em microssegundos, sem crescer para sempre em cada worker
+# - L2: SQLite em modo WAL (leitores não bloqueiam escritores, busy_timeout
+#   para escritas concorrentes) → sobrevive a restarts e é partilhado
+#
+# Chaves normalizadas (casefold + espaços colapsados):
+#   track:<nome>|<artista>   artist:<nome>   album:<nome>|<artista>   uri:<uri>
+#
+# TTL: hits ficam METADATA_TTL segundos; misses (pesquisa sem resultados)
+# ficam guardados como negativos (valor None) durante METADATA_NEGATIVE_TTL,
+# para não repetir pesquisas que já sabemos que falham.
+
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from enrichment import get_single_flight
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+# CONFIGURAÇÃO
+# ============================================================================
+
+DEFAULT_TTL = 30 * 24 * 60 * 60          # 30 dias
+DEFAULT_NEGATIVE_TTL = 24 * 60 * 60      # 1 dia
+DEFAULT_MEMORY_MAX = 50_000              # Entradas no L1 por processo
+
+# Sentinela para "não está em cache" (None é um valor válido: miss negativo)
+MISS = object()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT,
+    expires_at REAL NOT NULL
+)
+"""
+
+
+# ============================================================================
+# CHAVES
+# ============================================================================
+
+def normalize(text):
+    """Normaliza nomes para chave (acentos compostos, casefold, espaços)"""
+    text = unicodedata.normalize('NFKC', str(text or ''))
+    return re.sub(r'\s+', ' ', text).strip().casefold()
+
+
+def track_cache_key(track_name, artist_name):
+    return f"track:{normalize(track_name)}|{normalize(artist_name)}"
+
+
+def artist_cache_key(artist_name):
+    return f"artist:{normalize(artist_name)}"
+
+
+def album_cache_key(album_name, artist_name=''):
+    return f"album:{normalize(album_name)}|{normalize(artist_name)}"
+
+
+def uri_cache_key(uri):
+    return f"uri:{uri}"
+
+
+# ============================================================================
+# STORE
+# ============================================================================
+
+class MetadataStore:
+    """Cache L1 (memória) + L2 (SQLite) com TTL e cache negativo"""
+
+    def __init__(self, path, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL,
+                 memory_max=DEFAULT_MEMORY_MAX):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.memory_max = memory_max
+
+        self._memory = OrderedDict()  # key -> (expires_at, value), do menos para o mais recente
+        self._lock = threading.Lock()
+        self._local = threading.local()  # Uma ligação SQLite por thread (e por processo)
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = self._connection()
+        conn.execute(_SCHEMA)
+        conn.execute("DELETE FROM metadata WHERE expires_at < ?", (time.time(),))
+        conn.commit()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        # Ligações abertas no master (gunicorn --preload) não podem ser usadas após fork
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        """Valor em cache (pode ser None = miss negativo) ou MISS"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    return entry[1]
+                del self._memory[key]
+
+        try:
+            row = self._connection().execute(
+                "SELECT value, expires_at FROM metadata WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Metadata cache read failed: {e}")
+            return MISS
+
+        if row is None or row[1] <= now:
+            return MISS
+
+        value = json.loads(row[0]) if row[0] is not None else None
+        self._remember(key, row[1], value)
+        return value
+
+    def _remember(self, key, expires_at, value):
+        """Guarda no L1 e despeja as entradas menos usadas acima de memory_max"""
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_max:
+                self._memory.popitem(last=False)
+
+    def set(self, key, value):
+        """Guarda um resultado (None = miss negativo, TTL mais curto)"""
+        expires_at = time.time() + (self.ttl if value is not None else self.negative_ttl)
+        self._remember(key, expires_at, value)
+
+        try:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO metadata (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value) if value is not None else None, expires_at)
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Metadata cache write failed: {e}")
+
+    def get_or_fetch(self, key, fetch):
+        """
+        Lê da cache ou chama fetch() e guarda o resultado
+
+        Se fetch() lançar exceção (erro de rede, rate limit) nada é guardado:
+        só pesquisas sem resultados contam como miss negativo. Misses
+        simultâneos da mesma key fazem uma só chamada (single-flight).
+        """
+        value = self.get(key)
+        if value is not MISS:
+            return value
+
+        def fetch_and_store():
+            value = self.get(key)  # Outra thread pode ter acabado entretanto
+            if value is not MISS:
+                return value
+            value = fetch()
+            self.set(key, value)
+            # Só payloads da API (com id) servem lookups por URI
+            if value and value.get('uri') and value.get('id'):
+                self.set(uri_cache_key(value['uri']), value)
+            return value
+
+        return get_single_flight().do(key, fetch_and_store)
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_metadata_store(path=None):
+    """Store partilhado por processo (um por ficheiro)"""
+    if path is None:
+        from config import Config
+        path = Config.METADATA_CACHE_PATH
+
+    with _STORES_LOCK:
+        if path not in _STORES:
+            from config import Config
+            _STORES[path] = MetadataStore(
+                path,
+                ttl=Config.METADATA_TTL,
+                negative_ttl=Config.METADATA_NEGATIVE_TTL,
+                memory_max=Config.METADATA_MEMORY_MAX
+            )
+        return _STORES[path]
@@ -0,0 +1,303 @@
+# resilience.py - CLIENTE SPOTIFY RESILIENTE (RETRY-AFTER + CIRCUIT BREAKER)
+#
+# Todos os clientes spotipy da app (client credentials e OAuth do utilizador)
+# partilham o mesmo breaker por processo: o rate limit do Spotify é por app
+# (client id), por isso um 429 num pedido vale para todas as threads.
+#
+# - 429 com Retry-After: bloqueia as chamadas até esse instante. Esperas
+#   curtas (<= SPOTIFY_MAX_RETRY_WAIT) são feitas em linha; mais longas
+#   falham logo com SpotifyUnavailable.
+# - Falhas seguidas (429, 5xx, rede) >= SPOTIFY_BREAKER_THRESHOLD abrem o
+#   circuito durante SPOTIFY_BREAKER_RESET s; depois deixa passar 1 pedido de
+#   teste (half-open) que fecha ou volta a abrir o circuito.
+# - Com o circuito aberto não há pedidos: os chamadores caem logo para a cache
+#   ou para os dados de fallback, sem pagar timeouts.
+#
+# O urllib3 do spotipy deixa de repetir 429/5xx sozinho (dormia em silêncio
+# dentro do pedido); só repete erros de ligação.
+#
+# HTTP: uma requests.Session por processo (pool keep-alive com
+# SPOTIFY_POOL_SIZE ligações) partilhada por todos os clientes spotipy e
+# gestores OAuth, para não repetir o handshake TLS em cada pedido.
+#
+# SPOTIFY_API_URL aponta clientes e gestores OAuth para outra base (o
+# servidor local benchmarks/fake_spotify.py em testes e benchmarks).
+
+import os
+import time
+import logging
+import threading
+
+import requests
+import urllib3
+import spotipy
+from spotipy.exceptions import SpotifyException
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+# CONFIGURAÇÃO
+# ============================================================================
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Respostas que contam como falha do serviço (não do pedido)
+FAILURE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class SpotifyUnavailable(SpotifyException):
+    """Pedido não enviado: circuito aberto ou dentro de uma janela Retry-After"""
+
+    def __init__(self, reason, retry_in):
+        super().__init__(503, -1, f"Spotify API unavailable ({reason}), retry in {retry_in:.1f}s")
+        self.retry_in = retry_in
+
+
+# ============================================================================
+# CIRCUIT BREAKER
+# ============================================================================
+
+class CircuitBreaker:
+    """Breaker thread-safe com janela Retry-After partilhada"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, max_retry_wait=2):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_retry_wait = max_retry_wait
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._blocked_until = 0.0
+        self._trial_in_flight = False
+        self.counters = {'calls': 0, 'failures': 0, 'rate_limited': 0, 'short_circuited': 0}
+
+    def before_call(self):
+        """Espera uma janela Retry-After curta ou lança SpotifyUnavailable"""
+        with self._lock:
+            now = time.monotonic()
+
+            if self._state == OPEN:
+                remaining = self._opened_at + self.reset_timeout - now
+                if remaining > 0:
+                    self.counters['short_circuited'] += 1
+                    raise SpotifyUnavailable('circuit open', remaining)
+                self._state = HALF_OPEN
+
+            if self._state == HALF_OPEN:
+                if self._trial_in_flight:
+                    self.counters['short_circuited'] += 1
+                    raise SpotifyUnavailable('circuit half-open', self.reset_timeout)
+                self._trial_in_flight = True
+
+            wait = self._blocked_until - now
+            if wait > self.max_retry_wait:
+                self._trial_in_flight = False
+                self.counters['short_circuited'] += 1
+                raise SpotifyUnavailable('rate limited', wait)
+            self.counters['calls'] += 1
+
+        if wait > 0:
+            time.sleep(wait)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trial_in_flight = False
+            if self._state != CLOSED:
+                logger.info("🟢 Spotify circuit closed")
+            self._state = CLOSED
+
+    def record_failure(self, retry_after=None):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            self.counters['failures'] += 1
+
+            if retry_after is not None:
+                self.counters['rate_limited'] += 1
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    logger.warning(f"🔴 Spotify circuit open after {self._failures} failures")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """Pedido terminou sem dizer nada sobre o serviço (p.ex. 404)"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and time.monotonic() >= self._opened_at + self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def snapshot(self):
+        """Estado para /api/metrics"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._state
+            if state == OPEN and now >= self._opened_at + self.reset_timeout:
+                state = HALF_OPEN
+            return {
+                'state': state,
+                'consecutive_failures': self._failures,
+                'retry_after_remaining': round(max(0.0, self._blocked_until - now), 2),
+                'open_remaining': round(max(0.0, self._opened_at + self.reset_timeout - now), 2)
+                                  if self._state == OPEN else 0.0,
+                **self.counters,
+            }
+
+
+_BREAKER = {'instance': None}
+_BREAKER_LOCK = threading.Lock()
+
+
+def get_spotify_breaker():
+    """Breaker partilhado por todos os clientes Spotify deste processo"""
+    with _BREAKER_LOCK:
+        if _BREAKER['instance'] is None:
+            from config import Config
+            _BREAKER['instance'] = CircuitBreaker(
+                failure_threshold=Config.SPOTIFY_BREAKER_THRESHOLD,
+                reset_timeout=Config.SPOTIFY_BREAKER_RESET,
+                max_retry_wait=Config.SPOTIFY_MAX_RETRY_WAIT
+            )
+        return _BREAKER['instance']
+
+
+def _retry_after(exception):
+    """Segundos do header Retry-After (429), None se não houver"""
+    headers = getattr(exception, 'headers', None) or {}
+    value = headers.get('Retry-After') or headers.get('retry-after')
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+# ============================================================================
+# POOL HTTP
+# ============================================================================
+
+_SESSION = {'pid': None, 'session': None}
+_SESSION_LOCK = threading.Lock()
+
+
+class PooledSession(requests.Session):
+    """
+    Session partilhada: close() não faz nada
+
+    spotipy fecha a sessão no __del__ de cada cliente/gestor OAuth; numa
+    sessão partilhada isso deitaria fora o pool keep-alive de todos.
+    """
+
+    def close(self):
+        pass
+
+    def close_pool(self):
+        super().close()
+
+
+def build_http_session(pool_size, retries=3, backoff_factor=0.3):
+    """Session com pool de pool_size ligações; só repete erros de ligação (429/5xx sobem)"""
+    session = PooledSession()
+    retry = urllib3.Retry(
+        total=retries,
+        connect=None,
+        read=False,
+        status=0,
+        status_forcelist=(),
+        respect_retry_after_header=False,
+        backoff_factor=backoff_factor,
+        allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']))
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=4,       # hosts: api.spotify.com, accounts.spotify.com, i.scdn.co
+        pool_maxsize=pool_size,
+        max_retries=retry
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_http_session():
+    """
+    Session partilhada deste processo
+
+    Recriada após fork (pid diferente): sockets abertos no master não podem
+    ser partilhados pelos workers.
+    """
+    with _SESSION_LOCK:
+        if _SESSION['pid'] != os.getpid():
+            from config import Config
+            _SESSION['session'] = build_http_session(Config.SPOTIFY_POOL_SIZE)
+            _SESSION['pid'] = os.getpid()
+        return _SESSION['session']
+
+
+# ============================================================================
+# ENDPOINTS
+# ============================================================================
+
+def spotify_api_url():
+    """Base alternativa configurada em SPOTIFY_API_URL, ou None (Spotify real)"""
+    from config import Config
+    return Config.SPOTIFY_API_URL.rstrip('/') or None
+
+
+def use_api_endpoints(auth_manager):
+    """Aponta um SpotifyOAuth / SpotifyClientCredentials para SPOTIFY_API_URL (se definido)"""
+    base = spotify_api_url()
+    if base:
+        auth_manager.OAUTH_TOKEN_URL = f'{base}/api/token'
+        auth_manager.OAUTH_AUTHORIZE_URL = f'{base}/authorize'
+    return auth_manager
+
+
+# ============================================================================
+# CLIENTE
+# ============================================================================
+
+class ResilientSpotify(spotipy.Spotify):
+    """spotipy.Spotify com breaker partilhado e Retry-After (mesma API pública)"""
+
+    def __init__(self, *args, breaker=None, **kwargs):
+        self.breaker = breaker or get_spotify_breaker()
+        super().__init__(*args, **kwargs)
+        base = spotify_api_url()
+        if base:
+            self.prefix = f'{base}/v1/'
+
+    def _build_session(self):
+        """Pool HTTP partilhado do processo em vez de uma Session por cliente"""
+        self._session = get_http_session()
+
+    def _internal_call(self, method, url, payload, params):
+        for attempt in range(2):
+            self.breaker.before_call()
+            try:
+                result = super()._internal_call(method, url, payload, params)
+            except SpotifyException as e:
+                if e.http_status not in FAILURE_STATUSES:
+                    self.breaker.release()
+                    raise
+                retry_after = _retry_after(e) if e.http_status == 429 else None
+                self.breaker.record_failure(retry_after)
+                # Um 2º intento só se o Retry-After for curto (before_call espera-o)
+                if attempt == 0 and retry_after is not None and retry_after <= self.breaker.max_retry_wait:
+                    continue
+                raise
+            except requests.exceptions.RequestException:
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+            return result
@@ -0,0 +1,161 @@
+# responses.py - PIPELINE DE RESPOSTAS JSON (ENCODER RÁPIDO + COMPRESSÃO)
+#
+# - column_records() / series_pairs() / top_counts(): payloads construídos a
+#   partir de colunas inteiras (listas/arrays numpy) em vez de iterrows +
+#   dict por linha.
+# - FastJSONProvider: jsonify() usa orjson quando instalado (serializa
+#   tipos numpy diretamente, NaN -> null); sem ele, o encoder do Flask.
+# - compress_response(): gzip ou brotli conforme Accept-Encoding, só acima
+#   de COMPRESS_MIN_SIZE bytes (abaixo disso o cabeçalho custa mais do que
+#   poupa). Ficheiros (send_file) e respostas já codificadas passam.
+#
+# O formato JSON não muda: as chaves repetidas dos records comprimem quase
+# a zero, por isso o frontend continua a receber listas de objetos.
+
+import gzip
+import logging
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Encoder opcional: fallback para o json do Flask
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # Sem brotli, só gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+# CONFIGURAÇÃO
+# ============================================================================
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'text/html',
+    'text/css',
+    'text/javascript',
+    'application/javascript',
+}
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # Qualidade "dinâmica": ~gzip -6 em velocidade, ~15% menor
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+# ============================================================================
+# PAYLOADS
+# ============================================================================
+
+def column_records(**columns):
+    """
+    Lista de dicts a partir de colunas alinhadas
+
+    column_records(date=[...], plays=[...]) -> [{'date': ..., 'plays': ...}, ...]
+    Converte arrays numpy com tolist() (tipos Python nativos) de uma vez.
+    """
+    names = list(columns)
+    values = [col.tolist() if hasattr(col, 'tolist') else list(col) for col in columns.values()]
+    return [dict(zip(names, row)) for row in zip(*values)]
+
+
+def series_pairs(series):
+    """[(índice, valor)] de uma Series, com tipos Python nativos"""
+    return list(zip(series.index.tolist(), series.tolist()))
+
+
+def top_counts(keys, n):
+    """Contagem por valor de keys, descendente (empates pela ordem das chaves), top n"""
+    counts = keys.groupby(keys, observed=True).size()  # observed: categóricas sem zeros
+    return counts.sort_values(ascending=False, kind='stable').head(n)
+
+
+# ============================================================================
+# ENCODER
+# ============================================================================
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify com orjson (se instalado); tipos desconhecidos -> default do Flask"""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._dumps_bytes(obj).decode()
+
+    def _dumps_bytes(self, obj):
+        try:
+            return orjson.dumps(obj, default=self.default, option=ORJSON_OPTIONS)
+        except TypeError:
+            # Inteiros > 64 bits, chaves exóticas...: o encoder do Flask trata
+            return super().dumps(obj).encode()
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._dumps_bytes(obj), mimetype=self.mimetype)
+
+
+# ============================================================================
+# COMPRESSÃO
+# ============================================================================
+
+def choose_encoding(accept_encodings):
+    """'br', 'gzip' ou None conforme o Accept-Encoding do pedido"""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_body(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_response(response, accept_encodings, min_size):
+    """Comprime a resposta no sítio (after_request) quando compensa"""
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+
+    response.set_data(compress_body(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # Representação diferente do mesmo recurso: o ETag passa a fraco
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_response_pipeline(app, min_size):
+    """Encoder rápido + compressão em todas as respostas da app"""
+    app.json = FastJSONProvider(app)
+
+    @app.after_request
+    def _compress(response):
+        return compress_response(response, request.accept_encodings, min_size)
+
+    logger.info(f"JSON encoder: {'orjson' if orjson else 'stdlib'}, "
+                f"compression: {'br+gzip' if brotli else 'gzip'} >= {min_size} B")
@@ -0,0 +1,329 @@
+# shared_store.py - DATASETS PARTILHADOS ENTRE WORKERS (MEMÓRIA MAPEADA)
+#
+# Com 2 workers gunicorn cada um tinha a sua cópia do DataFrame de cada
+# utilizador, e um pedido que caía no outro worker pagava o load a frio.
+# Aqui cada dataset é escrito 1x por host num segmento em SHARED_STORE_DIR
+# (/dev/shm por defeito: RAM) e todos os workers o mapeiam só de leitura:
+#
+# - Colunas numéricas / bool / datetime: o buffer do segmento é o array do
+#   DataFrame (zero cópias, as páginas são as mesmas em todos os processos).
+# - Texto e objetos (nomes, track_key, date): pd.Categorical ordenado cujos
+#   códigos são o buffer do segmento; só as categorias (valores únicos)
+#   existem em cada worker. A ordem das categorias é a lexical, por isso
+#   sort/min/max dão o mesmo que nas colunas de texto originais.
+# - Escrita sob flock por utilizador: o 2º worker espera e mapeia o segmento
+#   que o 1º escreveu, em vez de ler o pickle outra vez.
+#
+# Contagem de referências: cada processo que mapeia um segmento cria
+# refs/<segmento>.<pid>; sai no atexit ou quando o utilizador muda de
+# versão. mtime do segmento = publicação (ordena as versões); atime =
+# último attach (renovado explicitamente em cada attach).
+# sweep() apaga segmentos de versões antigas (ou sem acesso há
+# SHARED_STORE_IDLE_TTL) sem referências vivas; quem ainda os tenha
+# mapeados não é afetado (o ficheiro só desaparece quando deixa de estar mapeado).
+
+import os
+import re
+import mmap
+import time
+import atexit
+import pickle
+import struct
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos (dev local)
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+# CONFIGURAÇÃO
+# ============================================================================
+
+SEGMENT_SUFFIX = '.seg'
+ALIGNMENT = 64
+
+# Tipos numpy guardados tal e qual (bool, int, uint, float, datetime, timedelta)
+RAW_KINDS = set('biufmM')
+
+_HEADER = struct.Struct('<Q')
+
+
+def _safe(name):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', str(name))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# ============================================================================
+# CODIFICAÇÃO
+# ============================================================================
+
+def _encode(df):
+    """(header, [buffers]) com um buffer por coluna"""
+    columns, buffers, offset = [], [], 0
+    for name in df.columns:
+        series = df[name]
+        dtype = series.dtype
+        if isinstance(dtype, np.dtype) and dtype.kind in RAW_KINDS:
+            data = np.ascontiguousarray(series.to_numpy())
+            meta = {'name': name, 'kind': 'raw', 'dtype': data.dtype.str}
+        else:
+            # Categorias ordenadas; códigos já no tipo que o Categorical usa (sem cópia no decode)
+            codes, uniques = pd.factorize(series, sort=True, use_na_sentinel=True)
+            codes_dtype = pd.Categorical.from_codes(codes[:0], uniques).codes.dtype
+            data = codes.astype(codes_dtype)
+            meta = {'name': name, 'kind': 'codes', 'dtype': data.dtype.str, 'uniques': uniques}
+
+        meta.update(offset=offset, count=len(data))
+        columns.append(meta)
+        buffers.append(data)
+        offset += -(-data.nbytes // ALIGNMENT) * ALIGNMENT
+
+    return {'columns': columns, 'rows': len(df), 'index': df.index}, buffers
+
+
+def _decode(header, mm, data_start):
+    """DataFrame sobre o segmento mapeado"""
+    data = {}
+    for meta in header['columns']:
+        if meta['kind'] == 'raw':
+            dtype = np.dtype(meta['dtype'])
+            data[meta['name']] = np.frombuffer(mm, dtype=dtype, count=meta['count'],
+                                               offset=data_start + meta['offset'])
+        else:
+            codes = np.frombuffer(mm, dtype=np.dtype(meta['dtype']), count=meta['count'],
+                                  offset=data_start + meta['offset'])
+            # Código -1 -> NaN; os códigos continuam a ser o buffer mapeado
+            data[meta['name']] = pd.Categorical.from_codes(codes, meta['uniques'], ordered=True,
+                                                           validate=False)
+
+    df = pd.DataFrame(data, copy=False)
+    df.index = header['index']
+    return df
+
+
+# ============================================================================
+# STORE
+# ============================================================================
+
+class SharedDatasetStore:
+    """Segmentos por (key, version) em root/, mapeados só de leitura"""
+
+    def __init__(self, root, idle_ttl=6 * 60 * 60):
+        self.root = root
+        self.idle_ttl = idle_ttl
+        self._attached = {}  # key -> (segment, DataFrame)
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.stats = {'attached': 0, 'published': 0, 'swept': 0}
+        for folder in ('refs', 'locks'):
+            os.makedirs(os.path.join(root, folder), exist_ok=True)
+        atexit.register(self.release_all)
+
+    # --- caminhos ---
+
+    def _segment(self, key, version):
+        return f'{_safe(key)}@{_safe(version)}{SEGMENT_SUFFIX}'
+
+    def _ref_path(self, segment, pid=None):
+        return os.path.join(self.root, 'refs', f'{segment}.{pid or os.getpid()}')
+
+    # --- escrita ---
+
+    def publish(self, key, version, df):
+        """Escreve o segmento (atómico: tmp + rename)"""
+        header, buffers = _encode(df)
+        header_bytes = pickle.dumps(header, protocol=pickle.HIGHEST_PROTOCOL)
+        data_start = -(-(_HEADER.size + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+
+        path = os.path.join(self.root, self._segment(key, version))
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(len(header_bytes)))
+            f.write(header_bytes)
+            for meta, data in zip(header['columns'], buffers):
+                f.seek(data_start + meta['offset'])
+                f.write(data.tobytes())
+        os.replace(tmp_path, path)
+        self.stats['published'] += 1
+
+    # --- leitura ---
+
+    def _adopt_after_fork(self):
+        """Worker criado por fork herda os mapeamentos do master: regista as suas refs"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            for segment, _ in self._attached.values():
+                open(self._ref_path(segment), 'a').close()
+
+    def attach(self, key, version):
+        """DataFrame partilhado de (key, version) ou None se não estiver publicado"""
+        self._adopt_after_fork()
+        segment = self._segment(key, version)
+        with self._lock:
+            current = self._attached.get(key)
+            if current and current[0] == segment:
+                return current[1]
+
+        path = os.path.join(self.root, segment)
+        try:
+            with open(path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                published_ns = os.fstat(f.fileno()).st_mtime_ns
+            os.utime(path, ns=(time.time_ns(), published_ns))  # atime = último attach
+        except (OSError, ValueError):
+            return None
+
+        (header_size,) = _HEADER.unpack_from(mm, 0)
+        header = pickle.loads(mm[_HEADER.size:_HEADER.size + header_size])
+        data_start = -(-(_HEADER.size + header_size) // ALIGNMENT) * ALIGNMENT
+        df = _decode(header, mm, data_start)
+
+        open(self._ref_path(segment), 'a').close()
+        with self._lock:
+            previous = self._attached.get(key)
+            self._attached[key] = (segment, df)
+        if previous and previous[0] != segment:
+            self._drop_ref(previous[0])
+        self.stats['attached'] += 1
+        return df
+
+    def load(self, key, version, build):
+        """
+        attach() ou, se ainda não existir, build() + publish() + attach()
+
+        Um só processo por key constrói (flock); os outros esperam e mapeiam.
+        """
+        df = self.attach(key, version)
+        if df is not None:
+            return df
+
+        with self._key_lock(key):
+            df = self.attach(key, version)
+            if df is not None:
+                return df
+            built = build()
+            if built is None or built.empty:
+                return built
+            self.publish(key, version, built)
+
+        self.sweep()
+        df = self.attach(key, version)
+        return df if df is not None else built
+
+    # --- referências / limpeza ---
+
+    def _key_lock(self, key):
+        return _FileLock(os.path.join(self.root, 'locks', f'{_safe(key)}.lock'))
+
+    def _drop_ref(self, segment):
+        try:
+            os.remove(self._ref_path(segment))
+        except OSError:
+            pass
+
+    def release(self, key):
+        """Este processo deixa de usar o dataset de key"""
+        with self._lock:
+            entry = self._attached.pop(key, None)
+        if entry:
+            self._drop_ref(entry[0])
+
+    def release_all(self):
+        for key in list(self._attached):
+            self.release(key)
+
+    def live_refs(self, segment):
+        """PIDs vivos que têm o segmento mapeado (refs de processos mortos são apagadas)"""
+        pids = []
+        prefix = f'{segment}.'
+        refs_dir = os.path.join(self.root, 'refs')
+        for name in os.listdir(refs_dir):
+            if not name.startswith(prefix):
+                continue
+            pid = int(name[len(prefix):])
+            if _pid_alive(pid):
+                pids.append(pid)
+            else:
+                self._drop_ref_path(os.path.join(refs_dir, name))
+        return pids
+
+    def _drop_ref_path(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def sweep(self):
+        """
+        Apaga segmentos sem referências vivas que já não são a versão atual ou
+        estão inativos há idle_ttl (desde o último attach/publicação, o mais recente)
+        """
+        segments = sorted(
+            (entry for entry in os.scandir(self.root) if entry.name.endswith(SEGMENT_SUFFIX)),
+            key=lambda entry: entry.stat().st_mtime, reverse=True
+        )
+        newest_by_key = set()
+        now = time.time()
+        for entry in segments:
+            key = entry.name.split('@', 1)[0]
+            superseded = key in newest_by_key
+            newest_by_key.add(key)
+            stat = entry.stat()
+            idle = now - max(stat.st_atime, stat.st_mtime) > self.idle_ttl
+            if (superseded or idle) and not self.live_refs(entry.name):
+                try:
+                    os.remove(entry.path)
+                    self.stats['swept'] += 1
+                except OSError:
+                    pass
+
+    def snapshot(self):
+        """Estado para /api/metrics"""
+        segments = [e for e in os.scandir(self.root) if e.name.endswith(SEGMENT_SUFFIX)]
+        return {
+            'root': self.root,
+            'segments': len(segments),
+            'bytes': sum(e.stat().st_size for e in segments),
+            'attached_here': len(self._attached),
+            **self.stats,
+        }
+
+
+class _FileLock:
+    """flock exclusivo (sem efeito onde não há fcntl)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
@@ -0,0 +1,392 @@
+# sketches.py - MODO APROXIMADO (STREAMING) PARA HISTÓRICOS MUITO GRANDES
+#
+# Em vez de manter o DataFrame completo em RAM por worker, uma única passagem
+# pelos ficheiros do upload alimenta estruturas de tamanho fixo:
+#
+# - Space-Saving (top-K) para tracks e artistas
+#   → cada contagem reportada sobrestima no máximo N/K (N = plays totais);
+#     qualquer item com mais de N/K plays está garantidamente na lista
+# - Count-Min Sketch (largura 2048, profundidade 4) para tracks e artistas
+#   → estimativa <= real + e/2048 * N (~0.13% de N) com prob. >= 98%;
+#     usado para apertar as contagens do Space-Saving (min dos dois)
+# - HyperLogLog (p=12, 4096 registos) para tracks/artistas/álbuns distintos
+#   → erro padrão 1.04/sqrt(4096) ~ 1.6%
+# - Contadores diários de tamanho fixo (25 anos desde 2008-01-01)
+#   → exatos
+#
+# Total: ~250 KB por utilizador, independentemente do tamanho do histórico.
+# As regras de validade de cada play são as mesmas de filter_music.
+#
+# Âmbito: histórico diário e anos disponíveis servem qualquer filtro; os
+# tops só all-time e por plays. Tops com filtro de ano/mês, outros
+# sort/metric, álbuns e repeats continuam a carregar o DataFrame completo
+# (modo exato) - o modo sketch poupa a RAM do caso comum (dashboard
+# inicial), não de todos os pedidos.
+
+import os
+import gzip
+import json
+import hashlib
+import heapq
+import logging
+from collections import Counter
+from datetime import date
+
+import numpy as np
+
+from data_processing import (
+    MIN_INTENTIONAL_PLAY_MS,
+    MIN_AUTOPLAY_DURATION_MS,
+    MIN_AUTOPLAY_PERCENTAGE,
+    AVERAGE_SONG_DURATION_MS,
+    AUTOPLAY_REASONS
+)
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+# CONFIGURAÇÃO DOS SKETCHES
+# ============================================================================
+
+TOP_K_CAPACITY = 500          # Contadores Space-Saving por tipo
+CMS_WIDTH = 2048              # Count-Min: colunas
+CMS_DEPTH = 4                 # Count-Min: linhas (funções de hash)
+HLL_PRECISION = 12            # HyperLogLog: 2^12 registos
+
+DAILY_EPOCH = date(2008, 1, 1)  # Lançamento do Spotify
+DAILY_COUNTER_DAYS = 366 * 25   # Janela fixa de dias
+
+SKETCH_FILENAME = 'listening_sketch.pkl'
+
+
+def hash64(value):
+    """Hash estável de 64 bits (igual entre processos, ao contrário de hash())"""
+    digest = hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+# ============================================================================
+# ESTRUTURAS PROBABILÍSTICAS
+# ============================================================================
+
+class CountMinSketch:
+    """Count-Min Sketch com double hashing (h1 + i*h2)"""
+
+    def __init__(self, width=CMS_WIDTH, depth=CMS_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.uint32)
+        self.total = 0
+
+    def _columns(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        h1 = hashes & np.uint64(0xFFFFFFFF)
+        h2 = hashes >> np.uint64(32)
+        rows = np.arange(self.depth, dtype=np.uint64)[:, None]
+        return ((h1[None, :] + rows * h2[None, :]) % np.uint64(self.width)).astype(np.int64)
+
+    def add_many(self, hashes, counts):
+        """Atualização em lote (um np.add.at por bloco de linhas)"""
+        if len(hashes) == 0:
+            return
+        columns = self._columns(hashes)
+        counts = np.asarray(counts, dtype=np.uint32)
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[row], counts)
+        self.total += int(counts.sum())
+
+    def estimate(self, value_hash):
+        columns = self._columns([value_hash])[:, 0]
+        return int(self.table[np.arange(self.depth), columns].min())
+
+
+class SpaceSaving:
+    """
+    Top-K Space-Saving (Metwally et al.) com atualizações ponderadas
+
+    O menor contador vem de uma min-heap com remoção preguiçosa: cada
+    atualização empurra (contagem, item) e as entradas desatualizadas são
+    descartadas quando chegam ao topo. O(log K) amortizado por play.
+    """
+
+    def __init__(self, capacity=TOP_K_CAPACITY):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+        self._heap = []  # (contagem, item); pode ter entradas antigas
+
+    def _rebuild_heap(self):
+        """Compactação: só as entradas atuais (descarta as antigas)"""
+        self._heap = [(count, item) for item, count in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def _push(self, item, count):
+        heapq.heappush(self._heap, (count, item))
+        if len(self._heap) > 4 * self.capacity:
+            self._rebuild_heap()  # Limita as entradas antigas a O(K)
+
+    def _pop_min(self):
+        while True:
+            count, item = heapq.heappop(self._heap)
+            if self.counts.get(item) == count:
+                return item, count
+
+    def add(self, item, count=1):
+        self.total += count
+
+        if item in self.counts:
+            self.counts[item] += count
+            self._push(item, self.counts[item])
+            return
+
+        if len(self.counts) < self.capacity:
+            self.counts[item] = count
+            self.errors[item] = 0
+            self._push(item, count)
+            return
+
+        # Substitui o menor contador; herda a contagem como erro máximo
+        victim, floor = self._pop_min()
+        del self.counts[victim]
+        self.errors.pop(victim)
+        self.counts[item] = floor + count
+        self.errors[item] = floor
+        self._push(item, floor + count)
+
+    def top(self, n):
+        """[(item, contagem, erro_máximo)] ordenado por contagem"""
+        ranked = sorted(self.counts.items(), key=lambda x: x[1], reverse=True)[:n]
+        return [(item, count, self.errors[item]) for item, count in ranked]
+
+
+class HyperLogLog:
+    """HyperLogLog clássico com correção para cardinalidades pequenas"""
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def add_many(self, hashes):
+        if len(hashes) == 0:
+            return
+        tail_bits = 64 - self.precision
+        tail_mask = (1 << tail_bits) - 1
+
+        index = np.fromiter((h >> tail_bits for h in hashes), dtype=np.int64, count=len(hashes))
+        rank = np.fromiter(
+            (tail_bits - (h & tail_mask).bit_length() + 1 for h in hashes),
+            dtype=np.uint8, count=len(hashes)
+        )
+        np.maximum.at(self.registers, index, rank)
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m ** 2 / np.sum(2.0 ** -self.registers.astype(np.float64))
+
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * np.log(self.m / zeros)  # Linear counting
+
+        return int(round(estimate))
+
+
+# ============================================================================
+# SKETCH POR UTILIZADOR
+# ============================================================================
+
+def is_valid_play(record):
+    """
+    Mesmas regras que filter_music, aplicadas a um único registo
+
+    - Qualidade: ms_played > 0, track/artist/uri presentes e não vazios
+    - AUTOPLAY: >= 80% da duração estimada OU >= 2.5 min
+    - INTENTIONAL / UNKNOWN: >= 60s
+    """
+    ms_played = record.get('ms_played') or 0
+    if ms_played <= 0:
+        return False
+
+    track = record.get('master_metadata_track_name')
+    artist = record.get('master_metadata_album_artist_name')
+    if not track or not artist or not record.get('spotify_track_uri'):
+        return False
+    if not str(track).strip() or not str(artist).strip():
+        return False
+
+    if record.get('reason_start') in AUTOPLAY_REASONS:
+        estimated_duration = ms_played if ms_played > AVERAGE_SONG_DURATION_MS else AVERAGE_SONG_DURATION_MS
+        return (
+            ms_played / estimated_duration >= MIN_AUTOPLAY_PERCENTAGE or
+            ms_played >= MIN_AUTOPLAY_DURATION_MS
+        )
+
+    return ms_played >= MIN_INTENTIONAL_PLAY_MS
+
+
+class ListeningSketch:
+    """Resumo aproximado e de tamanho fixo do histórico de um utilizador"""
+
+    def __init__(self):
+        self.top_tracks = SpaceSaving()
+        self.top_artists = SpaceSaving()
+        self.cms_tracks = CountMinSketch()
+        self.cms_artists = CountMinSketch()
+        self.distinct = {
+            'tracks': HyperLogLog(),
+            'artists': HyperLogLog(),
+            'albums': HyperLogLog(),
+        }
+        self.daily_plays = np.zeros(DAILY_COUNTER_DAYS, dtype=np.uint32)
+        self.total_plays = 0
+        self.total_ms_played = 0
+
+    # ------------------------------------------------------------------------
+    # Alimentação (streaming)
+    # ------------------------------------------------------------------------
+
+    def add_records(self, records):
+        """Processa um bloco de registos raw (p.ex. um ficheiro JSON)"""
+        track_counts = Counter()
+        artist_counts = Counter()
+        albums = set()
+        day_index = []
+
+        for record in records:
+            if not is_valid_play(record):
+                continue
+
+            artist = str(record['master_metadata_album_artist_name'])
+            track_key = f"{record['master_metadata_track_name']} - {artist}"
+            track_counts[track_key] += 1
+            artist_counts[artist.strip()] += 1
+
+            album = record.get('master_metadata_album_album_name')
+            if album:
+                albums.add(str(album).strip())
+
+            # ts em UTC ('2023-05-01T12:34:56Z') - mesma data que o pipeline exato
+            day = (date.fromisoformat(str(record['ts'])[:10]) - DAILY_EPOCH).days
+            if 0 <= day < DAILY_COUNTER_DAYS:
+                day_index.append(day)
+
+            self.total_ms_played += int(record['ms_played'])
+
+        # Pré-agregado por bloco: menos atualizações nas estruturas
+        for item, count in track_counts.items():
+            self.top_tracks.add(item, count)
+        for item, count in artist_counts.items():
+            self.top_artists.add(item, count)
+
+        track_hashes = [hash64(t) for t in track_counts]
+        artist_hashes = [hash64(a) for a in artist_counts]
+        self.cms_tracks.add_many(track_hashes, list(track_counts.values()))
+        self.cms_artists.add_many(artist_hashes, list(artist_counts.values()))
+
+        self.distinct['tracks'].add_many(track_hashes)
+        self.distinct['artists'].add_many(artist_hashes)
+        self.distinct['albums'].add_many([hash64(a) for a in albums])
+
+        if day_index:
+            np.add.at(self.daily_plays, np.asarray(day_index, dtype=np.int64), 1)
+        self.total_plays += sum(track_counts.values())
+
+    # ------------------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------------------
+
+    def top(self, kind, n=10):
+        """
+        Top aproximado: [(key, plays, erro_máximo)]
+
+        plays = min(Space-Saving, Count-Min) - ambos só sobrestimam
+        """
+        summary, cms = (
+            (self.top_tracks, self.cms_tracks) if kind == 'track'
+            else (self.top_artists, self.cms_artists)
+        )
+        result = []
+        for item, count, error in summary.top(n):
+            tightened = min(count, cms.estimate(hash64(item)))
+            result.append((item, tightened, min(error, tightened)))
+        return result
+
+    def distinct_counts(self):
+        return {name: hll.count() for name, hll in self.distinct.items()}
+
+    def daily_history(self, year_filter=None, month_filter=None):
+        """[(date, plays)] do primeiro ao último dia com plays (gaps = 0)"""
+        active = np.flatnonzero(self.daily_plays)
+        if len(active) == 0:
+            return []
+
+        start = DAILY_EPOCH.toordinal()
+        history = []
+        for day in range(active[0], active[-1] + 1):
+            current = date.fromordinal(start + day)
+            if year_filter and year_filter != 'all' and current.year != int(year_filter):
+                continue
+            if month_filter and month_filter != 'all' and current.month != int(month_filter):
+                continue
+            history.append((current, int(self.daily_plays[day])))
+
+        # Mesmo recorte que daily_history_optimized: do 1º ao último dia com plays
+        while history and history[0][1] == 0:
+            history.pop(0)
+        while history and history[-1][1] == 0:
+            history.pop()
+        return history
+
+    def available_years(self):
+        active = np.flatnonzero(self.daily_plays)
+        start = DAILY_EPOCH.toordinal()
+        return sorted({date.fromordinal(start + int(day)).year for day in active})
+
+    def nbytes(self):
+        """Tamanho aproximado em memória (arrays + dicionários top-K)"""
+        arrays = (
+            self.cms_tracks.table.nbytes + self.cms_artists.table.nbytes +
+            sum(hll.registers.nbytes for hll in self.distinct.values()) +
+            self.daily_plays.nbytes
+        )
+        top_k = sum(
+            len(item.encode('utf-8')) + 16
+            for summary in (self.top_tracks, self.top_artists)
+            for item in summary.counts
+        )
+        return arrays + top_k
+
+
+# ============================================================================
+# CONSTRUÇÃO A PARTIR DOS FICHEIROS DO UPLOAD
+# ============================================================================
+
+def build_sketch_from_files(user_folder):
+    """Uma passagem pelos ficheiros (um de cada vez) - nunca junta tudo em RAM"""
+    json_files = sorted(
+        f for f in os.listdir(user_folder)
+        if f.endswith('.json') or f.endswith('.json.gz')
+    )
+    if not json_files:
+        raise FileNotFoundError(f"No JSON files in {user_folder}")
+
+    sketch = ListeningSketch()
+    for json_file in json_files:
+        filepath = os.path.join(user_folder, json_file)
+        try:
+            opener = gzip.open if filepath.endswith('.gz') else open
+            with opener(filepath, 'rt', encoding='utf-8') as f:
+                records = json.load(f)
+            if isinstance(records, list):
+                sketch.add_records(records)
+        except Exception as e:
+            logger.error(f"❌ Erro ao processar {json_file} para sketch: {e}")
+            continue
+
+    logger.info(
+        f"📐 Sketch construído: {sketch.total_plays:,} plays em "
+        f"{sketch.nbytes() / 1024:.0f} KB"
+    )
+    return sketch
@@ -1,44 +1,91 @@
 
 import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
+from spotipy.oauth2 import SpotifyClientCredentials, SpotifyOauthError
+from spotipy.cache_handler import CacheFileHandler
 import base64
 import requests
 import time
 import re
+import threading
 from urllib.parse import quote
 import logging
 
+from resilience import ResilientSpotify, get_http_session, use_api_endpoints
+
 logger = logging.getLogger(__name__)
 
+# Máximo de IDs por pedido nos endpoints GET /tracks, /artists e /albums
+BATCH_SIZES = {'track': 50, 'artist': 50, 'album': 20}
+
 class SpotifyEnhancer:
-    def __init__(self, client_id=None, client_secret=None):
+    def __init__(self, client_id=None, client_secret=None, token_cache_path=None):
         """
         Para obter credenciais: https://developer.spotify.com/dashboard/applications
+
+        Sem pedidos de rede aqui: o token é pedido no 1º uso (ou pelo health
+        probe em background) e guardado em token_cache_path, partilhado por
+        todos os workers para não pedir um token novo em cada boot.
         """
         self.sp = None
         self.api_available = False
+        self.health = {'status': 'offline', 'checked_at': None, 'latency_ms': None, 'error': None}
 
         if client_id and client_secret:
-            try:
-                self.sp = spotipy.Spotify(
-                    client_credentials_manager=SpotifyClientCredentials(
-                        client_id=client_id,
-                        client_secret=client_secret
-                    )
-                )
-                # Testar conexão
-                self.sp.search('test', limit=1)
-                self.api_available = True
-                logger.info("✅ Spotify API conectada!")
-            except Exception as e:
-                logger.error(f"⚠️ Spotify API falhou: {e}")
-                self.api_available = False
+            cache_handler = CacheFileHandler(cache_path=token_cache_path) if token_cache_path else None
+            self.sp = ResilientSpotify(
+                client_credentials_manager=use_api_endpoints(SpotifyClientCredentials(
+                    client_id=client_id,
+                    client_secret=client_secret,
+                    cache_handler=cache_handler,
+                    requests_session=get_http_session()
+                ))
+            )
+            # Otimista: credenciais presentes = disponível até o probe dizer o contrário
+            self.api_available = True
+            self.health['status'] = 'pending'
         else:
             logger.info("ℹ️ Spotify API não configurada - usando modo offline")
 
-    def search_track_metadata(self, track_name, artist_name):
+    def start_health_probe(self):
+        """Verifica credenciais/token numa thread daemon (não bloqueia o boot)"""
+        if self.sp is None:
+            return None
+        thread = threading.Thread(target=self.check_health, name='spotify-health', daemon=True)
+        thread.start()
+        return thread
+
+    def check_health(self):
+        """
+        Obtém (ou reutiliza da cache) o token de client credentials
+
+        Credenciais inválidas desligam a API (modo offline); erros de rede só
+        ficam registados - o circuit breaker trata das falhas transitórias.
+        """
+        start = time.time()
+        try:
+            self.sp.client_credentials_manager.get_access_token(as_dict=False)
+            self.health.update(status='ok', error=None)
+            logger.info("✅ Spotify API conectada!")
+        except SpotifyOauthError as e:
+            self.api_available = False
+            self.health.update(status='auth_failed', error=str(e))
+            logger.error(f"⚠️ Spotify API falhou (credenciais): {e}")
+        except Exception as e:
+            self.health.update(status='unreachable', error=str(e))
+            logger.warning(f"⚠️ Spotify API inacessível no arranque: {e}")
+        self.health.update(checked_at=time.time(), latency_ms=round((time.time() - start) * 1000, 1))
+        return self.health['status']
+
+    def search_track_metadata(self, track_name, artist_name, fallback=True):
+        """
+        Metadata da 1ª track encontrada
+
+        fallback=True (por defeito): sem resultados ou com erro devolve metadata
+        de fallback. fallback=False: sem resultados -> None e erros da API
+        propagam, para o chamador só guardar em cache misses verdadeiros.
+        """
         if not self.api_available:
-            return self._create_fallback_metadata(track_name, artist_name)
+            return self._create_fallback_metadata(track_name, artist_name) if fallback else None
 
         try:
             clean_track = self._clean_search_term(track_name)
@@ -59,15 +106,84 @@ class SpotifyEnhancer:
                     'uri': track['uri']
                 }
             else:
-                return self._create_fallback_metadata(track_name, artist_name)
+                return self._create_fallback_metadata(track_name, artist_name) if fallback else None
 
         except Exception as e:
+            if not fallback:
+                raise
             logger.error(f"Erro na busca: {e}")
             return self._create_fallback_metadata(track_name, artist_name)
 
-    def search_artist_metadata(self, artist_name):
+    def entities_by_uri(self, kind, uris):
+        """
+        Metadata por URI com GET /tracks|/artists|/albums em lotes (BATCH_SIZES)
+
+        Sem pesquisa por texto: os URIs vêm do histórico (ou das tracks já
+        resolvidas), por isso não há mismatches. Devolve uma lista alinhada
+        com uris (None = indisponível). Exceções da API propagam para o
+        chamador decidir (retry/cache).
+        """
+        fetch, field, payload = {
+            'track': (self.sp.tracks, 'tracks', self.track_payload),
+            'artist': (self.sp.artists, 'artists', self.artist_payload),
+            'album': (self.sp.albums, 'albums', self.album_payload),
+        }[kind]
+        size = BATCH_SIZES[kind]
+
+        results = []
+        for start in range(0, len(uris), size):
+            response = fetch(uris[start:start + size])
+            results.extend(payload(item) if item else None for item in response[field])
+        return results
+
+    def tracks_by_uri(self, uris):
+        return self.entities_by_uri('track', uris)
+
+    @staticmethod
+    def track_payload(track):
+        """Objeto track da API -> dict usado pelos endpoints"""
+        image_url = None
+        if track['album']['images']:
+            images = track['album']['images']
+            image_url = images[1]['url'] if len(images) > 1 else images[0]['url']
+
+        return {
+            'id': track['id'],
+            'name': track['name'],
+            'artist': track['artists'][0]['name'],
+            'uri': track['uri'],
+            'spotify_url': track['external_urls']['spotify'],
+            'image_url': image_url,
+            'preview_url': track['preview_url'],
+            # Para encadear artistas/álbuns por ID sem nova pesquisa
+            'artist_uri': track['artists'][0].get('uri'),
+            'album_uri': track['album'].get('uri')
+        }
+
+    @staticmethod
+    def artist_payload(artist):
+        """Objeto artist da API -> dict usado pelos endpoints"""
+        return {
+            'id': artist['id'],
+            'uri': artist['uri'],
+            'spotify_url': artist['external_urls']['spotify'],
+            'image_url': artist['images'][0]['url'] if artist.get('images') else None
+        }
+
+    @staticmethod
+    def album_payload(album):
+        """Objeto album da API -> dict usado pelos endpoints"""
+        return {
+            'id': album['id'],
+            'uri': album['uri'],
+            'spotify_url': album['external_urls']['spotify'],
+            'image_url': album['images'][0]['url'] if album.get('images') else None
+        }
+
+    def search_artist_metadata(self, artist_name, fallback=True):
+        """Metadata do 1º artista encontrado (fallback: ver search_track_metadata)"""
         if not self.api_available:
-            return self._create_fallback_artist_metadata(artist_name)
+            return self._create_fallback_artist_metadata(artist_name) if fallback else None
 
         try:
             results = self.sp.search(q=f'artist:"{artist_name}"', type='artist', limit=1)
@@ -83,14 +199,21 @@ class SpotifyEnhancer:
                     'uri': artist['uri']
                 }
             else:
-                return self._create_fallback_artist_metadata(artist_name)
+                return self._create_fallback_artist_metadata(artist_name) if fallback else None
 
         except Exception as e:
+            if not fallback:
+                raise
             logger.error(f"Erro na busca de artista: {e}")
             return self._create_fallback_artist_metadata(artist_name)
 
-    def search_album_metadata(self, album_name, artist_name=""):
-        """Search for album metadata with VALIDATION"""
+    def search_album_metadata(self, album_name, artist_name="", fallback=True):
+        """
+        Search for album metadata with VALIDATION
+
+        Sem resultados -> None. fallback=False: erros da API propagam em vez
+        de serem tratados como "sem resultados".
+        """
         if not self.api_available or not self.sp:
             return None
         
@@ -161,6 +284,8 @@ class SpotifyEnhancer:
                         break
                         
                 except Exception as e:
+                    if not fallback:
+                        raise
                     continue
             
             if best_match:
@@ -182,6 +307,8 @@ class SpotifyEnhancer:
             return None
         
         except Exception as e:
+            if not fallback:
+                raise
             print(f"❌ Album search error: {e}")
             return None
 
@@ -0,0 +1,206 @@
+# user_clients.py - CLIENTES SPOTIFY POR UTILIZADOR (OAUTH)
+#
+# Registo em memória (por processo) de clientes prontos a usar, um por
+# ficheiro .spotify_cache. Os botões de playback deixam de ler o token do
+# disco, criar SpotifyOAuth e (às vezes) fazer refresh síncrono em cada
+# clique: o pedido custa só a chamada ao Spotify.
+#
+# - Token em memória; o ficheiro só é relido se o mtime mudar (p.ex. o
+#   callback OAuth ou outro worker escreveu um token novo) e só é escrito
+#   quando o token muda (escrita atómica).
+# - Uma thread daemon renova os tokens OAUTH_REFRESH_MARGIN s antes de
+#   expirarem, para utilizadores ativos nos últimos OAUTH_CLIENT_IDLE_TTL s.
+#   Se mesmo assim o token estiver expirado no pedido, o refresh é síncrono.
+# - Cada worker tem a sua thread, mas o refresh de um token é feito sob
+#   flock no ficheiro <cache>.lock: o 2º worker relê o token já renovado
+#   pelo 1º em vez de o renovar outra vez.
+
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+from spotipy.cache_handler import CacheFileHandler
+
+from resilience import ResilientSpotify
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos (dev local)
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Intervalo entre verificações da thread de refresh (segundos)
+REFRESH_CHECK_INTERVAL = 30
+
+
+def scope_granted(required, granted):
+    """Todos os scopes pedidos estão no token? (strings separadas por espaços)"""
+    return set((required or '').split()) <= set((granted or '').split())
+
+
+@contextmanager
+def _token_lock(cache_path):
+    """flock entre processos (workers gunicorn) para renovar um token"""
+    with open(f'{cache_path}.lock', 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class TokenFileCache(CacheFileHandler):
+    """CacheFileHandler com cópia em memória: relê só se o mtime mudar, escreve só se mudar"""
+
+    def __init__(self, cache_path):
+        super().__init__(cache_path=cache_path)
+        self._token = None
+        self._mtime = None
+
+    def get_cached_token(self):
+        try:
+            mtime = os.path.getmtime(self.cache_path)
+        except OSError:
+            self._token, self._mtime = None, None
+            return None
+
+        if mtime != self._mtime:
+            self._token = super().get_cached_token()
+            self._mtime = mtime
+        return self._token
+
+    def save_token_to_cache(self, token_info):
+        if token_info == self._token:
+            return
+        tmp_path = f'{self.cache_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(token_info, f)
+            os.replace(tmp_path, self.cache_path)
+            self._token = token_info
+            self._mtime = os.path.getmtime(self.cache_path)
+        except OSError as e:
+            logger.warning(f"Couldn't write token cache {self.cache_path}: {e}")
+
+
+class UserClient:
+    """Cliente de um utilizador; serve de auth_manager ao spotipy (get_access_token)"""
+
+    def __init__(self, oauth, refresh_margin):
+        self.oauth = oauth
+        self.refresh_margin = refresh_margin
+        self.last_used = time.time()
+        self._lock = threading.Lock()
+        self.client = ResilientSpotify(auth_manager=self)
+
+    def token_info(self):
+        """Token válido (scope incluído) ou None"""
+        token_info = self.oauth.cache_handler.get_cached_token()
+        if not token_info or not scope_granted(self.oauth.scope, token_info.get('scope')):
+            return None
+        return token_info
+
+    def expires_in(self):
+        token_info = self.token_info()
+        return token_info['expires_at'] - time.time() if token_info else None
+
+    def refresh(self):
+        """
+        Refresh com lock de thread + flock do ficheiro do token: nem a thread de
+        fundo e um pedido, nem dois workers, renovam em duplicado
+        """
+        with self._lock, _token_lock(self.oauth.cache_handler.cache_path):
+            token_info = self.token_info()  # Relido: outro worker pode já ter renovado
+            if token_info is None:
+                return None
+            if token_info['expires_at'] - time.time() > self.refresh_margin:
+                return token_info  # Outra thread/worker já renovou
+            # refresh_access_token grava via TokenFileCache (só porque mudou)
+            return self.oauth.refresh_access_token(token_info['refresh_token'])
+
+    def get_access_token(self, as_dict=False):
+        self.last_used = time.time()
+        token_info = self.token_info()
+        if token_info is None:
+            raise RuntimeError('Spotify token missing or revoked')
+        if self.oauth.is_token_expired(token_info):
+            token_info = self.refresh()
+        return token_info if as_dict else token_info['access_token']
+
+
+class UserClientRegistry:
+    """Clientes por cache_path + thread de refresh proativo"""
+
+    def __init__(self, refresh_margin=300, idle_ttl=3600):
+        self.refresh_margin = refresh_margin
+        self.idle_ttl = idle_ttl
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._refresher_pid = None
+
+    def get(self, cache_path, make_oauth):
+        """
+        Cliente pronto para cache_path ou None se não houver token válido
+
+        Args:
+            make_oauth: função(cache_handler) -> SpotifyOAuth (só chamada na 1ª vez)
+        """
+        self._ensure_refresher()
+        with self._lock:
+            user_client = self._clients.get(cache_path)
+            if user_client is None:
+                user_client = UserClient(make_oauth(TokenFileCache(cache_path)), self.refresh_margin)
+                self._clients[cache_path] = user_client
+
+        if user_client.token_info() is None:
+            return None
+        user_client.last_used = time.time()
+        return user_client.client
+
+    def discard(self, cache_path):
+        with self._lock:
+            self._clients.pop(cache_path, None)
+
+    def refresh_due(self):
+        """Renova tokens a expirar de utilizadores ativos; esquece os inativos"""
+        now = time.time()
+        with self._lock:
+            for cache_path, user_client in list(self._clients.items()):
+                if now - user_client.last_used > self.idle_ttl:
+                    del self._clients[cache_path]
+            active = list(self._clients.values())
+
+        refreshed = 0
+        for user_client in active:
+            try:
+                expires_in = user_client.expires_in()
+                if expires_in is not None and expires_in < self.refresh_margin:
+                    user_client.refresh()
+                    refreshed += 1
+            except Exception as e:
+                logger.warning(f"Proactive token refresh failed: {e}")
+        return refreshed
+
+    def _ensure_refresher(self):
+        """Thread de refresh por processo (recriada depois de fork)"""
+        if self._refresher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._refresher_pid == os.getpid():
+                return
+            self._refresher_pid = os.getpid()
+            threading.Thread(target=self._refresh_loop, name='oauth-refresh', daemon=True).start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(REFRESH_CHECK_INTERVAL)
+            self.refresh_due()
+
+    def __len__(self):
+        return len(self._clients)